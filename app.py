@@ -1,11 +1,28 @@
+import time
+
+# Start of the app import, reported at startup
+IMPORT_STARTED = time.perf_counter()
+
 import logging
 import os
+import queue
+import threading
 from datetime import datetime, timedelta, timezone
 
-import spotipy
+import click
 from dotenv import load_dotenv
 from elasticsearch import Elasticsearch
-from flask import Flask, jsonify, redirect, render_template, request, url_for
+from flask import (
+    Flask,
+    Response,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    session,
+    stream_with_context,
+    url_for,
+)
 from flask_login import (
     LoginManager,
     current_user,
@@ -13,39 +30,51 @@ from flask_login import (
     login_user,
     logout_user,
 )
-from sentence_transformers import SentenceTransformer
 from spotipy.oauth2 import SpotifyOAuth
+from sqlalchemy import event, text
 
+from src.dashboard import dashboard_cache
 from src.elastic_utils import (
     clean_and_deduplicate_results,
     create_song_query,
     process_song_results,
 )
+from src.embeddings import get_model
+from src.events import (
+    KEEPALIVE_SECONDS,
+    EventBroker,
+    SharedPoller,
+    StreamLimiter,
+    format_sse,
+)
+from src.logging_setup import init_request_logging, setup_logging, start_listener
+from src.lyrics import LyricsCache, lyrics_key
 from src.metrics import SearchMetrics
+from src.migrations import run_migrations
 from src.models import User, UserArtistStats, UserGenreStats, UserInteraction, db
+from src.query_stats import explain_queries, init_query_stats
+from src.spotify_cache import CatalogCache, CurrentlyPlayingCache, TopItemsCache
+from src.spotify_clients import SpotifyClientManager
 from src.spotipy_utils import (
     format_album_data,
     format_artist_data,
+    format_currently_playing,
     format_track_data,
     remove_duplicates,
 )
+from src.timing import init_timing, span
 from src.user_profile import UserProfileManager
-from src.utils import get_track_lyrics
+from src.utils import parse_item_text
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler(), logging.FileHandler("app.log")],
-)
+setup_logging(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 load_dotenv()
 
-# embedding model
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-
 # Elasticsearch + DB
+ES_URL = os.environ.get("ES_URL", "http://localhost:9200")
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///users.db")
 ES_LOCAL_PASSWORD = os.environ.get("ES_LOCAL_PASSWORD")
 SECRET_KEY = os.environ.get("SECRET_KEY")
 assert ES_LOCAL_PASSWORD is not None
@@ -56,6 +85,43 @@ SPOTIFY_CLIENT_ID = os.environ.get("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.environ.get("SPOTIFY_CLIENT_SECRET")
 assert SPOTIFY_CLIENT_ID is not None
 assert SPOTIFY_CLIENT_SECRET is not None
+# Another host serving the Spotify API, such as src/spotify_stub.py
+SPOTIFY_API_URL = os.environ.get("SPOTIFY_API_URL")
+
+# Load testing only (loadtest/run_load.py): /loadtest-login logs in a seeded
+# user without Spotify OAuth. Never set this on a server others can reach.
+LOADTEST_LOGIN = os.environ.get("LOADTEST_LOGIN") == "1"
+LOADTEST_SPOTIFY_ID = "loadtest-user"
+
+TOP_ITEMS_TIME_RANGES = ["short_term", "medium_term", "long_term"]
+
+# Batch metadata lookups: items per request and the time allowed to resolve them
+METADATA_BATCH_MAX_ITEMS = 50
+METADATA_DEADLINE_MS = 2500
+METADATA_MAX_DEADLINE_MS = 10000
+
+# Songs per batch lyrics lookup (one result page)
+LYRICS_BATCH_MAX_ITEMS = 20
+
+# How often the shared poller asks Spotify what each streaming user is playing
+CURRENTLY_PLAYING_POLL_SECONDS = 3
+
+# When a client may retry an event stream the worker refused
+STREAM_RETRY_AFTER_SECONDS = 60
+
+# How long /readyz waits for Elasticsearch and the database
+READINESS_TIMEOUT_SECONDS = 2
+
+# How long a SQLite write waits for another process's write to finish
+SQLITE_BUSY_TIMEOUT_MS = 15000
+
+# With several worker processes, how long a worker may serve a dashboard
+# snapshot that another worker's write made stale
+WORKER_SNAPSHOT_MAX_AGE_SECONDS = 10
+
+# Event streams a worker holds open, unless EVENT_STREAMS_PER_WORKER is set:
+# this share of its threads, leaving the rest to the other requests
+WORKER_STREAM_THREAD_SHARE = 0.5
 
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
@@ -64,20 +130,52 @@ app.secret_key = SECRET_KEY
 app.config["SPOTIFY_CLIENT_ID"] = SPOTIFY_CLIENT_ID
 app.config["SPOTIFY_CLIENT_SECRET"] = SPOTIFY_CLIENT_SECRET
 app.config["SPOTIFY_REDIRECT_URI"] = "http://127.0.0.1:5000/callback"
+app.config["SPOTIFY_API_URL"] = SPOTIFY_API_URL
 app.config["SPOTIFY_SCOPE"] = (
     "user-read-email user-read-private user-read-currently-playing user-modify-playback-state user-top-read user-read-playback-state"
 )
 
-client = Elasticsearch(
-    "http://localhost:9200",
-    basic_auth=("elastic", ES_LOCAL_PASSWORD),
-)
+
+def create_es_client() -> Elasticsearch:
+    """A client for ES_URL; raises at startup if ES_LOCAL_PASSWORD is missing."""
+    if not ES_LOCAL_PASSWORD:
+        raise RuntimeError(
+            "ES_LOCAL_PASSWORD is not set, so Elasticsearch cannot be reached"
+        )
+    return Elasticsearch(
+        ES_URL,
+        basic_auth=("elastic", ES_LOCAL_PASSWORD),
+    )
 
 
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///users.db"
+client = create_es_client()
+
+
+app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
 db.init_app(app)
 
 
+def configure_sqlite(dbapi_connection, connection_record) -> None:
+    """
+    Let readers and the single writer of a SQLite file work concurrently
+    (WAL), and make a writer wait for the lock held by another worker
+    process instead of failing with "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+if DATABASE_URL.startswith("sqlite"):
+    with app.app_context():
+        event.listen(db.engine, "connect", configure_sqlite)
+init_query_stats(app, db)
+init_request_logging(app)
+init_timing(app)
+
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = "login"
@@ -87,12 +185,142 @@ user_profile_manager = UserProfileManager()
 
 search_metrics = SearchMetrics()
 
+# Spotify clients on one keep-alive connection pool, with background token refresh
+spotify_clients = SpotifyClientManager(app)
+
+# Shared by all tabs and the event stream poller of a user
+currently_playing_cache = CurrentlyPlayingCache()
+
+# Catalog responses are not user-specific, so one cache serves every user
+spotify_catalog = CatalogCache()
+
+# Merged top tracks/artists per user
+top_items_cache = TopItemsCache()
+
+# Lyrics from the songs index or lyrics.ovh, with API answers kept in the database
+lyrics_cache = LyricsCache(client)
+
+# Metric writes are pushed to the user's open event streams
+event_broker = EventBroker()
+# Open event streams in this process; bounded per worker (see init_worker)
+event_streams = StreamLimiter()
+dashboard_cache.add_listener(
+    lambda user_id: event_broker.publish(user_id, "metrics_invalidated")
+)
+
+
+# Seconds spent importing the app and warming it up, also served by /readyz
+startup_timings = {}
+warmed_up = threading.Event()
+
+
+def warm_up() -> None:
+    """
+    Load the embedding model and run one encode, so the first search does
+    not pay for them, then check that Elasticsearch and the database answer.
+    """
+    start = time.perf_counter()
+    timings = {}
+
+    def timed(step, fn):
+        step_start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            timings[step] = round(time.perf_counter() - step_start, 3)
+
+    model = timed("load_model", get_model)
+    timed("encode", lambda: model.encode("warm up", normalize_embeddings=True))
+    for step, ping in (
+        ("ping_elasticsearch", ping_elasticsearch),
+        ("ping_database", ping_database),
+    ):
+        try:
+            timed(step, ping)
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", step, e)
+
+    timings["total"] = round(time.perf_counter() - start, 3)
+    startup_timings["warm_up"] = timings
+    warmed_up.set()
+    logger.info("Warmed up in %.2fs: %s", timings["total"], timings)
+
+
+def ping_elasticsearch() -> None:
+    if not client.options(request_timeout=READINESS_TIMEOUT_SECONDS).ping():
+        raise ConnectionError("Elasticsearch did not answer the ping")
+
+
+def ping_database() -> None:
+    with app.app_context():
+        db.session.execute(text("SELECT 1"))
+        db.session.remove()
+
+
+def init_worker(worker_count: int = 1, threads: int | None = None) -> None:
+    """
+    Open this process's own connections. The pre-forking server calls this
+    in every worker right after the fork (see gunicorn.conf.py), so workers
+    never share the Elasticsearch or database sockets of the master.
+    `threads` is the worker's thread count, which bounds its event streams.
+    """
+    global client
+    # The master's log writer thread does not survive the fork
+    start_listener()
+    client = create_es_client()
+    lyrics_cache.es = client
+    with app.app_context():
+        # Drop the pooled connections inherited from the master without closing them
+        db.engine.dispose(close=False)
+
+    if worker_count > 1:
+        # Cache invalidations and events stay in the process that wrote
+        dashboard_cache.max_age = WORKER_SNAPSHOT_MAX_AGE_SECONDS
+    if threads:
+        event_streams.limit = int(
+            os.environ.get(
+                "EVENT_STREAMS_PER_WORKER",
+                max(1, int(threads * WORKER_STREAM_THREAD_SHARE)),
+            )
+        )
+
+    # /readyz reports the worker ready once this finishes
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
 
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
 
+@app.route("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    """Readiness: the models are loaded and Elasticsearch and the database answer."""
+    checks = {"models": warmed_up.is_set()}
+    for name, ping in (
+        ("elasticsearch", ping_elasticsearch),
+        ("database", ping_database),
+    ):
+        try:
+            ping()
+            checks[name] = True
+        except Exception as e:
+            logger.warning("Readiness check %s failed: %s", name, e)
+            checks[name] = False
+
+    ready = all(checks.values())
+    return (
+        jsonify({"ready": ready, "checks": checks, "startup": startup_timings}),
+        200 if ready else 503,
+    )
+
+
 @app.route("/")
 @login_required
 def home():
@@ -108,25 +336,31 @@ def search():
     if not query:
         return jsonify({"hits": []})
 
-    session_id = search_metrics.start_search_session(current_user.id, query)
+    with span("start_search_session"):
+        session_id = search_metrics.start_search_session(current_user.id, query)
 
-    user_profile_manager.track_interaction(
-        user_id=current_user.id,
-        interaction_type="search",
-        item_text=query,
-        item_type="song",
-    )
+    with span("track_interaction"):
+        user_profile_manager.track_interaction(
+            user_id=current_user.id,
+            interaction_type="search",
+            item_text=query,
+            item_type="song",
+        )
 
-    personalized_query_vector = user_profile_manager.get_personalized_search_query(
-        current_user.id, query
-    )
+    with span("personalize_query"):
+        personalized_query_vector = user_profile_manager.get_personalized_search_query(
+            current_user.id, query
+        )
 
-    song_results = client.search(
-        index="songs", body=create_song_query(query, personalized_query_vector)
-    )
-    hits = [process_song_results(hit) for hit in song_results["hits"]["hits"]]
+    with span("es_search"):
+        song_results = client.search(
+            index="songs", body=create_song_query(query, personalized_query_vector)
+        )
+    with span("process_results"):
+        hits = [process_song_results(hit) for hit in song_results["hits"]["hits"]]
 
-    cleaned_hits = clean_and_deduplicate_results(hits)
+    with span("dedupe_results"):
+        cleaned_hits = clean_and_deduplicate_results(hits)
 
     return jsonify({"hits": cleaned_hits, "session_id": session_id})
 
@@ -146,7 +380,7 @@ def track_click():
         # If this is a like interaction, make sure we set the interaction_type to "like"
         if interaction_type == "like":
             interaction_type = "like"
-            logger.info(f"Tracking like interaction: {item_text}")
+            logger.info("Tracking like interaction: %s", item_text)
 
         updated_metrics = search_metrics.track_interaction(
             user_id=current_user.id,
@@ -157,7 +391,7 @@ def track_click():
 
         return jsonify({"status": "success", "latest_metrics": updated_metrics or {}})
     except Exception as e:
-        logger.error(f"Error tracking click: {str(e)}")
+        logger.error("Error tracking click: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -172,12 +406,13 @@ def track_play(track_id):
         duration = data.get("duration", 0)
         item_text = data.get("item_text", "")  # Get item_text from request data
         genre = data.get("genre", "")  # Get genre from request data
+        track_fields = parse_item_text(item_text)
 
         # Only try to get track info if item_text is not provided
         if not item_text:
             try:
                 sp = get_spotify_client()
-                track_info = sp.track(track_id)
+                track_info = spotify_catalog.track(sp, track_id)
                 track_name = track_info["name"]
                 artist_name = track_info["artists"][0]["name"]
                 album_name = track_info["album"]["name"]
@@ -185,14 +420,19 @@ def track_play(track_id):
                 item_text = f"{track_name} by {artist_name} from {album_name}"
                 if genre:
                     item_text += f" (Genre: {genre})"
-                app.logger.info(f"Successfully retrieved track info: {item_text}")
+                track_fields = {
+                    "song": track_name,
+                    "artist": artist_name,
+                    "album": album_name,
+                }
+                app.logger.info("Successfully retrieved track info: %s", item_text)
             except Exception as e:
-                app.logger.error(f"Error getting track info for {track_id}: {str(e)}")
+                app.logger.error("Error getting track info for %s: %s", track_id, e)
                 # If we can't get track info, use a fallback item_text
                 item_text = f"Track {track_id}"
                 if genre:
                     item_text += f" (Genre: {genre})"
-                app.logger.warning(f"Using fallback item_text: {item_text}")
+                app.logger.warning("Using fallback item_text: %s", item_text)
 
         # Track the play interaction with the search metrics service
         search_metrics.track_interaction(
@@ -201,6 +441,11 @@ def track_play(track_id):
             item_text=item_text,
             item_type="song",
             duration=duration,
+            track_id=track_id,
+            song=track_fields["song"],
+            artist=track_fields["artist"],
+            album=track_fields["album"],
+            genre=genre or None,
         )
 
         # Update genre statistics if genre is provided
@@ -226,12 +471,15 @@ def track_play(track_id):
 
             db.session.commit()
             app.logger.info(
-                f"Updated genre stats for {genre}: {genre_stats.play_count} plays, {genre_stats.total_duration}s total duration"
+                "Updated genre stats for %s: %s plays, %ss total duration",
+                genre,
+                genre_stats.play_count,
+                genre_stats.total_duration,
             )
 
         # Update artist statistics
-        if " by " in item_text:
-            artist_name = item_text.split(" by ")[1].split(" from ")[0].strip()
+        artist_name = track_fields["artist"]
+        if artist_name:
             artist_stats = UserArtistStats.query.filter_by(
                 user_id=current_user.id, artist=artist_name
             ).first()
@@ -253,12 +501,18 @@ def track_play(track_id):
 
             db.session.commit()
             app.logger.info(
-                f"Updated artist stats for {artist_name}: {artist_stats.play_count} plays, {artist_stats.total_duration}s total duration"
+                "Updated artist stats for %s: %s plays, %ss total duration",
+                artist_name,
+                artist_stats.play_count,
+                artist_stats.total_duration,
             )
 
+        # The genre and artist charts are part of the dashboard snapshot
+        dashboard_cache.invalidate(current_user.id)
+
         return jsonify({"success": True})
     except Exception as e:
-        app.logger.error(f"Error tracking play: {str(e)}")
+        app.logger.error("Error tracking play: %s", e)
         return jsonify({"success": False, "error": str(e)})
 
 
@@ -267,11 +521,11 @@ def track_play(track_id):
 def get_track_info(track_id):
     try:
         sp = get_spotify_client()
-        track_info = sp.track(track_id)
+        track_info = spotify_catalog.track(sp, track_id)
 
         # Get artist info to get genre
         artist_id = track_info["artists"][0]["id"]
-        artist_info = sp.artist(artist_id)
+        artist_info = spotify_catalog.artist(sp, artist_id)
         genre = artist_info["genres"][0] if artist_info["genres"] else None
 
         formatted_track = {
@@ -291,31 +545,14 @@ def get_track_info(track_id):
 
         return jsonify({"success": True, "track": formatted_track})
     except Exception as e:
-        app.logger.error(f"Error getting track info: {str(e)}")
+        app.logger.error("Error getting track info: %s", e)
         return jsonify({"success": False, "error": str(e)})
 
 
 # Helper function to get Spotify client
-def get_spotify_client():
-    if (
-        current_user.spotify_token_expiry
-        and current_user.spotify_token_expiry < datetime.now()
-    ):
-        # Token expired, refresh it
-        token_info = spotipy.SpotifyOAuth(
-            client_id=app.config["SPOTIFY_CLIENT_ID"],
-            client_secret=app.config["SPOTIFY_CLIENT_SECRET"],
-            redirect_uri=app.config["SPOTIFY_REDIRECT_URI"],
-            scope=app.config["SPOTIFY_SCOPE"],
-        ).refresh_access_token(current_user.spotify_refresh_token)
-
-        current_user.spotify_token = token_info["access_token"]
-        current_user.spotify_token_expiry = datetime.now() + timedelta(
-            seconds=token_info["expires_in"]
-        )
-        db.session.commit()
-
-    return spotipy.Spotify(auth=current_user.spotify_token)
+def get_spotify_client(user=None):
+    """Pooled Spotify client of the user (the logged-in user by default)."""
+    return spotify_clients.client_for(user or current_user)
 
 
 @app.route("/login")
@@ -340,7 +577,7 @@ def spotify_callback():
 
     token_info = sp_oauth.get_access_token(code)
 
-    sp = spotipy.Spotify(auth=token_info["access_token"])
+    sp = spotify_clients.client_for_token(token_info["access_token"])
     spotify_profile = sp.current_user()
     user = User.query.filter_by(spotify_id=spotify_profile["id"]).first()
     if not user:
@@ -368,6 +605,25 @@ def spotify_callback():
     return redirect(url_for("home"))
 
 
+if LOADTEST_LOGIN:
+    logger.warning("LOADTEST_LOGIN is set: /loadtest-login bypasses Spotify OAuth")
+
+    @app.route("/loadtest-login")
+    def loadtest_login():
+        """Log in as the seeded load-test user, creating it on first use."""
+        user = User.query.filter_by(spotify_id=LOADTEST_SPOTIFY_ID).first()
+        if not user:
+            user = User(spotify_id=LOADTEST_SPOTIFY_ID, display_name="Load Test")
+            db.session.add(user)
+        # Any token works against the Spotify stub
+        user.spotify_token = "loadtest-token"
+        user.spotify_refresh_token = "loadtest-refresh-token"
+        user.spotify_token_expiry = datetime.utcnow() + timedelta(days=1)
+        db.session.commit()
+        login_user(user)
+        return jsonify({"user_id": user.id})
+
+
 @app.route("/logout")
 @login_required
 def logout():
@@ -378,66 +634,140 @@ def logout():
 @app.route("/currently-playing")
 @login_required
 def currently_playing():
-    result = {
-        "track_name": None,
-        "artist_name": None,
-        "image": None,
-        "is_playing": False,
-        "progress": 0,
-        "duration": 0,
-        "track_id": None,
-    }
     try:
-        sp = spotipy.Spotify(auth=current_user.spotify_token)
-        current_track = sp.currently_playing()
+        sp = get_spotify_client()
+        with span("currently_playing"):
+            state = currently_playing_cache.get(
+                current_user.id,
+                lambda: format_currently_playing(sp.currently_playing()),
+            )
+        return jsonify(state)
+    except Exception as e:
+        logger.error("Error getting currently playing: %s", e)
+        return jsonify(format_currently_playing(None)), 401
 
-        if current_track is None:
-            return jsonify(result)
 
-        track_name = current_track.get("item", {}).get("name", "Unknown")
-        artist_name = (
-            current_track.get("item", {}).get("artists", [{}])[0].get("name", "Unknown")
+def fetch_currently_playing(user_id):
+    """Currently-playing state of a user, for the shared poller thread."""
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        if user is None or user.spotify_token is None or user.spotify_token == "":
+            return format_currently_playing(None)
+        sp = get_spotify_client(user)
+        return currently_playing_cache.get(
+            user_id, lambda: format_currently_playing(sp.currently_playing())
         )
-        image = (
-            current_track.get("item", {})
-            .get("album", {})
-            .get("images", [{}])[0]
-            .get("url", None)
+
+
+currently_playing_poller = SharedPoller(
+    event_broker,
+    "currently_playing",
+    fetch_currently_playing,
+    interval=CURRENTLY_PLAYING_POLL_SECONDS,
+)
+
+
+@app.route("/events")
+@login_required
+def events():
+    """
+    Server-sent event stream for the dashboard and the player bar.
+
+    Sends the full dashboard snapshot first and then only the changed keys
+    whenever the user's metrics are written, plus the currently-playing state
+    from the user's shared poller. When the worker already holds its limit
+    of streams, the client is refused with a 503 and polls instead.
+    """
+    user_id = current_user.id
+    if not event_streams.acquire():
+        logger.info("Refused an event stream: %s", event_streams.stats())
+        return Response(
+            "Too many open event streams",
+            status=503,
+            mimetype="text/plain",
+            headers={"Retry-After": str(STREAM_RETRY_AFTER_SECONDS)},
         )
-        is_playing = current_track.get("is_playing", False)
-        progress = current_track.get("progress_ms", 0)
-        duration = current_track.get("item", {}).get("duration_ms", 0)
-        track_id = current_track.get("item", {}).get("id", None)
-
-        result = {
-            "track_name": track_name,
-            "artist_name": artist_name,
-            "image": image,
-            "is_playing": is_playing,
-            "progress": progress,
-            "duration": duration,
-            "track_id": track_id,
+
+    def stream():
+        subscription = event_broker.subscribe(user_id)
+        latest_playing = currently_playing_poller.acquire(user_id)
+        try:
+            snapshot, _ = search_metrics.get_dashboard_snapshot(user_id)
+            db.session.close()
+            yield format_sse("metrics", snapshot)
+            if latest_playing is not None:
+                yield format_sse("currently_playing", latest_playing)
+
+            while True:
+                try:
+                    event, data = subscription.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    if dashboard_cache.max_age is None:
+                        # Every write to the metrics published an event here
+                        yield ": keep-alive\n\n"
+                        continue
+                    # Catch writes made in other worker processes, which
+                    # publish no event here (see init_worker)
+                    event, data = "metrics_invalidated", None
+
+                if event == "metrics_invalidated":
+                    # Streams of the same user share one snapshot rebuild
+                    latest, _ = search_metrics.get_dashboard_snapshot(user_id)
+                    db.session.close()
+                    delta = {
+                        key: value
+                        for key, value in latest.items()
+                        if snapshot.get(key) != value
+                    }
+                    snapshot = latest
+                    if delta:
+                        yield format_sse("metrics", delta)
+                    else:
+                        yield ": keep-alive\n\n"
+                else:
+                    yield format_sse(event, data)
+        finally:
+            event_broker.unsubscribe(user_id, subscription)
+            currently_playing_poller.release(user_id)
+
+    response = Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Also runs if the client leaves before the stream starts
+    response.call_on_close(event_streams.release)
+    return response
+
+
+@app.route("/cache-stats")
+@login_required
+def cache_stats():
+    """Hit counts of the in-process Spotify caches."""
+    return jsonify(
+        {
+            "currently_playing": currently_playing_cache.stats(),
+            "catalog": spotify_catalog.stats(),
+            "top_items": top_items_cache.stats(),
         }
-        return jsonify(result)
-    except Exception as e:
-        logger.error(f"Error getting currently playing: {str(e)}")
-        return jsonify(result), 401
+    )
 
 
 @app.route("/toggle-playback", methods=["POST"])
 @login_required
 def toggle_playback():
     try:
-        sp = spotipy.Spotify(auth=current_user.spotify_token)
+        sp = get_spotify_client()
         current_playback = sp.currently_playing()
 
         if current_playback and current_playback.get("is_playing"):
             sp.pause_playback()
         else:
             sp.start_playback()
+        currently_playing_cache.invalidate(current_user.id)
         return jsonify({"success": True})
     except Exception as e:
-        logger.error(f"Error toggling playback: {str(e)}")
+        logger.error("Error toggling playback: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -445,11 +775,12 @@ def toggle_playback():
 @login_required
 def next_track():
     try:
-        sp = spotipy.Spotify(auth=current_user.spotify_token)
+        sp = get_spotify_client()
         sp.next_track()
+        currently_playing_cache.invalidate(current_user.id)
         return jsonify({"success": True})
     except Exception as e:
-        logger.error(f"Error skipping to next track: {str(e)}")
+        logger.error("Error skipping to next track: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -457,11 +788,12 @@ def next_track():
 @login_required
 def previous_track():
     try:
-        sp = spotipy.Spotify(auth=current_user.spotify_token)
+        sp = get_spotify_client()
         sp.previous_track()
+        currently_playing_cache.invalidate(current_user.id)
         return jsonify({"success": True})
     except Exception as e:
-        logger.error(f"Error going to previous track: {str(e)}")
+        logger.error("Error going to previous track: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -476,11 +808,11 @@ def set_volume():
         volume_percent = max(
             0, min(100, volume_percent)
         )  # Ensure volume is between 0-100
-        sp = spotipy.Spotify(auth=current_user.spotify_token)
+        sp = get_spotify_client()
         sp.volume(volume_percent)
         return jsonify({"success": True})
     except Exception as e:
-        logger.error(f"Error setting volume: {str(e)}")
+        logger.error("Error setting volume: %s", e)
         return jsonify({"error": "Failed to set volume"}), 401
 
 
@@ -488,19 +820,25 @@ def set_volume():
 @login_required
 def get_top_tracks():
     try:
-        sp = spotipy.Spotify(auth=current_user.spotify_token)
-        items = []
-
-        for time_range in ["short_term", "medium_term", "long_term"]:
-            results = sp.current_user_top_tracks(limit=6, time_range=time_range)
-            items.extend(results["items"])
+        sp = get_spotify_client()
 
-        tracks = [format_track_data(track) for track in items]
-        tracks = remove_duplicates(tracks)
+        def fetch_top_tracks():
+            # One call per time range, made concurrently
+            pages = spotify_clients.map(
+                lambda time_range: sp.current_user_top_tracks(
+                    limit=6, time_range=time_range
+                ),
+                TOP_ITEMS_TIME_RANGES,
+            )
+            tracks = [
+                format_track_data(track) for page in pages for track in page["items"]
+            ]
+            return remove_duplicates(tracks)
 
+        tracks = top_items_cache.get("top_tracks", current_user.id, fetch_top_tracks)
         return jsonify({"tracks": tracks[:8]})
     except Exception as e:
-        logger.error(f"Error fetching top tracks: {str(e)}")
+        logger.error("Error fetching top tracks: %s", e)
         return jsonify({"error": "Failed to fetch top tracks"}), 401
 
 
@@ -508,18 +846,25 @@ def get_top_tracks():
 @login_required
 def get_top_artists():
     try:
-        sp = spotipy.Spotify(auth=current_user.spotify_token)
-        items = []
+        sp = get_spotify_client()
 
-        for time_range in ["short_term", "medium_term", "long_term"]:
-            results = sp.current_user_top_artists(limit=3, time_range=time_range)
-            items.extend(results["items"])
+        def fetch_top_artists():
+            # One call per time range, made concurrently
+            pages = spotify_clients.map(
+                lambda time_range: sp.current_user_top_artists(
+                    limit=3, time_range=time_range
+                ),
+                TOP_ITEMS_TIME_RANGES,
+            )
+            artists = [
+                format_artist_data(artist) for page in pages for artist in page["items"]
+            ]
+            return remove_duplicates(artists)
 
-        artists = [format_artist_data(artist) for artist in items]
-        artists = remove_duplicates(artists)
+        artists = top_items_cache.get("top_artists", current_user.id, fetch_top_artists)
         return jsonify({"artists": artists[:4]})
     except Exception as e:
-        logger.error(f"Error fetching top artists: {str(e)}")
+        logger.error("Error fetching top artists: %s", e)
         return jsonify({"error": "Failed to fetch top artists"}), 401
 
 
@@ -529,6 +874,8 @@ def create_spotify_oauth():
         client_secret=SPOTIFY_CLIENT_SECRET,
         redirect_uri="http://127.0.0.1:5000/callback",
         scope="user-read-email user-read-private user-read-currently-playing user-modify-playback-state user-top-read user-read-playback-state",
+        # spotipy infers bool from the default, but documents a Session too
+        requests_session=spotify_clients.session,  # pyright: ignore[reportArgumentType]
     )
 
 
@@ -537,18 +884,18 @@ def create_spotify_oauth():
 def get_artist_songs(artist_name):
     """Get top songs for a specific artist using Spotify API."""
     try:
-        sp = spotipy.Spotify(auth=current_user.spotify_token)
-        results = sp.search(q=artist_name, type="artist", limit=1)
+        sp = get_spotify_client()
+        results = spotify_catalog.search(sp, q=artist_name, type="artist", limit=1)
 
         if not results["artists"]["items"]:
             return jsonify({"error": "Artist not found"}), 404
 
         artist_id = results["artists"]["items"][0]["id"]
-        top_tracks = sp.artist_top_tracks(artist_id)
+        top_tracks = spotify_catalog.artist_top_tracks(sp, artist_id)
         tracks = [format_track_data(track) for track in top_tracks["tracks"][:3]]
         return jsonify({"tracks": tracks})
     except Exception as e:
-        logger.error(f"Error getting artist songs from Spotify: {str(e)}")
+        logger.error("Error getting artist songs from Spotify: %s", e)
         return jsonify({"error": "Failed to fetch artist songs"}), 500
 
 
@@ -562,7 +909,7 @@ def play_track():
         if not track_id:
             return jsonify({"error": "No track ID provided"}), 400
 
-        sp = spotipy.Spotify(auth=current_user.spotify_token)
+        sp = get_spotify_client()
 
         devices = sp.devices()
         if not devices["devices"]:
@@ -570,10 +917,11 @@ def play_track():
 
         device_id = devices["devices"][0]["id"]
         sp.start_playback(device_id=device_id, uris=[f"spotify:track:{track_id}"])
+        currently_playing_cache.invalidate(current_user.id)
         return jsonify({"success": True})
 
     except Exception as e:
-        logger.error(f"Error playing track: {str(e)}")
+        logger.error("Error playing track: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -582,12 +930,12 @@ def play_track():
 def get_spotify_track(track_id):
     """Get a specific track from Spotify by its ID."""
     try:
-        sp = spotipy.Spotify(auth=current_user.spotify_token)
-        track = sp.track(track_id)
+        sp = get_spotify_client()
+        track = spotify_catalog.track(sp, track_id)
         track_data = format_track_data(track)
         return jsonify({"track": track_data})
     except Exception as e:
-        logger.error(f"Error getting Spotify track: {str(e)}")
+        logger.error("Error getting Spotify track: %s", e)
         return jsonify({"error": "Failed to fetch Spotify track"}), 500
 
 
@@ -596,22 +944,110 @@ def get_spotify_track(track_id):
 def search_spotify_tracks(title):
     """Search for tracks on Spotify by title and return top 3 matches."""
     try:
-        sp = spotipy.Spotify(auth=current_user.spotify_token)
-        results = sp.search(q=title, type="track", limit=3)
+        sp = get_spotify_client()
+        results = spotify_catalog.search(sp, q=title, type="track", limit=3)
         tracks = [format_track_data(track) for track in results["tracks"]["items"]]
         return jsonify({"tracks": tracks})
     except Exception as e:
-        logger.error(f"Error searching Spotify tracks: {str(e)}")
+        logger.error("Error searching Spotify tracks: %s", e)
         return jsonify({"error": "Failed to search Spotify tracks"}), 500
 
 
+@app.route("/spotify-metadata", methods=["POST"])
+@login_required
+def spotify_metadata():
+    """
+    Resolve the Spotify matches of several search results in one request.
+
+    Takes {"items": [{"key": ..., "track_id": ...} or {"key": ..., "query": ...}]}
+    and looks the items up concurrently through the catalog cache. Items not
+    resolved within the deadline are listed under "pending" (their lookups
+    finish in the background and warm the cache for the next request).
+    """
+    data = request.get_json(silent=True) or {}
+    items = {
+        item["key"]: item
+        for item in data.get("items", [])[:METADATA_BATCH_MAX_ITEMS]
+        if item.get("key") and (item.get("track_id") or item.get("query"))
+    }
+    deadline = min(
+        float(data.get("deadline_ms", METADATA_DEADLINE_MS)), METADATA_MAX_DEADLINE_MS
+    )
+
+    try:
+        sp = get_spotify_client()
+    except Exception as e:
+        logger.error("Error getting Spotify client: %s", e)
+        return jsonify({"error": "Failed to connect to Spotify"}), 401
+
+    def resolve(key):
+        item = items[key]
+        if item.get("track_id"):
+            return [format_track_data(spotify_catalog.track(sp, item["track_id"]))]
+        results = spotify_catalog.search(sp, q=item["query"], type="track", limit=3)
+        return [format_track_data(track) for track in results["tracks"]["items"]]
+
+    results, errors, pending = spotify_clients.map_with_deadline(
+        resolve, list(items), timeout=deadline / 1000
+    )
+    for key, error in errors.items():
+        logger.error("Error resolving Spotify metadata for %s: %s", key, error)
+    if pending:
+        logger.info("Spotify metadata deadline hit for %s items", len(pending))
+
+    return jsonify(
+        {
+            "results": {key: {"tracks": tracks} for key, tracks in results.items()},
+            "errors": {key: "Failed to fetch Spotify track" for key in errors},
+            "pending": pending,
+        }
+    )
+
+
+@app.route("/lyrics")
+@login_required
+def lyrics():
+    """Lyrics of one song, by ?artist=...&title=... (and the song's index id if known)."""
+    artist = request.args.get("artist", "")
+    title = request.args.get("title", "")
+    if not artist or not title:
+        return jsonify({"error": "artist and title are required"}), 400
+    return jsonify(lyrics_cache.get(artist, title, request.args.get("song_id")))
+
+
+@app.route("/lyrics", methods=["POST"])
+@login_required
+def lyrics_batch():
+    """
+    Look up the lyrics of a result page in one request.
+
+    Takes {"items": [{"key": ..., "artist": ..., "title": ..., "song_id": ...}]}
+    and returns {"results": {key: {"lyrics": ..., "source": ...}}}.
+    """
+    data = request.get_json(silent=True) or {}
+    items = [
+        item
+        for item in data.get("items", [])[:LYRICS_BATCH_MAX_ITEMS]
+        if item.get("key") and item.get("artist") and item.get("title")
+    ]
+    found = lyrics_cache.get_many(items)
+    return jsonify(
+        {
+            "results": {
+                item["key"]: found[lyrics_key(item["artist"], item["title"])]
+                for item in items
+            }
+        }
+    )
+
+
 @app.route("/search-spotify-artist/<artist_name>")
 @login_required
 def search_spotify_artist(artist_name):
     """Search for an artist on Spotify and return the best match."""
     try:
-        sp = spotipy.Spotify(auth=current_user.spotify_token)
-        results = sp.search(q=artist_name, type="artist", limit=1)
+        sp = get_spotify_client()
+        results = spotify_catalog.search(sp, q=artist_name, type="artist", limit=1)
 
         if not results["artists"]["items"]:
             return jsonify({"error": "Artist not found"}), 404
@@ -620,7 +1056,7 @@ def search_spotify_artist(artist_name):
         artist_data = format_artist_data(artist)
         return jsonify({"artist": artist_data})
     except Exception as e:
-        logger.error(f"Error searching Spotify artist: {str(e)}")
+        logger.error("Error searching Spotify artist: %s", e)
         return jsonify({"error": "Failed to search Spotify artist"}), 500
 
 
@@ -629,8 +1065,8 @@ def search_spotify_artist(artist_name):
 def search_spotify_album(query):
     """Search for an album on Spotify and return the best match."""
     try:
-        sp = spotipy.Spotify(auth=current_user.spotify_token)
-        results = sp.search(q=query, type="album", limit=1)
+        sp = get_spotify_client()
+        results = spotify_catalog.search(sp, q=query, type="album", limit=1)
 
         if not results["albums"]["items"]:
             return jsonify({"error": "Album not found"}), 404
@@ -639,7 +1075,7 @@ def search_spotify_album(query):
         album_data = format_album_data(album)
         return jsonify({"album": album_data})
     except Exception as e:
-        logger.error(f"Error searching Spotify album: {str(e)}")
+        logger.error("Error searching Spotify album: %s", e)
         return jsonify({"error": "Failed to search Spotify album"}), 500
 
 
@@ -647,77 +1083,60 @@ def search_spotify_album(query):
 @login_required
 def dashboard():
     """Show the metrics dashboard."""
-    # Get user metrics
-    user_metrics = search_metrics.get_user_metrics(current_user.id)
-    metrics_over_time = search_metrics.get_all_session_metrics(current_user.id)
-    most_played_song = search_metrics.get_most_played_song(current_user.id)
-    most_liked_album = search_metrics.get_most_liked_album(current_user.id)
-    most_liked_artist = search_metrics.get_most_liked_artist(current_user.id)
+    snapshot, _ = search_metrics.get_dashboard_snapshot(current_user.id)
 
     # If it's an AJAX request, return JSON
     if request.headers.get("X-Requested-With") == "XMLHttpRequest":
-        return jsonify(
-            {
-                "total_searches": user_metrics["search_count"],
-                "total_interactions": user_metrics["interaction_count"],
-                "metrics_over_time": metrics_over_time,
-                "most_played_song": most_played_song,
-                "most_liked_album": most_liked_album,
-                "most_liked_artist": most_liked_artist,
-            }
-        )
+        return jsonify(snapshot)
 
     # Otherwise render the template
     return render_template(
         "dashboard.html",
-        total_searches=user_metrics["search_count"],
-        total_interactions=user_metrics["interaction_count"],
-        metrics_over_time=metrics_over_time,
-        most_played_song=most_played_song,
-        most_liked_album=most_liked_album,
-        most_liked_artist=most_liked_artist,
+        total_searches=snapshot["total_searches"],
+        total_interactions=snapshot["total_interactions"],
+        metrics_over_time=snapshot["metrics_over_time"],
+        most_played_song=snapshot["most_played_song"],
+        most_liked_album=snapshot["most_liked_album"],
+        most_liked_artist=snapshot["most_liked_artist"],
         current_time=datetime.now().strftime("%H:%M:%S"),
     )
 
 
-@app.route("/latest-metrics")
-@login_required
-def latest_metrics():
-    """Get the latest metrics for the dashboard."""
+def session_user_id() -> int | None:
+    """Id of the logged-in user from the signed session cookie, without a query."""
     try:
-        # Add cache busting using query timestamp
-        cache_buster = request.args.get("_", "")
-        app.logger.info(f"Fetching latest metrics with cache buster: {cache_buster}")
-
-        # Get metrics over time for chart
-        metrics_over_time = search_metrics.get_all_session_metrics(current_user.id)
-
-        # Get user metrics summary
-        user_metrics = search_metrics.get_user_metrics(current_user.id)
+        return int(session["_user_id"])
+    except (KeyError, TypeError, ValueError):
+        return None
 
-        # Fetch the most played song directly from the database to ensure freshness
-        most_played_song = search_metrics.get_most_played_song(current_user.id)
-        app.logger.info(f"Most played song data: {most_played_song}")
 
-        # Get most liked album and artist
-        most_liked_album = search_metrics.get_most_liked_album(current_user.id)
-        most_liked_artist = search_metrics.get_most_liked_artist(current_user.id)
-
-        # Force database refresh to ensure latest data
-        db.session.commit()
+@app.route("/latest-metrics")
+def latest_metrics():
+    """
+    Get the latest metrics for the dashboard.
+
+    The payload is a per-user snapshot cached until the next interaction is
+    written. It is served with an ETag, so a poll whose If-None-Match still
+    matches gets a 304 without the metrics being read again. The ETag is
+    checked before the user is loaded, so such a poll runs no SQL at all.
+    """
+    try:
+        user_id = session_user_id()
+        etag = dashboard_cache.get_etag(user_id) if user_id is not None else None
+        if etag and request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        elif not current_user.is_authenticated:
+            return login_manager.unauthorized()
+        else:
+            snapshot, etag = search_metrics.get_dashboard_snapshot(current_user.id)
+            response = jsonify(snapshot)
 
-        return jsonify(
-            {
-                "metrics_over_time": metrics_over_time,
-                "total_searches": user_metrics.get("search_count", 0),
-                "total_interactions": user_metrics.get("interaction_count", 0),
-                "most_played_song": most_played_song,
-                "most_liked_album": most_liked_album,
-                "most_liked_artist": most_liked_artist,
-            }
-        )
+        # Let clients cache the payload but always revalidate it
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
     except Exception as e:
-        app.logger.error(f"Error fetching metrics: {str(e)}")
+        app.logger.error("Error fetching metrics: %s", e)
         return jsonify({"error": "Failed to fetch metrics", "message": str(e)}), 500
 
 
@@ -741,7 +1160,7 @@ def update_precision():
             {"status": "success", "precision5": precision5, "precision10": precision10}
         )
     except Exception as e:
-        logger.error(f"Error updating precision: {str(e)}")
+        logger.error("Error updating precision: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -759,12 +1178,13 @@ def reset_app():
         UserArtistStats.query.filter_by(user_id=current_user.id).delete()
 
         db.session.commit()
+        dashboard_cache.invalidate(current_user.id)
 
         # Return success response
         return jsonify({"success": True})
     except Exception as e:
         # Log the error and return failure response
-        app.logger.error(f"Error in reset_app: {str(e)}")
+        app.logger.error("Error in reset_app: %s", e)
         return jsonify({"success": False, "error": str(e)})
 
 
@@ -772,21 +1192,11 @@ def reset_app():
 @login_required
 def get_genre_stats():
     try:
-        # Get top 5 genres by play count
-        genre_stats = (
-            UserGenreStats.query.filter_by(user_id=current_user.id)
-            .order_by(UserGenreStats.play_count.desc())
-            .limit(5)
-            .all()
-        )
-
-        # Format the data for the chart
-        labels = [stat.genre for stat in genre_stats]
-        data = [stat.play_count for stat in genre_stats]
-
-        return jsonify({"success": True, "labels": labels, "data": data})
+        # Top 5 genres by play count, from the dashboard snapshot
+        snapshot, _ = search_metrics.get_dashboard_snapshot(current_user.id)
+        return jsonify({"success": True, **snapshot["genre_stats"]})
     except Exception as e:
-        app.logger.error(f"Error getting genre stats: {str(e)}")
+        app.logger.error("Error getting genre stats: %s", e)
         return jsonify({"success": False, "error": str(e)})
 
 
@@ -794,26 +1204,70 @@ def get_genre_stats():
 @login_required
 def get_artist_stats():
     try:
-        # Get top 10 artists by play count
-        artist_stats = (
-            UserArtistStats.query.filter_by(user_id=current_user.id)
-            .order_by(UserArtistStats.play_count.desc())
-            .limit(10)
-            .all()
+        # Top 10 artists by play count, from the dashboard snapshot
+        snapshot, _ = search_metrics.get_dashboard_snapshot(current_user.id)
+        return jsonify({"success": True, **snapshot["artist_stats"]})
+    except Exception as e:
+        app.logger.error("Error getting artist stats: %s", e)
+        return jsonify({"success": False, "error": str(e)})
+
+
+@app.cli.command("migrate")
+def migrate_command():
+    """Create missing tables and bring an existing database schema up to date."""
+    db.create_all()
+    applied = run_migrations(db)
+    print(f"Applied migrations: {applied}" if applied else "Database is up to date.")
+
+
+@app.cli.command("backfill-song-stats")
+def backfill_song_stats_command():
+    """Rebuild the per-song play totals from the play history."""
+    song_count = search_metrics.backfill_song_stats()
+    print(f"Rebuilt play totals for {song_count} songs.")
+
+
+@app.cli.command("backfill-like-stats")
+def backfill_like_stats_command():
+    """Rebuild the album and artist like counters from the like history."""
+    artist_count = search_metrics.backfill_like_stats()
+    print(f"Rebuilt like counts for {artist_count} artists.")
+
+
+@app.cli.command("explain-queries")
+@click.option("--user-id", type=int, default=None, help="Defaults to the first user.")
+def explain_queries_command(user_id):
+    """Print the SQLite query plans of the hot per-user queries."""
+    if user_id is None:
+        user = User.query.first()
+        if not user:
+            print("No users in the database.")
+            return
+        user_id = user.id
+
+    def run_hot_queries():
+        search_metrics.get_session_metrics(user_id)
+        search_metrics.get_all_session_metrics(user_id)
+        search_metrics.get_user_metrics(user_id)
+        user_profile_manager.get_recent_interactions(
+            user_id, datetime.now() - timedelta(days=30)
         )
 
-        # Format the data for the chart
-        labels = [stat.artist for stat in artist_stats]
-        data = [stat.play_count for stat in artist_stats]
+    for statement, plan in explain_queries(db, run_hot_queries):
+        print(" ".join(statement.split()))
+        for line in plan:
+            print(f"  {line}")
+        print()
 
-        return jsonify({"success": True, "labels": labels, "data": data})
-    except Exception as e:
-        app.logger.error(f"Error getting artist stats: {str(e)}")
-        return jsonify({"success": False, "error": str(e)})
+
+startup_timings["import"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+logger.info("Imported the app in %.2fs", startup_timings["import"])
 
 
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
+        run_migrations(db)
 
+    warm_up()
     app.run(debug=True)
@@ -0,0 +1,51 @@
+"""
+Gunicorn settings for serving the app in production:
+
+    uv run gunicorn -c gunicorn.conf.py wsgi:app
+
+The master imports the app, and with it torch and the embedding models,
+once before forking, so the workers share those memory pages copy-on-write
+instead of each loading its own copy. Every worker then opens its own
+database and Elasticsearch connections (`post_fork`).
+"""
+
+import multiprocessing
+import os
+import tempfile
+
+# Tokenizers disable their thread pool in forked processes, with a warning
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+# Every worker writes its metrics to this directory, so /metrics reports the
+# histograms of all workers whichever one answers. Set before the app (and
+# prometheus_client with it) is imported.
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+
+bind = os.environ.get("BIND", "127.0.0.1:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", min(4, multiprocessing.cpu_count())))
+# Threaded workers: every open /events stream holds a thread for as long as
+# the tab stays open, so a worker keeps at most half of its threads for
+# streams (EVENT_STREAMS_PER_WORKER) and further tabs poll instead
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+accesslog = os.environ.get("ACCESS_LOG")
+
+
+def post_fork(server, worker):
+    import torch
+
+    from app import init_worker
+
+    # Split the cores between the workers rather than oversubscribing them
+    torch.set_num_threads(max(1, multiprocessing.cpu_count() // server.cfg.workers))
+    init_worker(server.cfg.workers, server.cfg.threads)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
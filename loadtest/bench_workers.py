@@ -0,0 +1,252 @@
+"""
+Measure throughput and per-worker memory of the production server at
+several worker counts.
+
+For every worker count, starts gunicorn (gunicorn.conf.py) on a free port,
+sends requests to `--path` from `--concurrency` client threads for
+`--duration` seconds, then reads the memory of every worker from /proc:
+RSS, PSS (shared pages split between the processes sharing them) and
+private memory. Run it from the repository root, with Elasticsearch up:
+
+    uv run loadtest/bench_workers.py --workers 1 4 8 --cookie "session=..."
+
+Most routes need a logged-in user; copy the `session` cookie from a browser
+logged into the app. With `--stand-ins`, the app runs against the fake
+Elasticsearch index and the Spotify API stub instead, on a fresh database
+per worker count, logged in as the load-test user (see run_load.py):
+
+    uv run loadtest/bench_workers.py --workers 1 2 4 --stand-ins
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(
+    workers: int, port: int, threads: int, env: dict | None = None
+) -> subprocess.Popen:
+    env = dict(
+        env or os.environ, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads)
+    )
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            "gunicorn.conf.py",
+            "--bind",
+            f"127.0.0.1:{port}",
+            "wsgi:app",
+        ],
+        env=env,
+    )
+
+
+def wait_until_serving(url: str, server: subprocess.Popen, timeout: float) -> float:
+    """Seconds until the server answered, including loading the models."""
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            requests.get(url, timeout=1, allow_redirects=False)
+            return time.monotonic() - start
+        except requests.exceptions.RequestException:
+            time.sleep(0.5)
+    raise RuntimeError(f"Server did not answer within {timeout}s")
+
+
+def child_pids(pid: int) -> list[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def memory_mb(pid: int) -> dict:
+    """RSS, PSS and private memory of a process, in MB (Linux only)."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": round(fields.get("Rss", 0), 1),
+        "pss": round(fields.get("Pss", 0), 1),
+        "private": round(
+            fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0), 1
+        ),
+    }
+
+
+def run_load(url: str, cookie: str | None, concurrency: int, duration: float) -> dict:
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        if cookie:
+            session.headers["Cookie"] = cookie
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                response = session.get(url, timeout=30, allow_redirects=False)
+                failed = response.status_code >= 300
+            except requests.exceptions.RequestException:
+                failed = True
+            elapsed = time.perf_counter() - start
+            with lock:
+                (errors if failed else latencies).append(elapsed)
+
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.monotonic()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    quantiles = (
+        statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0] * 99
+    )
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(quantiles[49] * 1000, 1),
+        "p95_ms": round(quantiles[94] * 1000, 1),
+    }
+
+
+def log_in_as_load_test_user(base_url: str) -> str:
+    response = requests.get(f"{base_url}/loadtest-login", timeout=10)
+    response.raise_for_status()
+    return "; ".join(f"{name}={value}" for name, value in response.cookies.items())
+
+
+@contextmanager
+def stand_ins(enabled: bool):
+    """
+    Start the fake Elasticsearch index and the Spotify API stub if `enabled`,
+    and yield a function returning the app's environment for one run (a
+    fresh database each time), or None when the real services are used.
+    """
+    if not enabled:
+        yield lambda: None
+        return
+
+    from run_load import stand_in_env, start_process, wait_for_port
+
+    es_port, spotify_port = free_port(), free_port()
+    processes = [
+        start_process(["loadtest/fake_es.py", "--port", str(es_port)]),
+        start_process(
+            ["src/spotify_stub.py", "--port", str(spotify_port), "--miss-rate", "0"]
+        ),
+    ]
+    try:
+        wait_for_port(es_port, processes[0])
+        wait_for_port(spotify_port, processes[1])
+        yield lambda: stand_in_env(
+            es_port, spotify_port, tempfile.mkdtemp(prefix="bench-")
+        )
+    finally:
+        for process in processes:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=60)
+
+
+def bench(workers: int, args, env: dict | None = None) -> dict:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    url = f"{base_url}{args.path}"
+    server = start_server(workers, port, args.threads, env)
+    try:
+        startup = wait_until_serving(url, server, args.startup_timeout)
+        cookie = log_in_as_load_test_user(base_url) if env else args.cookie
+        # Warm every worker up before measuring
+        run_load(url, cookie, args.concurrency, min(5, args.duration))
+        result = run_load(url, cookie, args.concurrency, args.duration)
+
+        worker_memory = [memory_mb(pid) for pid in child_pids(server.pid)]
+        result.update(
+            {
+                "workers": workers,
+                "startup_seconds": round(startup, 1),
+                "master": memory_mb(server.pid),
+                "worker_mean": {
+                    key: round(statistics.mean(m[key] for m in worker_memory), 1)
+                    for key in ("rss", "pss", "private")
+                },
+                "total_pss": round(
+                    memory_mb(server.pid)["pss"] + sum(m["pss"] for m in worker_memory),
+                    1,
+                ),
+            }
+        )
+        return result
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the gunicorn server at several worker counts"
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument(
+        "--threads", type=int, default=8, help="Threads per worker (gthread)"
+    )
+    parser.add_argument("--path", default="/search?q=love", help="Route to request")
+    parser.add_argument("--cookie", help='Cookie header, e.g. "session=..."')
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per run")
+    parser.add_argument("--startup-timeout", type=float, default=180)
+    parser.add_argument(
+        "--stand-ins",
+        action="store_true",
+        help="Run against local Elasticsearch and Spotify stand-ins (no cookie needed)",
+    )
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    with stand_ins(args.stand_ins) as make_env:
+        for workers in args.workers:
+            print(f"Benchmarking {workers} worker(s)...")
+            results.append(bench(workers, args, make_env()))
+
+    print(
+        f"\n{'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} "
+        f"{'RSS/worker':>11} {'PSS/worker':>11} {'private/worker':>15} {'total PSS':>10}"
+    )
+    for r in results:
+        print(
+            f"{r['workers']:>7} {r['throughput']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+            f"{r['errors']:>7} {r['worker_mean']['rss']:>9} MB {r['worker_mean']['pss']:>8} MB "
+            f"{r['worker_mean']['private']:>12} MB {r['total_pss']:>7} MB"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
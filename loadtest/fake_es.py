@@ -0,0 +1,234 @@
+"""
+A local stand-in for the Elasticsearch `songs` index, for load testing the
+app without a cluster.
+
+Answers the ping and cluster info requests, `POST /songs/_search` with a
+page of hits and `GET /songs/_doc/<id>`. The hits come from a generated
+corpus of songs shaped like the indexed WASABI documents (title, artist,
+album, genre, lyrics and, unless `--no-vectors`, the two 384-dimension
+embeddings the real index returns in `_source`), picked deterministically
+from the query. Every response waits `--latency-ms` (plus up to
+`--jitter-ms`) to stand in for the search itself.
+
+    uv run loadtest/fake_es.py --port 9201 --latency-ms 30
+
+then start the app with ES_URL=http://127.0.0.1:9201.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+INDEX = "songs"
+DIMS = 384
+PAGE_SIZE = 100
+
+WORDS = (
+    "love night heart fire dream rain summer blue road home light dance girl "
+    "baby world time river gold wild sky star moon city angel shadow ghost "
+    "hold run fall forever tonight yesterday alone together young free"
+).split()
+ARTISTS = [
+    "The Midnight Owls",
+    "Clara Stone",
+    "Neon Harbor",
+    "Los Caminos",
+    "Velvet Static",
+    "Jonah Reyes",
+    "The Paper Kites Club",
+    "Ada Bloom",
+    "Northern Lines",
+    "Mira & the Tides",
+]
+GENRES = ["Rock", "Pop", "Soul", "Indie Rock", "Folk", "Electronic", "Hip Hop"]
+
+
+def unit_vector(rng: random.Random) -> list[float]:
+    vector = [rng.gauss(0, 1) for _ in range(DIMS)]
+    norm = sum(value * value for value in vector) ** 0.5
+    return [round(value / norm, 6) for value in vector]
+
+
+def make_song(index: int, vectors: bool) -> dict:
+    rng = random.Random(index)
+    artist = rng.choice(ARTISTS)
+    title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title()
+    album = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))).title()
+    verse = " ".join(rng.choice(WORDS) for _ in range(rng.randint(80, 300)))
+    track_id = hashlib.sha1(f"{title}|{artist}".encode()).hexdigest()[:22]
+    song = {
+        "title": title,
+        "name": artist,
+        "artist": artist,
+        "albumTitle": album,
+        "album_genre": rng.choice(GENRES),
+        "language": "en",
+        "lyrics": verse.capitalize(),
+        "summary": "",
+        "preview": None,
+        "spotify_track_id": track_id,
+    }
+    if vectors:
+        song["title_embedding"] = unit_vector(rng)
+        song["lyrics_embedding"] = unit_vector(rng)
+    return song
+
+
+class FakeElasticsearch(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        songs: int = 5000,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        vectors: bool = True,
+    ):
+        super().__init__(address, FakeElasticsearchHandler)
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        # Serialized once: building a page should cost the harness nothing
+        self.ids = [f"song{i:07d}" for i in range(songs)]
+        self.sources = {
+            doc_id: json.dumps(make_song(i, vectors))
+            for i, doc_id in enumerate(self.ids)
+        }
+        self.search_count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def wait(self) -> None:
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def search_body(self, query: str, size: int) -> bytes:
+        """A page of hits, the same for the same query."""
+        with self._lock:
+            self.search_count += 1
+        rng = random.Random(query)
+        ids = rng.sample(self.ids, min(size, len(self.ids)))
+        hits = ",".join(
+            f'{{"_index":"{INDEX}","_id":"{doc_id}","_score":{1 / (rank + 60):.6f},'
+            f'"_source":{self.sources[doc_id]}}}'
+            for rank, doc_id in enumerate(ids)
+        )
+        took = int((self.latency + self.jitter / 2) * 1000)
+        return (
+            f'{{"took":{took},"timed_out":false,'
+            f'"_shards":{{"total":1,"successful":1,"skipped":0,"failed":0}},'
+            f'"hits":{{"total":{{"value":{len(ids)},"relation":"eq"}},'
+            f'"max_score":null,"hits":[{hits}]}}}}'
+        ).encode()
+
+
+class FakeElasticsearchHandler(BaseHTTPRequestHandler):
+    server: FakeElasticsearch
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status: int, payload: bytes):
+        self.send_response(status)
+        # The Python client refuses responses without it
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(payload)
+
+    def send_json(self, status: int, body: dict):
+        self.send_body(status, json.dumps(body).encode())
+
+    def read_body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_HEAD(self):
+        self.send_body(200, b"")
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/":
+            self.send_json(
+                200,
+                {
+                    "name": "fake-es",
+                    "cluster_name": "loadtest",
+                    "version": {"number": "8.17.2"},
+                    "tagline": "You Know, for Search",
+                },
+            )
+        elif path.startswith(f"/{INDEX}/_doc/"):
+            self.server.wait()
+            doc_id = path.rsplit("/", 1)[-1]
+            source = self.server.sources.get(doc_id)
+            if source is None:
+                self.send_json(404, {"_index": INDEX, "_id": doc_id, "found": False})
+                return
+            self.send_body(
+                200,
+                f'{{"_index":"{INDEX}","_id":"{doc_id}","found":true,'
+                f'"_source":{source}}}'.encode(),
+            )
+        elif path == f"/{INDEX}/_search":
+            self.do_POST()
+        else:
+            self.send_json(404, {"error": "not found", "status": 404})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self.read_body()
+        if path != f"/{INDEX}/_search":
+            self.send_json(404, {"error": "not found", "status": 404})
+            return
+        self.server.wait()
+        # The app's knn search carries the query vector, not the text
+        query = json.dumps(body.get("knn") or body.get("query"), sort_keys=True)
+        self.send_body(200, self.server.search_body(query, body.get("size", PAGE_SIZE)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve a fake Elasticsearch songs index"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9201)
+    parser.add_argument("--songs", type=int, default=5000, help="Corpus size")
+    parser.add_argument(
+        "--latency-ms", type=float, default=30, help="Delay of every search"
+    )
+    parser.add_argument(
+        "--jitter-ms", type=float, default=20, help="Random extra delay, up to this"
+    )
+    parser.add_argument(
+        "--no-vectors",
+        action="store_true",
+        help="Leave the embeddings out of _source (smaller responses)",
+    )
+    args = parser.parse_args()
+
+    server = FakeElasticsearch(
+        (args.host, args.port),
+        songs=args.songs,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        vectors=not args.no_vectors,
+    )
+    print(f"Fake Elasticsearch listening on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Served {server.search_count} searches.")
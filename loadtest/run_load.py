@@ -0,0 +1,414 @@
+"""
+End-to-end load test of the app against local stand-ins for its services.
+
+Starts the fake Elasticsearch index (loadtest/fake_es.py), the Spotify API
+stub (src/spotify_stub.py) and the app under gunicorn on a fresh SQLite
+database, logs in as a seeded user through `/loadtest-login` (enabled by
+LOADTEST_LOGIN, no Spotify OAuth), then replays a mix of the routes a
+browser session calls, at `--rate` requests per second:
+
+    uv run loadtest/run_load.py --rate 20 --duration 60 --save-baseline baseline.json
+    uv run loadtest/run_load.py --rate 20 --duration 60 --baseline baseline.json
+
+and reports the rate of successful requests and their p50/p95/p99 latency
+for every route, compared with a saved baseline if one is given. Requests are sent on a
+fixed schedule and their latency counts from the time they were due, so a
+server that falls behind shows up as growing latency rather than as a
+lower request rate. Run it from the repository root; the app loads the
+real embedding model.
+"""
+
+import argparse
+import json
+import os
+import random
+import secrets
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from bench_workers import free_port, start_server
+from fake_es import make_song
+
+# Relative weights of the routes in the replayed traffic
+DEFAULT_MIX = {
+    "search": 30,
+    "track-click": 15,
+    "track-play": 10,
+    "currently-playing": 25,
+    "latest-metrics": 20,
+}
+QUERY_WORDS = ["love", "night", "heart", "summer rain", "dance", "home", "wild"]
+
+
+def parse_mix(value: str) -> dict:
+    """Parse "search=30,track-play=10" into {"search": 30.0, "track-play": 10.0}."""
+    mix = {}
+    for part in value.split(","):
+        route, _, weight = part.partition("=")
+        if route not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown route {route!r}")
+        mix[route] = float(weight)
+    return mix
+
+
+def start_process(command: list[str], env: dict | None = None) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, *command],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with code {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def wait_until_ready(url: str, server: subprocess.Popen, timeout: float) -> float:
+    """Seconds until /readyz answered 200 (models loaded, stand-ins reachable)."""
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            if requests.get(f"{url}/readyz", timeout=2).status_code == 200:
+                return time.monotonic() - start
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server was not ready within {timeout}s")
+
+
+class Workload:
+    """Builds the requests of each route, like the pages' scripts send them."""
+
+    def __init__(self, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        # Songs the fake index returns, so clicks and plays name real results
+        self.songs = [make_song(i, vectors=False) for i in range(200)]
+
+    def song(self) -> dict:
+        with self.lock:
+            return self.rng.choice(self.songs)
+
+    def request(self, route: str, etag: str | None) -> tuple[str, str, dict]:
+        """(method, path, requests keyword arguments) of one call of `route`."""
+        if route == "search":
+            with self.lock:
+                query = self.rng.choice(QUERY_WORDS)
+            return "GET", "/search", {"params": {"q": query}}
+        if route == "track-click":
+            song = self.song()
+            body = {
+                "item_text": f"{song['title']} by {song['artist']}",
+                "item_type": "song",
+                "interaction_type": "click",
+            }
+            return "POST", "/track-click", {"json": body}
+        if route == "track-play":
+            song = self.song()
+            with self.lock:
+                duration = self.rng.randint(15, 240)
+            item_text = f"{song['title']} by {song['artist']} from {song['albumTitle']}"
+            return (
+                "POST",
+                f"/track-play/{song['spotify_track_id']}",
+                {
+                    "json": {
+                        "duration": duration,
+                        "item_text": item_text,
+                        "genre": song["album_genre"],
+                    }
+                },
+            )
+        if route == "currently-playing":
+            return "GET", "/currently-playing", {}
+        # The dashboard polls with the ETag of the snapshot it already has
+        headers = {"If-None-Match": etag} if etag else {}
+        return "GET", "/latest-metrics", {"headers": headers}
+
+
+def is_error(route: str, response: requests.Response) -> bool:
+    if response.status_code >= 400:
+        return True
+    # /track-play reports failures in the body of a 200
+    return route == "track-play" and not response.json().get("success")
+
+
+def run_load(
+    url, cookies, mix, rate, duration, concurrency, workload
+) -> tuple[dict, float]:
+    """
+    Send requests at `rate` per second for `duration` seconds from
+    `concurrency` threads. Returns {route: (latencies, error latencies)}
+    and the seconds the run took.
+    """
+    routes, weights = zip(*mix.items())
+    rng = random.Random(1)
+    count = int(rate * duration)
+    start = time.monotonic() + 0.5
+    schedule = [
+        (start + i / rate, rng.choices(routes, weights)[0]) for i in range(count)
+    ]
+    results = defaultdict(lambda: ([], []))
+    lock = threading.Lock()
+    next_index = iter(range(count))
+
+    def client():
+        session = requests.Session()
+        session.cookies.update(cookies)
+        etag = None
+        while True:
+            with lock:
+                index = next(next_index, None)
+            if index is None:
+                return
+            due, route = schedule[index]
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            method, path, kwargs = workload.request(route, etag)
+            try:
+                response = session.request(
+                    method, url + path, timeout=30, allow_redirects=False, **kwargs
+                )
+                failed = is_error(route, response)
+                if route == "latest-metrics":
+                    etag = response.headers.get("ETag") or etag
+            except (requests.exceptions.RequestException, ValueError):
+                failed = True
+            # From when the request was due, so queueing in the client counts
+            elapsed = time.monotonic() - due
+            with lock:
+                latencies, errors = results[route]
+                (errors if failed else latencies).append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return dict(results), time.monotonic() - start
+
+
+def percentile_ms(latencies: list, percent: int) -> float | None:
+    """The `percent`th percentile of `latencies` in ms; None with fewer than two."""
+    if len(latencies) < 2:
+        return None
+    return round(statistics.quantiles(latencies, n=100)[percent - 1] * 1000, 1)
+
+
+def summarize(results: dict, elapsed: float) -> dict:
+    """Per route, the successful requests per second and their latency percentiles."""
+    summary = {}
+    for route, (latencies, errors) in sorted(results.items()):
+        summary[route] = {
+            "requests": len(latencies) + len(errors),
+            "errors": len(errors),
+            "ok_throughput": round(len(latencies) / elapsed, 2),
+            "p50_ms": percentile_ms(latencies, 50),
+            "p95_ms": percentile_ms(latencies, 95),
+            "p99_ms": percentile_ms(latencies, 99),
+        }
+    return summary
+
+
+def change(value: float | None, baseline: float | None) -> str:
+    if value is None or not baseline:
+        return ""
+    return f"({(value - baseline) / baseline * 100:+.0f}%)"
+
+
+def print_report(summary: dict, baseline: dict | None = None) -> None:
+    print(
+        f"\n{'route':<18} {'requests':>8} {'errors':>7} {'ok req/s':>8} "
+        f"{'p50 ms':>15} {'p95 ms':>15} {'p99 ms':>15}"
+    )
+    for route, r in summary.items():
+        base = (baseline or {}).get(route, {})
+        cells = [
+            f"{'n/a' if r[key] is None else r[key]:>7} "
+            f"{change(r[key], base.get(key)):>7}"
+            for key in ("p50_ms", "p95_ms", "p99_ms")
+        ]
+        print(
+            f"{route:<18} {r['requests']:>8} {r['errors']:>7} {r['ok_throughput']:>8} "
+            + " ".join(cells)
+        )
+    if baseline:
+        print("(changes are relative to the baseline; lower is better)")
+
+
+def stand_in_env(es_port: int, spotify_port: int, data_dir: str) -> dict:
+    env = dict(os.environ)
+    # Placeholders for the settings the app requires; the stand-ins ignore them
+    for name in (
+        "ES_LOCAL_PASSWORD",
+        "SPOTIFY_CLIENT_ID",
+        "SPOTIFY_CLIENT_SECRET",
+    ):
+        env.setdefault(name, "loadtest")
+    env.update(
+        SECRET_KEY=secrets.token_hex(16),
+        ES_URL=f"http://127.0.0.1:{es_port}",
+        SPOTIFY_API_URL=f"http://127.0.0.1:{spotify_port}",
+        # A fresh database, so every run starts from the same state
+        DATABASE_URL=f"sqlite:///{os.path.join(data_dir, 'loadtest.db')}",
+        LOADTEST_LOGIN="1",
+    )
+    return env
+
+
+def main(args) -> dict:
+    processes = []
+    data_dir = tempfile.mkdtemp(prefix="loadtest-")
+    try:
+        es_port, spotify_port, app_port = free_port(), free_port(), free_port()
+        processes.append(
+            start_process(
+                [
+                    "loadtest/fake_es.py",
+                    "--port",
+                    str(es_port),
+                    "--latency-ms",
+                    str(args.es_latency_ms),
+                    "--jitter-ms",
+                    str(args.es_jitter_ms),
+                ]
+            )
+        )
+        processes.append(
+            start_process(
+                [
+                    "src/spotify_stub.py",
+                    "--port",
+                    str(spotify_port),
+                    "--miss-rate",
+                    "0",
+                    "--latency-ms",
+                    str(args.spotify_latency_ms),
+                ]
+            )
+        )
+        wait_for_port(es_port, processes[0])
+        wait_for_port(spotify_port, processes[1])
+
+        env = stand_in_env(es_port, spotify_port, data_dir)
+        server = start_server(args.workers, app_port, args.threads, env)
+        processes.append(server)
+        url = f"http://127.0.0.1:{app_port}"
+        startup = wait_until_ready(url, server, args.startup_timeout)
+        print(f"App ready in {startup:.1f}s")
+
+        login = requests.get(f"{url}/loadtest-login", timeout=10)
+        login.raise_for_status()
+        workload = Workload()
+
+        if args.warmup:
+            print(f"Warming up for {args.warmup}s...")
+            run_load(
+                url,
+                login.cookies,
+                args.mix,
+                args.rate,
+                args.warmup,
+                args.concurrency,
+                workload,
+            )
+        print(f"Sending {args.rate} req/s for {args.duration}s...")
+        results, elapsed = run_load(
+            url,
+            login.cookies,
+            args.mix,
+            args.rate,
+            args.duration,
+            args.concurrency,
+            workload,
+        )
+        return summarize(results, elapsed)
+    finally:
+        for process in reversed(processes):
+            process.send_signal(signal.SIGTERM)
+        for process in processes:
+            process.wait(timeout=60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load test the app against local Elasticsearch and Spotify stand-ins"
+    )
+    parser.add_argument("--rate", type=float, default=20, help="Requests per second")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds measured")
+    parser.add_argument(
+        "--warmup", type=float, default=10, help="Seconds of unmeasured load first"
+    )
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help="Route weights, e.g. search=30,track-play=10 (default: "
+        + ",".join(f"{route}={weight}" for route, weight in DEFAULT_MIX.items())
+        + ")",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=32, help="Client threads sending requests"
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Gunicorn workers")
+    parser.add_argument(
+        "--threads", type=int, default=8, help="Threads per worker (gthread)"
+    )
+    parser.add_argument(
+        "--es-latency-ms", type=float, default=30, help="Fake search latency"
+    )
+    parser.add_argument(
+        "--es-jitter-ms", type=float, default=20, help="Random extra search latency"
+    )
+    parser.add_argument(
+        "--spotify-latency-ms", type=float, default=80, help="Spotify stub latency"
+    )
+    parser.add_argument("--startup-timeout", type=float, default=180)
+    parser.add_argument("--baseline", help="Compare with the results in this file")
+    parser.add_argument("--save-baseline", help="Save the results to this file")
+    args = parser.parse_args()
+
+    summary = main(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        baseline = saved["routes"]
+        differing = [
+            key
+            for key in ("rate", "mix", "workers", "threads", "concurrency")
+            if saved["settings"].get(key) != vars(args)[key]
+        ]
+        if differing:
+            print(f"Note: the baseline was run with other {', '.join(differing)}")
+    print_report(summary, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            settings = {
+                key: value
+                for key, value in vars(args).items()
+                if key not in ("baseline", "save_baseline")
+            }
+            json.dump({"settings": settings, "routes": summary}, f, indent=2)
+        print(f"Saved the results to {args.save_baseline}")
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import threading
+import time
+
+
+class DashboardSnapshotCache:
+    """
+    Per-user cache of the dashboard payload with its (unquoted) ETag.
+
+    Writers call `invalidate(user_id)` after committing; reads rebuild the
+    snapshot on the next request, once for all the concurrent requests of a
+    user. Each user has a version number that an
+    invalidation bumps, so a snapshot built while a write was committed is
+    not stored over the newer data.
+
+    Invalidations only reach the cache of the process that made the write.
+    When several worker processes serve the app, `max_age` bounds how long a
+    worker keeps serving a snapshot that another worker's write made stale.
+    """
+
+    def __init__(self, max_age: float | None = None):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._snapshots = {}  # user_id -> (payload, etag, built_at)
+        self._versions = {}  # user_id -> version
+        self._build_locks = {}  # user_id -> lock held while building
+        self._generation = 0  # bumped when every snapshot is invalidated
+        self._listeners = []
+
+    def get_etag(self, user_id: int) -> str | None:
+        """ETag of the cached snapshot, or None if it must be rebuilt."""
+        cached = self._get_cached(user_id)
+        return cached[1] if cached else None
+
+    def get(self, user_id: int, build) -> tuple[dict, str]:
+        """
+        Return the cached (payload, etag) for the user, building it if needed.
+        Only one request per user builds; concurrent ones wait for its snapshot.
+        """
+        cached = self._get_cached(user_id)
+        if cached:
+            return cached
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(user_id, threading.Lock())
+        with build_lock:
+            # Another request may have built the snapshot while we waited
+            cached = self._get_cached(user_id)
+            if cached:
+                return cached
+
+            with self._lock:
+                version = (self._generation, self._versions.get(user_id, 0))
+            try:
+                built_at = time.monotonic()
+                payload = build(user_id)
+                body = json.dumps(payload, sort_keys=True, default=str).encode()
+                etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+                with self._lock:
+                    if (self._generation, self._versions.get(user_id, 0)) == version:
+                        self._snapshots[user_id] = (payload, etag, built_at)
+                return payload, etag
+            finally:
+                with self._lock:
+                    # Later requests find the snapshot, so the lock is not kept
+                    if self._build_locks.get(user_id) is build_lock:
+                        del self._build_locks[user_id]
+
+    def invalidate(self, user_id: int | None = None) -> None:
+        """Drop the snapshot of one user, or of every user when user_id is None."""
+        with self._lock:
+            if user_id is None:
+                self._snapshots.clear()
+                self._generation += 1
+            else:
+                self._snapshots.pop(user_id, None)
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            listeners = list(self._listeners)
+
+        for listener in listeners:
+            listener(user_id)
+
+    def _get_cached(self, user_id: int) -> tuple[dict, str] | None:
+        with self._lock:
+            cached = self._snapshots.get(user_id)
+        if not cached:
+            return None
+        payload, etag, built_at = cached
+        if self.max_age is not None and time.monotonic() - built_at >= self.max_age:
+            return None
+        return payload, etag
+
+    def add_listener(self, listener) -> None:
+        """Call `listener(user_id)` after every invalidation (None for all users)."""
+        with self._lock:
+            self._listeners.append(listener)
+
+
+dashboard_cache = DashboardSnapshotCache()
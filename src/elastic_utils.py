@@ -77,7 +77,7 @@ def process_song_results(hit):
         album_title = source["albumTitle"]
 
     # Get preview URL if available
-    preview_url = source.get("preview", None)
+    preview_url = source.get("preview") or source.get("spotify_preview_url")
 
     # Create a richer snippet with song details
     rich_snippet = ""
@@ -122,6 +122,8 @@ def process_song_results(hit):
         "title": title,
         "content": rich_snippet,
         "preview": preview_url,
+        # Resolved offline by src/enrich_spotify.py, None if not (yet) matched
+        "spotify_track_id": source.get("spotify_track_id"),
         "type": "songs",
         "score": hit["_score"],
         "source": source,
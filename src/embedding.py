@@ -1,138 +1,835 @@
 import argparse
+import hashlib
 import html
+import itertools
+import multiprocessing
 import os
+import time
+from collections import OrderedDict
 
 import ijson
+import numpy as np
 import simplejson as json
+import torch
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 
+from timing import report_job, span, start_job, timed_iter
 
-def process_large_json(input_file, output_file, batch_size=1000, field="title"):
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+ENCODE_BATCH_SIZE = 32
+# Number of texts sent to a pool worker at a time
+POOL_CHUNK_SIZE = 256
+# all-MiniLM-L6-v2 truncates inputs to this many word pieces
+MAX_SEQ_TOKENS = 256
+# Vectors of recently encoded texts kept to skip repeats across batches
+DEDUP_CACHE_SIZE = 50_000
+# Batches encoded together, so texts are sorted by length across all of them
+SORT_WINDOW_BATCHES = 4
+
+# Binary vector output: vectors are written to <output>.<field>_embedding.npy
+# with one row per song, aligned with the document ids in <output>.ids.npy
+VECTOR_DTYPES = {"float32": np.float32, "float16": np.float16}
+ID_DTYPE = "S24"  # MongoDB ObjectId hex strings
+# Output files are written under this suffix and renamed once complete
+PARTIAL_SUFFIX = ".partial"
+
+
+def clean_lyrics(text):
+    """Remove the html escaping and line breaks used in the WASABI lyrics."""
+    return html.unescape(text).replace("<br>", ". ")
+
+
+# Preprocessing applied to a field's text before it is embedded
+FIELD_PREPROCESSORS = {
+    "lyrics": clean_lyrics,
+}
+
+
+def default_threads_per_worker(workers):
+    """Split the available cores evenly between encoder workers."""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+class LocalEncoder:
+    """Encode texts with a single model in the current process."""
+
+    # SentenceTransformer.encode sorts the texts of each call by length itself
+    sorts_by_length = True
+
+    def __init__(self, model_name=MODEL_NAME, threads=None):
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts):
+        return self.model.encode(
+            texts, batch_size=ENCODE_BATCH_SIZE, show_progress_bar=False
+        )
+
+    def close(self):
+        pass
+
+
+# Model owned by a pool worker process, set up by _init_pool_worker
+_worker_model = None
+
+
+def _init_pool_worker(model_name, threads):
+    global _worker_model
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _encode_chunk(texts):
+    if _worker_model is None:
+        raise RuntimeError("Pool worker has no model: _init_pool_worker did not run")
+    return _worker_model.encode(
+        texts, batch_size=ENCODE_BATCH_SIZE, show_progress_bar=False
+    )
+
+
+class PoolEncoder:
+    """
+    Encode texts with a pool of worker processes, each holding its own model.
+
+    Texts are split into chunks that are encoded in parallel; the results are
+    returned in input order.
+    """
+
+    # Each worker only sorts its own chunk
+    sorts_by_length = False
+
+    def __init__(self, workers, model_name=MODEL_NAME, threads=None):
+        threads = threads or default_threads_per_worker(workers)
+        # spawn instead of fork: forking a process that already started torch
+        # threads can deadlock the children
+        ctx = multiprocessing.get_context("spawn")
+        self.pool = ctx.Pool(
+            workers, initializer=_init_pool_worker, initargs=(model_name, threads)
+        )
+
+    def encode(self, texts):
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        chunks = [
+            texts[i : i + POOL_CHUNK_SIZE]
+            for i in range(0, len(texts), POOL_CHUNK_SIZE)
+        ]
+        # Pool.map keeps the chunks in order
+        return np.concatenate(self.pool.map(_encode_chunk, chunks))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+def estimate_tokens(text):
+    """Cheap token count estimate: words plus [CLS]/[SEP], capped at the model limit."""
+    return min(len(text.split()) + 2, MAX_SEQ_TOKENS)
+
+
+def padded_tokens(lengths, batch_size=ENCODE_BATCH_SIZE):
+    """Tokens the model processes when each batch is padded to its longest text."""
+    return sum(
+        max(lengths[i : i + batch_size]) * len(lengths[i : i + batch_size])
+        for i in range(0, len(lengths), batch_size)
+    )
+
+
+class DedupEncoder:
+    """
+    Wrap an encoder so each distinct text is encoded only once.
+
+    Texts are keyed by a hash of their content; repeats inside a call and
+    recently seen texts (kept in an LRU cache) reuse the stored vector. The
+    remaining texts are sorted by length before encoding, unless the encoder
+    sorts them itself, so model batches hold texts of similar length and
+    little compute goes to padding.
+    """
+
+    def __init__(self, encoder, cache_size=DEDUP_CACHE_SIZE):
+        self.encoder = encoder
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+
+        self.total_texts = 0
+        self.encoded_texts = 0
+        self.real_tokens = 0
+        # Padded tokens of the encoded texts in length-sorted and input order
+        self.padded_tokens = 0
+        self.unsorted_padded_tokens = 0
+
+    def encode(self, texts):
+        self.total_texts += len(texts)
+        keys = [
+            hashlib.blake2b(text.encode(), digest_size=16).digest() for text in texts
+        ]
+
+        vectors = {}
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key in vectors or key in pending:
+                continue
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                vectors[key] = self.cache[key]
+            else:
+                pending[key] = text
+
+        if pending:
+            lengths = [estimate_tokens(text) for text in pending.values()]
+            order = sorted(range(len(lengths)), key=lengths.__getitem__, reverse=True)
+            pending_items = list(pending.items())
+
+            self.encoded_texts += len(pending_items)
+            self.real_tokens += sum(lengths)
+            self.padded_tokens += padded_tokens([lengths[i] for i in order])
+            self.unsorted_padded_tokens += padded_tokens(lengths)
+
+            if getattr(self.encoder, "sorts_by_length", False):
+                order = range(len(pending_items))
+            encoded = self.encoder.encode([pending_items[i][1] for i in order])
+            for i, vector in zip(order, encoded):
+                key = pending_items[i][0]
+                vectors[key] = vector
+                self._remember(key, vector)
+
+        return np.stack([vectors[key] for key in keys])
+
+    def _remember(self, key, vector):
+        if self.cache_size <= 0:
+            return
+        self.cache[key] = np.array(vector)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def report(self):
+        dedup_ratio = 1 - self.encoded_texts / max(self.total_texts, 1)
+        waste = 1 - self.real_tokens / max(self.padded_tokens, 1)
+        unsorted_waste = 1 - self.real_tokens / max(self.unsorted_padded_tokens, 1)
+        print(
+            f"Deduplication: encoded {self.encoded_texts} of {self.total_texts} texts "
+            f"({dedup_ratio:.1%} skipped as duplicates)"
+        )
+        print(
+            f"Padding waste of the encoded texts: {waste:.1%} with length-sorted "
+            f"batches (vs {unsorted_waste:.1%} in input order, estimated tokens)"
+        )
+
+    def close(self):
+        self.encoder.close()
+
+
+def create_encoder(workers=1, threads=None, model_name=MODEL_NAME):
+    """Create an in-process encoder for one worker, or a process pool for more."""
+    if workers <= 1:
+        return LocalEncoder(model_name, threads)
+    return PoolEncoder(workers, model_name, threads)
+
+
+def process_large_json(
+    input_file,
+    output_file,
+    batch_size=1000,
+    fields=("title",),
+    workers=1,
+    threads=None,
+    vector_dtype=None,
+    dedup_cache_size=DEDUP_CACHE_SIZE,
+    temp_dir="temp_batches",
+    resume=True,
+    output_format=None,
+    checkpoint=True,
+    sort_window=SORT_WINDOW_BATCHES,
+):
     """
-    Process a large JSON file by adding title embeddings in batches.
+    Process a large JSON file by adding embeddings for one or more fields in batches.
+
+    All requested fields are embedded from the same read of the input, so
+    producing both title and lyrics embeddings only parses the file once.
 
     Args:
         input_file: Path to the input JSON file
         output_file: Path to the output JSON file
         batch_size: Number of songs to process in each batch
-        :param batch_size:
-        :param output_file:
-        :param input_file:
-        :param field:
+        fields: Names of the fields to embed, e.g. ("title", "lyrics")
+        workers: Number of encoder processes (1 encodes in this process)
+        threads: Torch intra-op threads per encoder (default: cores / workers)
+        vector_dtype: "float32" or "float16" to write the vectors to .npy
+            sidecar files instead of embedding them in the JSON output
+        dedup_cache_size: Number of recent text vectors reused across batches
+        temp_dir: Directory for the per-batch checkpoint files
+        resume: Reuse completed batches left in temp_dir by an earlier run
+            with the same input and settings
+        output_format: "json" for a JSON array or "ndjson" for one song per
+            line (default: picked from the output file extension)
+        checkpoint: Write batches to temp_dir and combine them at the end, so
+            the job can resume. Without it, batches are written straight to
+            the output and no temporary files are used.
+        sort_window: Number of batches encoded together; their texts are
+            sorted by length as one set, which wastes less compute on padding
+            than sorting each batch alone
     """
-    # Initialize the embedding model
-    model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+    if isinstance(fields, str):
+        fields = (fields,)
+    output_format = output_format or output_format_for(output_file)
+
+    if checkpoint:
+        settings = {
+            "input_file": os.path.abspath(input_file),
+            "input_size": os.path.getsize(input_file),
+            "batch_size": batch_size,
+            "fields": list(fields),
+            "vector_dtype": vector_dtype,
+            "batch_format": "ndjson",
+        }
+        batch_files = load_checkpoint(temp_dir, settings) if resume else []
+        if not resume:
+            clear_checkpoint(temp_dir)
+        os.makedirs(temp_dir, exist_ok=True)
+        save_manifest(temp_dir, settings)
+        output = None
+    else:
+        batch_files = []
+        output = DirectOutput(output_file, output_format, fields, vector_dtype)
+
+    # The model is only loaded once there is a batch left to encode
+    encoder = None
+
+    batch_num = len(batch_files)
+    song_count = 0
+    start_time = time.time()
+
+    try:
+        with open(input_file) as f:
+            items = ijson.items(f, "item")
+            pbar = tqdm(desc="Processing songs", unit="songs")
+
+            if batch_files:
+                # Parse past the songs of the completed batches without encoding them
+                skipped = sum(
+                    1 for _ in itertools.islice(items, batch_num * batch_size)
+                )
+                print(f"Resuming after {batch_num} completed batches ({skipped} songs)")
+                pbar.update(skipped)
 
-    temp_dir = "temp_batches"
-    os.makedirs(temp_dir, exist_ok=True)
+            batches = timed_iter(iter_batches(items, batch_size), "read_batch")
+            for window in iter_batches(batches, sort_window):
+                if encoder is None:
+                    encoder = DedupEncoder(
+                        create_encoder(workers, threads), dedup_cache_size
+                    )
 
+                # One encode call per field for the whole window
+                songs = [song for batch in window for song in batch]
+                window_arrays = embed_batch(songs, encoder, fields, vector_dtype)
+
+                for batch, arrays in zip(
+                    window, split_arrays(window_arrays, [len(b) for b in window])
+                ):
+                    if output is not None:
+                        with span("write_batch"):
+                            output.write_batch(batch, arrays)
+                    else:
+                        batch_files.append(
+                            save_batch(batch, arrays, temp_dir, batch_num)
+                        )
+                    batch_num += 1
+                    song_count += len(batch)
+                    pbar.update(len(batch))
+
+            pbar.close()
+    except BaseException:
+        if output is not None:
+            # A truncated output must not look complete
+            output.abort()
+        raise
+    finally:
+        if encoder is not None:
+            encoder.close()
+    if output is not None:
+        output.close()
+
+    elapsed = time.time() - start_time
+    print(
+        f"Encoded {song_count} songs with {workers} worker(s) in {elapsed:.1f}s "
+        f"({song_count / max(elapsed, 1e-9):.1f} songs/sec)"
+    )
+    if encoder is not None:
+        encoder.report()
+
+    if checkpoint:
+        # Combine batches
+        with span("combine_batches"):
+            combine_batch_files(batch_files, output_file, output_format)
+            if vector_dtype:
+                for name in sidecar_names(fields):
+                    combine_vector_files(
+                        batch_files, name, sidecar_path(output_file, name), vector_dtype
+                    )
+
+        # Cleanup, only once the output is complete
+        clear_checkpoint(temp_dir)
+
+    print(f"\n✅ Processing complete. Output saved to: {output_file}")
+
+
+def output_format_for(output_file):
+    """Write NDJSON for .ndjson/.jsonl outputs and a JSON array otherwise."""
+    if output_file.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "json"
+
+
+def iter_batches(items, batch_size):
     batch = []
-    batch_num = 0
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    # Final batch
+    if batch:
+        yield batch
+
+
+def manifest_path(temp_dir):
+    return os.path.join(temp_dir, "manifest.json")
+
+
+def save_manifest(temp_dir, settings):
+    with open(manifest_path(temp_dir), "w") as f:
+        json.dump(settings, f)
+
+
+def clear_checkpoint(temp_dir):
+    """Remove the checkpoint directory and everything left in it."""
+    if not os.path.isdir(temp_dir):
+        return
+    for name in os.listdir(temp_dir):
+        os.remove(os.path.join(temp_dir, name))
+    os.rmdir(temp_dir)
+
+
+def batch_path(temp_dir, batch_num):
+    return os.path.join(temp_dir, f"batch_{batch_num}.ndjson")
+
+
+def load_checkpoint(temp_dir, settings):
+    """
+    Find the batches completed by an earlier run of the same job.
+
+    Batches only count when they form an unbroken run from batch 0, since the
+    input is resumed by song position. Checkpoints written with other settings
+    are discarded.
+    """
+    if not os.path.exists(manifest_path(temp_dir)):
+        return []
+
+    with open(manifest_path(temp_dir)) as f:
+        previous = json.load(f)
+    if previous != settings:
+        print(f"Discarding checkpoints in {temp_dir} from a run with other settings")
+        clear_checkpoint(temp_dir)
+        return []
+
+    sidecars = sidecar_names(settings["fields"]) if settings["vector_dtype"] else []
     batch_files = []
+    while True:
+        batch_file = batch_path(temp_dir, len(batch_files))
+        if not os.path.exists(batch_file) or not all(
+            os.path.exists(sidecar_path(batch_file, name)) for name in sidecars
+        ):
+            return batch_files
+        batch_files.append(batch_file)
 
-    with open(input_file) as f:
-        items = ijson.items(f, "item")
-        pbar = tqdm(desc="Processing songs", unit="songs")
 
-        for song in items:
-            batch.append(song)
+def get_field_values(batch, field):
+    """Collect the (preprocessed) text of a field for every song in a batch."""
+    preprocess = FIELD_PREPROCESSORS.get(field)
+    field_vals = []
+    for song in batch:
+        value = song.get(field) or ""
+        field_vals.append(preprocess(value) if preprocess else value)
+    return field_vals
 
-            if len(batch) >= batch_size:
-                batch_file = process_batch(batch, model, temp_dir, batch_num, field)
-                batch_files.append(batch_file)
-                batch_num += 1
-                pbar.update(len(batch))
-                batch = []
 
-        # Final batch
-        if batch:
-            batch_file = process_batch(batch, model, temp_dir, batch_num, field)
-            batch_files.append(batch_file)
-            pbar.update(len(batch))
+def sidecar_names(fields):
+    """Names of the binary sidecar arrays written for the given fields."""
+    return ["ids"] + [field + "_embedding" for field in fields]
 
-        pbar.close()
 
-    # Combine batches
-    combine_batch_files(batch_files, output_file)
+def sidecar_path(json_file, name):
+    """Path of a binary sidecar array that belongs to a JSON file."""
+    return f"{os.path.splitext(json_file)[0]}.{name}.npy"
 
-    # Cleanup
-    for file in batch_files:
-        os.remove(file)
-    os.rmdir(temp_dir)
 
-    print(f"\n✅ Processing complete. Output saved to: {output_file}")
+def get_doc_ids(batch):
+    return np.array(
+        [(song.get("_id") or {}).get("$oid") or "" for song in batch], dtype=ID_DTYPE
+    )
 
 
-def process_batch(batch, model, temp_dir, batch_num, field):
-    """Add embeddings to a batch of songs."""
-    if field == "lyrics":
-        # print("embedding lyrics..")
-        # remove html style in dataset
-        field_vals = [
-            html.unescape(song.get(field, "")).replace("<br>", ". ") for song in batch
-        ]
-        # print("field_vals: " + str(field_vals))
-    else:
-        field_vals = [song.get(field, "") for song in batch]
+def embed_batch(batch, encoder, fields, vector_dtype=None):
+    """
+    Add embeddings for every requested field to a batch of songs.
+
+    With a vector_dtype, the embeddings are not added to the songs; they are
+    returned as {sidecar name: array} together with the document ids instead.
+    """
+    arrays = {"ids": get_doc_ids(batch)} if vector_dtype else {}
+
+    for field in fields:
+        field_vals = get_field_values(batch, field)
+
+        with span(f"encode_{field}"):
+            embeddings = encoder.encode(field_vals)
+
+        embedding_field_name = field + "_embedding"
+
+        if vector_dtype:
+            arrays[embedding_field_name] = embeddings.astype(
+                VECTOR_DTYPES[vector_dtype]
+            )
+            continue
+
+        for song, embedding in zip(batch, embeddings.tolist()):
+            song[embedding_field_name] = embedding
 
-    embeddings = model.encode(
-        field_vals, batch_size=32, show_progress_bar=False
-    ).tolist()
+    return arrays
 
-    embedding_field_name = field + "_embedding"
 
-    for song, embedding in zip(batch, embeddings):
-        song[embedding_field_name] = embedding
+def split_arrays(arrays, sizes):
+    """Split {sidecar name: array} into one such dict per batch of `sizes` songs."""
+    offsets = np.cumsum(sizes)[:-1]
+    parts = [{} for _ in sizes]
+    for name, array in arrays.items():
+        for part, rows in zip(parts, np.split(array, offsets)):
+            part[name] = rows
+    return parts
 
-    batch_file = os.path.join(temp_dir, f"batch_{batch_num}.json")
-    with open(batch_file, "w") as f:
-        json.dump(batch, f)
+
+def save_batch(batch, arrays, temp_dir, batch_num):
+    """Checkpoint an embedded batch of songs as an NDJSON batch file."""
+    batch_file = batch_path(temp_dir, batch_num)
+
+    with span("write_batch"):
+        for name, array in arrays.items():
+            np.save(sidecar_path(batch_file, name), array)
+
+        # The batch file marks the batch as complete, so write it last and
+        # atomically: a crash never leaves a truncated batch behind
+        tmp_file = batch_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            for song in batch:
+                f.write(json.dumps(song))
+                f.write("\n")
+        os.replace(tmp_file, batch_file)
 
     return batch_file
 
 
-def combine_batch_files(batch_files, output_file):
-    """Combine all batch files into a single output file."""
-    with open(output_file, "w") as out_f:
-        out_f.write("[")
+class SongWriter:
+    """
+    Write serialized songs one at a time as a JSON array or as NDJSON.
+
+    The songs go to `<output_file>.partial`, which `close()` completes and
+    renames to `output_file`; `abort()` deletes it instead.
+    """
+
+    def __init__(self, output_file, output_format):
+        self.path = output_file
+        self.file = open(output_file + PARTIAL_SUFFIX, "w")
+        self.ndjson = output_format == "ndjson"
+        self.count = 0
+        if not self.ndjson:
+            self.file.write("[")
+
+    def write(self, song_json):
+        if self.ndjson:
+            self.file.write(song_json)
+            self.file.write("\n")
+        else:
+            if self.count:
+                self.file.write(",")
+            self.file.write(song_json)
+        self.count += 1
+
+    def close(self):
+        if not self.ndjson:
+            self.file.write("]")
+        self.file.close()
+        os.replace(self.file.name, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.file.name)
+
+
+class NpyStreamWriter:
+    """
+    Append rows to a .npy file whose final row count is not known up front.
+
+    A fixed-size header is reserved at the start of the file and filled in
+    with the real shape when the writer is closed. Like SongWriter, it writes
+    to `<path>.partial` until then.
+    """
+
+    HEADER_SIZE = 128
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.file = open(path + PARTIAL_SUFFIX, "wb")
+        self.file.write(b" " * self.HEADER_SIZE)
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self.row_shape = ()
+
+    def write(self, array):
+        array = np.ascontiguousarray(array, dtype=self.dtype)
+        self.row_shape = array.shape[1:]
+        self.file.write(array.tobytes())
+        self.rows += len(array)
+
+    def close(self):
+        header = repr(
+            {
+                "descr": np.lib.format.dtype_to_descr(self.dtype),
+                "fortran_order": False,
+                "shape": (self.rows, *self.row_shape),
+            }
+        ).encode("latin1")
+        preamble = b"\x93NUMPY\x01\x00"
+        header_len = self.HEADER_SIZE - len(preamble) - 2
+        header = header.ljust(header_len - 1) + b"\n"
+        self.file.seek(0)
+        self.file.write(preamble + header_len.to_bytes(2, "little") + header)
+        self.file.close()
+        os.replace(self.file.name, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.file.name)
+
 
-        for i, file_path in enumerate(batch_files):
+class DirectOutput:
+    """Stream embedded batches straight to the final output files."""
+
+    def __init__(self, output_file, output_format, fields, vector_dtype=None):
+        self.songs = SongWriter(output_file, output_format)
+        self.sidecars = {}
+        if vector_dtype:
+            for name in sidecar_names(fields):
+                dtype = ID_DTYPE if name == "ids" else VECTOR_DTYPES[vector_dtype]
+                self.sidecars[name] = NpyStreamWriter(
+                    sidecar_path(output_file, name), dtype
+                )
+
+    def write_batch(self, batch, arrays):
+        for song in batch:
+            self.songs.write(json.dumps(song))
+        for name, array in arrays.items():
+            self.sidecars[name].write(array)
+
+    def close(self):
+        """Complete every output file, once all batches were written."""
+        self.songs.close()
+        for writer in self.sidecars.values():
+            writer.close()
+
+    def abort(self):
+        """Delete the unfinished output files."""
+        self.songs.abort()
+        for writer in self.sidecars.values():
+            writer.abort()
+
+
+def benchmark_workers(input_file, worker_counts, sample_size=4096, fields=("title",)):
+    """
+    Measure encoding throughput on a sample of the input for several pool sizes.
+
+    Model loading is excluded from the timings; only the encode calls are timed.
+    """
+    with open(input_file) as f:
+        sample = list(itertools.islice(ijson.items(f, "item"), sample_size))
+    texts = [text for field in fields for text in get_field_values(sample, field)]
+
+    print(f"Benchmarking {len(texts)} texts from {len(sample)} songs")
+    baseline = None
+    for workers in worker_counts:
+        encoder = create_encoder(workers)
+        try:
+            # Warm up so every worker has loaded its model before timing
+            encoder.encode(texts[: POOL_CHUNK_SIZE * max(1, workers)])
+            start_time = time.time()
+            encoder.encode(texts)
+            elapsed = time.time() - start_time
+        finally:
+            encoder.close()
+
+        throughput = len(texts) / max(elapsed, 1e-9)
+        baseline = baseline or throughput
+        print(
+            f"workers={workers:>3}  threads/worker={default_threads_per_worker(workers):>3}  "
+            f"{throughput:10.1f} texts/sec  speedup x{throughput / baseline:.2f}"
+        )
+
+
+def combine_batch_files(batch_files, output_file, output_format="json"):
+    """
+    Combine all NDJSON batch files into a single output file.
+
+    Songs are copied one line at a time, so memory use does not depend on the
+    batch size.
+    """
+    writer = SongWriter(output_file, output_format)
+    try:
+        for file_path in batch_files:
             with open(file_path) as in_f:
-                content = in_f.read()
-                # Remove the opening and closing brackets from the batch JSON
-                content = content.strip()
-                if content.startswith("["):
-                    content = content[1:]
-                if content.endswith("]"):
-                    content = content[:-1]
+                for line in in_f:
+                    line = line.rstrip("\n")
+                    if line:
+                        writer.write(line)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
 
-                out_f.write(content)
 
-                # Add comma if not the last batch
-                if i < len(batch_files) - 1:
-                    out_f.write(",")
+def combine_vector_files(batch_files, name, output_path, vector_dtype):
+    """Concatenate the per-batch .npy arrays of one sidecar into a single .npy."""
+    part_paths = [sidecar_path(file, name) for file in batch_files]
+    # Only the .npy headers are read to size the output
+    part_shapes = [np.load(path, mmap_mode="r").shape for path in part_paths]
+    total_rows = sum(shape[0] for shape in part_shapes)
+    if name == "ids":
+        dtype, shape = np.dtype(ID_DTYPE), (total_rows,)
+    else:
+        dims = next((shape[1] for shape in part_shapes if len(shape) == 2), 0)
+        dtype, shape = np.dtype(VECTOR_DTYPES[vector_dtype]), (total_rows, dims)
 
-        out_f.write("]")
+    # Write through a memory map so only one batch is held in memory at a time
+    partial_path = output_path + PARTIAL_SUFFIX
+    combined = np.lib.format.open_memmap(
+        partial_path, mode="w+", dtype=dtype, shape=shape
+    )
+    row = 0
+    for path, part_shape in zip(part_paths, part_shapes):
+        combined[row : row + part_shape[0]] = np.load(path)
+        row += part_shape[0]
+    combined.flush()
+    del combined
+    os.replace(partial_path, output_path)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="Add title embeddings to large JSON file of songs"
+        description="Add title/lyrics embeddings to large JSON file of songs"
     )
     parser.add_argument("-i", "--input", required=True, help="Path to input JSON file")
     parser.add_argument(
-        "-o", "--output", required=True, help="Path to output JSON file"
+        "-o",
+        "--output",
+        help="Path to output JSON file (.ndjson/.jsonl for one song per line)",
     )
     parser.add_argument(
         "-b", "--batch-size", type=int, default=2048, help="Batch size (default: 2048)"
     )
     parser.add_argument(
-        "-f", "--field", type=str, default="title", help="Field for embedding"
+        "-f",
+        "--field",
+        dest="fields",
+        type=str,
+        nargs="+",
+        default=["title"],
+        help="Field(s) for embedding, e.g. -f title lyrics (default: title)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of encoder processes, each with its own model (default: 1)",
+    )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        type=int,
+        default=None,
+        help="Torch threads per encoder process (default: CPU cores / workers)",
+    )
+    parser.add_argument(
+        "--vector-format",
+        choices=["json", "float32", "float16"],
+        default="json",
+        help="Store vectors in the JSON output (default) or in binary .npy "
+        "sidecar files next to it with the given precision",
+    )
+    parser.add_argument(
+        "--dedup-cache-size",
+        type=int,
+        default=DEDUP_CACHE_SIZE,
+        help="Number of recently encoded texts whose vectors are reused across "
+        f"batches (default: {DEDUP_CACHE_SIZE}, 0 to only dedupe within a batch)",
+    )
+    parser.add_argument(
+        "--sort-window",
+        type=int,
+        default=SORT_WINDOW_BATCHES,
+        help="Number of batches encoded together, with their texts sorted by "
+        f"length as one set (default: {SORT_WINDOW_BATCHES})",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=["json", "ndjson"],
+        help="JSON array or one song per line (default: from the output extension)",
+    )
+    parser.add_argument(
+        "--direct",
+        action="store_true",
+        help="Write batches straight to the output without checkpoint files "
+        "(the job cannot be resumed)",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Start from the first song instead of resuming from the batches "
+        "completed by an earlier run",
+    )
+    parser.add_argument(
+        "--benchmark-workers",
+        type=int,
+        nargs="+",
+        metavar="N",
+        help="Only report encoding throughput for these worker counts, e.g. 1 2 4 8",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        help="Save the time spent per stage as Prometheus histograms to this file",
     )
 
     args = parser.parse_args()
-    print("field: " + args.field)
-    process_large_json(
-        args.input, args.output, batch_size=args.batch_size, field=args.field
-    )
+    print("fields: " + ", ".join(args.fields))
+
+    if args.benchmark_workers:
+        benchmark_workers(args.input, args.benchmark_workers, fields=args.fields)
+    elif not args.output:
+        parser.error("the following arguments are required: -o/--output")
+    else:
+        start_job("embedding")
+        process_large_json(
+            args.input,
+            args.output,
+            batch_size=args.batch_size,
+            fields=args.fields,
+            workers=args.workers,
+            threads=args.threads,
+            vector_dtype=None if args.vector_format == "json" else args.vector_format,
+            dedup_cache_size=args.dedup_cache_size,
+            resume=not args.no_resume,
+            output_format=args.output_format,
+            checkpoint=not args.direct,
+            sort_window=args.sort_window,
+        )
+        report_job(args.metrics_file)
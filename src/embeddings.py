@@ -0,0 +1,42 @@
+"""
+The sentence embedding model shared by search and the user profiles.
+
+`sentence_transformers`, and torch with it, is only imported when the model
+is first needed, so importing the app stays fast. Servers load it before
+taking traffic (`warm_up` in app.py) rather than on the first search.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+_lock = threading.Lock()
+_model = None
+
+
+def get_model():
+    """The embedding model, loaded on first use."""
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                start = time.perf_counter()
+                from sentence_transformers import SentenceTransformer
+
+                imported = time.perf_counter()
+                _model = SentenceTransformer(MODEL_NAME)
+                logger.info(
+                    "Loaded %s in %.2fs (import %.2fs)",
+                    MODEL_NAME,
+                    time.perf_counter() - start,
+                    imported - start,
+                )
+    return _model
+
+
+def is_loaded() -> bool:
+    return _model is not None
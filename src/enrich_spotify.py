@@ -0,0 +1,338 @@
+"""
+Resolve the Spotify track of every song in the `songs` index.
+
+The job stores `spotify_track_id` and `spotify_preview_url` on each song
+document, so search results carry their Spotify track and the UI needs no
+lookup at query time. A song is resolved from the Spotify URL already in
+its document if there is one, then by ISRC, then by a title and artist
+search whose best result must match both.
+
+Every processed song is stamped with `spotify_enriched_at`, also when
+nothing matched, and the job only reads songs without the stamp: an
+interrupted run resumes where it stopped when started again. Spotify calls
+go through a token bucket (`--rate`), and a 429 pauses every worker for
+the Retry-After period.
+
+    uv run src/enrich_spotify.py --rate 5
+    uv run src/enrich_spotify.py --spotify-api-url http://localhost:8901  # src/spotify_stub.py
+"""
+
+import argparse
+import os
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import cast
+
+import requests
+import spotipy
+from dotenv import load_dotenv
+from elasticsearch.helpers import bulk
+from spotipy.cache_handler import MemoryCacheHandler
+from spotipy.exceptions import SpotifyException
+from spotipy.oauth2 import SpotifyClientCredentials
+
+from indexing import SONGS_MAPPING, connect_es
+
+load_dotenv()
+
+INDEX_NAME = "songs"
+ENRICHMENT_FIELDS = ("spotify_track_id", "spotify_preview_url", "spotify_enriched_at")
+SOURCE_FIELDS = ["title", "artist", "isrc", "urlSpotify"]
+PAGE_SIZE = 200
+MAX_ATTEMPTS = 5
+SEARCH_LIMIT = 5
+SPOTIFY_TRACK_URL = re.compile(r"open\.spotify\.com/(?:[\w-]+/)?track/([A-Za-z0-9]+)")
+
+
+class RateLimiter:
+    """Token bucket shared by the worker threads: `rate` calls per second on average."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._paused_until:
+                    self._tokens = min(
+                        self.burst, self._tokens + (now - self._updated) * self.rate
+                    )
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    delay = (1 - self._tokens) / self.rate
+                else:
+                    delay = self._paused_until - now
+            time.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller for `seconds`, e.g. after a 429."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+def normalize(text: str) -> str:
+    """Lowercase ASCII words, for comparing titles and artist names."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = text.encode("ascii", "ignore").decode().lower()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+
+def base_title(title: str) -> str:
+    """The title without versions like "(Remastered 2011)" or "- Live"."""
+    return normalize(re.split(r"\s[(\[]|\s-\s", title or "", maxsplit=1)[0])
+
+
+def is_match(song: dict, track: dict) -> bool:
+    """Whether a search result is the song: same base title and a shared artist."""
+    artist = normalize(song.get("artist", ""))
+    track_artists = [normalize(a["name"]) for a in track.get("artists", [])]
+    if not any(
+        name and (name == artist or name in artist or artist in name)
+        for name in track_artists
+    ):
+        return False
+    return base_title(track.get("name", "")) == base_title(song.get("title", ""))
+
+
+def quote(value: str) -> str:
+    return '"' + value.replace('"', " ").strip() + '"'
+
+
+def track_id_from_url(url) -> str | None:
+    match = SPOTIFY_TRACK_URL.search(url) if isinstance(url, str) else None
+    return match.group(1) if match else None
+
+
+class SpotifyResolver:
+    def __init__(self, sp: spotipy.Spotify, limiter: RateLimiter):
+        self.sp = sp
+        self.limiter = limiter
+
+    def call(self, fn, *args, **kwargs):
+        """Call Spotify within the rate limit, retrying 429s and server errors."""
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            self.limiter.acquire()
+            try:
+                return fn(*args, **kwargs)
+            except SpotifyException as e:
+                if e.http_status == 429:
+                    retry_after = float((e.headers or {}).get("Retry-After", 1))
+                    print(f"Rate limited by Spotify, pausing for {retry_after}s")
+                    self.limiter.pause(retry_after)
+                elif e.http_status < 500 or attempt == MAX_ATTEMPTS:
+                    raise
+                else:
+                    time.sleep(2**attempt)
+            except requests.exceptions.RequestException:
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                time.sleep(2**attempt)
+        raise RuntimeError(f"Spotify call failed after {MAX_ATTEMPTS} attempts")
+
+    def search(self, query: str) -> list:
+        results = self.call(self.sp.search, q=query, type="track", limit=SEARCH_LIMIT)
+        if not results:
+            return []
+        return results["tracks"]["items"]
+
+    def resolve(self, song: dict) -> dict | None:
+        """The song's Spotify track, or None if nothing matches."""
+        track_id = track_id_from_url(song.get("urlSpotify"))
+        if track_id:
+            return self.call(self.sp.track, track_id)
+
+        isrc = song.get("isrc")
+        if isinstance(isrc, str) and isrc.strip():
+            tracks = self.search(f"isrc:{isrc.strip()}")
+            if tracks:
+                return tracks[0]
+
+        if not song.get("title") or not song.get("artist"):
+            return None
+        tracks = self.search(
+            f"track:{quote(song['title'])} artist:{quote(song['artist'])}"
+        )
+        return next((track for track in tracks if is_match(song, track)), None)
+
+
+class ClientCredentialsWithTokenUrl(SpotifyClientCredentials):
+    """Client credentials whose token URL can point at another host (the stub)."""
+
+    # spotipy's Literal default would reject any other URL
+    OAUTH_TOKEN_URL: str = SpotifyClientCredentials.OAUTH_TOKEN_URL
+
+
+def create_spotify_client(api_url: str | None = None) -> spotipy.Spotify:
+    """
+    A client-credentials client on a session without automatic retries, so
+    429s reach `SpotifyResolver.call`. `api_url` points it at another host,
+    such as the local stub.
+    """
+    session = requests.Session()
+    auth_manager = ClientCredentialsWithTokenUrl(
+        client_id=os.environ.get("SPOTIFY_CLIENT_ID"),
+        client_secret=os.environ.get("SPOTIFY_CLIENT_SECRET"),
+        # Not the .cache file spotipy writes to the working directory by default
+        cache_handler=MemoryCacheHandler(),
+        # spotipy infers bool from the default, but documents a Session too
+        requests_session=session,  # pyright: ignore[reportArgumentType]
+    )
+    sp = spotipy.Spotify(
+        auth_manager=auth_manager,
+        requests_session=session,  # pyright: ignore[reportArgumentType]
+    )
+    if api_url:
+        api_url = api_url.rstrip("/")
+        auth_manager.OAUTH_TOKEN_URL = f"{api_url}/api/token"
+        sp.prefix = f"{api_url}/v1/"
+    return sp
+
+
+def ensure_mapping(es) -> None:
+    """Add the enrichment fields to an index created before they existed."""
+    properties = {
+        field: SONGS_MAPPING["properties"][field] for field in ENRICHMENT_FIELDS
+    }
+    es.indices.put_mapping(index=INDEX_NAME, properties=properties)
+
+
+def pending_query(retry_unmatched: bool = False) -> dict:
+    field = "spotify_track_id" if retry_unmatched else "spotify_enriched_at"
+    return {"bool": {"must_not": [{"exists": {"field": field}}]}}
+
+
+def iter_pending_pages(es, query: dict, page_size: int = PAGE_SIZE):
+    """Pages of songs to enrich, read from a point in time so updates don't shift them."""
+    pit = es.open_point_in_time(index=INDEX_NAME, keep_alive="5m")["id"]
+    search_after = None
+    try:
+        while True:
+            response = es.search(
+                query=query,
+                size=page_size,
+                source=SOURCE_FIELDS,
+                pit={"id": pit, "keep_alive": "5m"},
+                sort=[{"_shard_doc": "asc"}],
+                search_after=search_after,
+            )
+            pit = response.get("pit_id", pit)
+            hits = response["hits"]["hits"]
+            if not hits:
+                return
+            yield hits
+            search_after = hits[-1]["sort"]
+    finally:
+        es.close_point_in_time(id=pit)
+
+
+def enrichment_update(hit: dict, track: dict | None) -> dict:
+    return {
+        "_op_type": "update",
+        "_index": INDEX_NAME,
+        "_id": hit["_id"],
+        "doc": {
+            "spotify_track_id": track["id"] if track else None,
+            "spotify_preview_url": track.get("preview_url") if track else None,
+            "spotify_enriched_at": datetime.now(timezone.utc).isoformat(),
+        },
+    }
+
+
+def enrich(
+    es, resolver: SpotifyResolver, workers: int, limit=None, retry_unmatched=False
+):
+    total = es.count(index=INDEX_NAME, query=pending_query(retry_unmatched))["count"]
+    if limit:
+        total = min(total, limit)
+    print(f"{total} songs to enrich.")
+
+    counts = {"matched": 0, "unmatched": 0, "failed": 0}
+    start_time = time.time()
+
+    def resolve(hit):
+        try:
+            return hit, resolver.resolve(hit["_source"]), None
+        except Exception as e:
+            return hit, None, e
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for hits in iter_pending_pages(es, pending_query(retry_unmatched)):
+            if limit:
+                hits = hits[: limit - sum(counts.values())]
+            actions, outcomes = [], {}
+            for hit, track, error in executor.map(resolve, hits):
+                if error is not None:
+                    # Left unstamped, so the next run tries the song again
+                    counts["failed"] += 1
+                    print(f"Error resolving song {hit['_id']}: {error}")
+                    continue
+                outcomes[hit["_id"]] = "matched" if track else "unmatched"
+                actions.append(enrichment_update(hit, track))
+            _, errors = bulk(es, actions, raise_on_error=False)
+            # A list of failed items, as stats_only is off
+            for error in cast(list, errors):
+                # Not stamped either, so the next run tries the song again
+                item = next(iter(error.values()))
+                outcomes[item["_id"]] = "failed"
+                print(f"Error updating song {item['_id']}: {item.get('error')}")
+            for outcome in outcomes.values():
+                counts[outcome] += 1
+
+            done = sum(counts.values())
+            elapsed = time.time() - start_time
+            print(
+                f"{done}/{total} songs: {counts['matched']} matched, "
+                f"{counts['unmatched']} unmatched, {counts['failed']} failed "
+                f"({done / elapsed:.1f} songs/s)"
+            )
+            if limit and done >= limit:
+                break
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Store the Spotify track of each song in the songs index"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=5.0, help="Spotify requests per second"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Songs resolved concurrently"
+    )
+    parser.add_argument("--limit", type=int, help="Stop after this many songs")
+    parser.add_argument(
+        "--retry-unmatched",
+        action="store_true",
+        help="Also retry songs for which no track was found in a previous run",
+    )
+    parser.add_argument(
+        "--spotify-api-url",
+        default=os.environ.get("SPOTIFY_API_URL"),
+        help="Base URL of the Spotify API, e.g. the local stub",
+    )
+    args = parser.parse_args()
+
+    es = connect_es()
+    ensure_mapping(es)
+    resolver = SpotifyResolver(
+        create_spotify_client(args.spotify_api_url), RateLimiter(args.rate)
+    )
+    counts = enrich(es, resolver, args.workers, args.limit, args.retry_unmatched)
+    print(
+        f"Done: {counts['matched']} matched, {counts['unmatched']} unmatched, "
+        f"{counts['failed']} failed."
+    )
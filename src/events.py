@@ -0,0 +1,167 @@
+"""
+Server-sent events for the dashboard and the player bar.
+
+Each open tab holds one `/events` stream. Writers publish to the user's
+subscribers through the `EventBroker`, and the currently-playing state is
+polled from Spotify by one background thread per user (`SharedPoller`),
+however many tabs that user has open. Everything lives in the process that
+serves the stream, which holds a bounded number of streams (`StreamLimiter`).
+"""
+
+import json
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_SECONDS = 15
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def format_sse(event: str, data) -> str:
+    """Encode one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class EventBroker:
+    """Fan events out to the queues of every stream a user has open."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # user_id -> set of queues
+
+    def subscribe(self, user_id: int) -> queue.Queue:
+        subscription = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id: int, subscription: queue.Queue) -> None:
+        with self._lock:
+            subscriptions = self._subscribers.get(user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscribers.pop(user_id, None)
+
+    def publish(self, user_id: int | None, event: str, data=None) -> None:
+        """
+        Queue an event for the user's streams (every user's when user_id is
+        None); streams that fall too far behind drop it.
+        """
+        with self._lock:
+            if user_id is None:
+                subscriptions = [
+                    subscription
+                    for user_subscriptions in self._subscribers.values()
+                    for subscription in user_subscriptions
+                ]
+            else:
+                subscriptions = list(self._subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.put_nowait((event, data))
+            except queue.Full:
+                logger.warning(
+                    "Dropping %s event for a slow stream of user %s", event, user_id
+                )
+
+    def subscriber_count(self, user_id: int) -> int:
+        with self._lock:
+            return len(self._subscribers.get(user_id, ()))
+
+
+class StreamLimiter:
+    """
+    Bound the number of event streams a process holds open at once.
+
+    Every stream occupies a server thread for as long as its tab stays open,
+    so without a bound idle tabs could take every thread of a worker and
+    starve its other requests. Refused clients poll instead.
+    """
+
+    def __init__(self, limit: int | None = None):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self.open = 0
+        self.refused = 0
+
+    def acquire(self) -> bool:
+        """Take a slot for a new stream; False if all of them are in use."""
+        with self._lock:
+            if self.limit is not None and self.open >= self.limit:
+                self.refused += 1
+                return False
+            self.open += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.open -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"open": self.open, "limit": self.limit, "refused": self.refused}
+
+
+class SharedPoller:
+    """
+    One polling thread per user, shared by all of that user's streams.
+
+    `fetch(user_id)` is called every `interval` seconds while at least one
+    stream holds the user, and its result is published as `event` whenever
+    it changes. The thread stops when the last stream releases the user.
+    """
+
+    def __init__(self, broker: EventBroker, event: str, fetch, interval: float):
+        self.broker = broker
+        self.event = event
+        self.fetch = fetch
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._holders = {}  # user_id -> number of streams
+        self._stops = {}  # user_id -> threading.Event
+        self._latest = {}  # user_id -> last fetched value
+
+    def acquire(self, user_id: int):
+        """Register a stream for the user; returns the last value fetched, if any."""
+        with self._lock:
+            self._holders[user_id] = self._holders.get(user_id, 0) + 1
+            if user_id not in self._stops:
+                stop = threading.Event()
+                self._stops[user_id] = stop
+                threading.Thread(
+                    target=self._run,
+                    args=(user_id, stop),
+                    name=f"{self.event}-poller-{user_id}",
+                    daemon=True,
+                ).start()
+            return self._latest.get(user_id)
+
+    def release(self, user_id: int) -> None:
+        with self._lock:
+            self._holders[user_id] = self._holders.get(user_id, 1) - 1
+            if self._holders[user_id] <= 0:
+                self._holders.pop(user_id, None)
+                self._latest.pop(user_id, None)
+                stop = self._stops.pop(user_id, None)
+                if stop:
+                    stop.set()
+
+    def _run(self, user_id: int, stop: threading.Event) -> None:
+        logger.info("Started %s poller for user %s", self.event, user_id)
+        latest = None
+        while not stop.is_set():
+            try:
+                value = self.fetch(user_id)
+            except Exception as e:
+                logger.error("Error polling %s for user %s: %s", self.event, user_id, e)
+            else:
+                if value != latest:
+                    latest = value
+                    with self._lock:
+                        if not stop.is_set():
+                            self._latest[user_id] = value
+                    self.broker.publish(user_id, self.event, value)
+            stop.wait(self.interval)
+        logger.info("Stopped %s poller for user %s", self.event, user_id)
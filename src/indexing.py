@@ -1,12 +1,16 @@
 import argparse
+import json
 import os
 import time
 
 import ijson
+import numpy as np
 from dotenv import load_dotenv
 from elasticsearch import Elasticsearch
 from elasticsearch.helpers import bulk
 
+from timing import report_job, span, start_job, timed_iter
+
 load_dotenv()
 
 # --- Configuration ---
@@ -17,6 +21,9 @@ FILE_TO_INDEX_MAP = {
     "song.json": "songs",
 }
 BULK_CHUNK_SIZE = 500
+# Line-delimited files (one document per line) are parsed with json.loads,
+# which is much faster than the ijson streaming parser
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
 
 # Define mappings for indices that need specific field types
 SONGS_MAPPING = {
@@ -89,6 +96,10 @@ SONGS_MAPPING = {
         "id_artist": {"type": "keyword"},
         "id_song_musicbrainz": {"type": "keyword"},
         "id_song_deezer": {"type": "keyword"},
+        # Filled by src/enrich_spotify.py
+        "spotify_track_id": {"type": "keyword"},
+        "spotify_preview_url": {"type": "keyword", "index": False},
+        "spotify_enriched_at": {"type": "date"},
     },
     "dynamic_templates": [
         {
@@ -263,9 +274,87 @@ def process_document(doc):
     return doc
 
 
+def find_corpus_file(filename):
+    """Path of a corpus file, preferring an NDJSON version of it if one exists."""
+    filepath = os.path.join(CORPUS_DIR, filename)
+    base = os.path.splitext(filepath)[0]
+    for extension in NDJSON_EXTENSIONS:
+        if os.path.exists(base + extension):
+            return base + extension
+    return filepath
+
+
+def iter_documents(f, filepath):
+    if filepath.endswith(NDJSON_EXTENSIONS):
+        print("Processing NDJSON file line by line...")
+        return (json.loads(line) for line in f if line.strip())
+    print("Processing JSON array using ijson streaming parser...")
+    return ijson.items(f, "item")
+
+
+class SidecarMismatchError(ValueError):
+    """The vector sidecar files do not line up with the documents of the JSON file."""
+
+
+def sidecar_rows(ids) -> int:
+    """Number of rows of the sidecar ids; SidecarMismatchError if it is missing."""
+    if ids is None:
+        raise SidecarMismatchError("The vector sidecars have no ids file")
+    return len(ids)
+
+
+def check_sidecar_row(ids, row, doc):
+    """Raise SidecarMismatchError unless sidecar row `row` belongs to `doc`."""
+    doc_id = (doc.get("_id") or {}).get("$oid") or ""
+    rows = sidecar_rows(ids)
+    if row >= rows:
+        raise SidecarMismatchError(
+            f"The vector sidecars have {rows} rows, fewer than the documents"
+        )
+    if ids[row].decode() != doc_id:
+        raise SidecarMismatchError(
+            f"Vector sidecar row {row} is for {ids[row].decode()}, not {doc_id}"
+        )
+
+
+def load_vector_sidecars(filepath):
+    """
+    Memory-map the binary vector files written by `embedding.py --vector-format`.
+
+    For `corpus/song.json` these are `corpus/song.ids.npy` plus one
+    `corpus/song.<field>_embedding.npy` per embedded field, with one row per
+    document in the same order as the JSON file.
+    Returns (ids, {field_name: vectors}), or (None, {}) if there are none.
+    """
+    base = os.path.splitext(filepath)[0]
+    ids_path = f"{base}.ids.npy"
+    if not os.path.exists(ids_path):
+        return None, {}
+
+    ids = np.load(ids_path, mmap_mode="r")
+    vectors = {}
+    for field_name in SONGS_MAPPING["properties"]:
+        vector_path = f"{base}.{field_name}.npy"
+        if field_name.endswith("_embedding") and os.path.exists(vector_path):
+            vectors[field_name] = np.load(vector_path, mmap_mode="r")
+            if len(vectors[field_name]) != len(ids):
+                raise SidecarMismatchError(
+                    f"{vector_path} has {len(vectors[field_name])} rows, "
+                    f"{ids_path} has {len(ids)}"
+                )
+            print(
+                f"Joining {field_name} from {vector_path} "
+                f"({vectors[field_name].dtype}, {vectors[field_name].shape})"
+            )
+    return ids, vectors
+
+
 def generate_bulk_actions(filepath, index_name, subset_size=None):
     print(f"\nProcessing file: {filepath} for index: {index_name}")
     count = 0
+    row = 0
+
+    ids, vectors = load_vector_sidecars(filepath)
 
     # Print size
     file_size = os.path.getsize(filepath) / (1024 * 1024)  # Size in MB
@@ -274,14 +363,27 @@ def generate_bulk_actions(filepath, index_name, subset_size=None):
     try:
         with open(filepath, encoding="utf-8") as f:
             try:
-                print("Processing JSON array using ijson streaming parser...")
-                objects = ijson.items(f, "item")
+                objects = iter_documents(f, filepath)
                 for doc in objects:
+                    # Row of this document in the vector sidecar files
+                    doc_row = row
+                    row += 1
+                    if vectors:
+                        # Outside the per-document handler: once the rows are
+                        # off, every later document would get wrong vectors
+                        check_sidecar_row(ids, doc_row, doc)
                     try:
                         # Extract the $oid for the document ID
                         doc_id = doc.get("_id", {}).get("$oid")
                         del doc["_id"]
 
+                        # Attach the binary vectors without going through JSON text
+                        if vectors:
+                            for field_name, field_vectors in vectors.items():
+                                doc[field_name] = (
+                                    field_vectors[doc_row].astype(np.float32).tolist()
+                                )
+
                         # Process MongoDB-style IDs
                         doc = process_document(doc)
 
@@ -301,13 +403,22 @@ def generate_bulk_actions(filepath, index_name, subset_size=None):
                     except Exception as e:
                         print(f"Error processing document: {e}")
 
+                reached_subset = subset_size and count >= subset_size
+                if vectors and not reached_subset and row != sidecar_rows(ids):
+                    raise SidecarMismatchError(
+                        f"The vector sidecars have {sidecar_rows(ids)} rows "
+                        f"for {row} documents"
+                    )
+
             except StopIteration:
                 print("Empty file or invalid JSON format")
-            except ijson.JSONError as e:
+            except (ijson.JSONError, json.JSONDecodeError) as e:
                 print(f"Error parsing JSON: {e}")
 
     except FileNotFoundError:
         print(f"Error: File not found {filepath}")
+    except SidecarMismatchError:
+        raise
     except Exception as e:
         print(f"Error reading file {filepath}: {e}")
 
@@ -332,7 +443,12 @@ if __name__ == "__main__":
     parser.add_argument(
         "--skip-existing", action="store_true", help="Skip files with an existing index"
     )
+    parser.add_argument(
+        "--metrics-file",
+        help="Save the time spent per stage as Prometheus histograms to this file",
+    )
     args = parser.parse_args()
+    start_job("indexing")
 
     # Connect to Elasticsearch
     es = connect_es()
@@ -367,7 +483,7 @@ if __name__ == "__main__":
     # Index data from files
     print("\nStarting data indexing...")
     for filename, index_name in files_to_process.items():
-        filepath = os.path.join(CORPUS_DIR, filename)
+        filepath = find_corpus_file(filename)
         if not os.path.exists(filepath):
             print(f"Warning: File not found, skipping: {filepath}")
             continue
@@ -385,14 +501,22 @@ if __name__ == "__main__":
         # Use the bulk helper with more detailed error handling
         start_time = time.time()
         try:
-            success, errors = bulk(
-                client=es,
-                actions=generate_bulk_actions(filepath, index_name, args.subset),
-                chunk_size=BULK_CHUNK_SIZE,
-                raise_on_error=False,  # Don't stop on first error
-                stats_only=False,  # Get detailed error info
-                request_timeout=120,  # Increase timeout for large datasets
+            # Reading and preparing the documents is interleaved with the bulk
+            # requests; the time spent in Elasticsearch is the difference
+            actions = timed_iter(
+                generate_bulk_actions(filepath, index_name, args.subset),
+                "read_documents",
+                BULK_CHUNK_SIZE,
             )
+            with span("bulk_index_file"):
+                success, errors = bulk(
+                    client=es,
+                    actions=actions,
+                    chunk_size=BULK_CHUNK_SIZE,
+                    raise_on_error=False,  # Don't stop on first error
+                    stats_only=False,  # Get detailed error info
+                    request_timeout=120,  # Increase timeout for large datasets
+                )
 
             elapsed = time.time() - start_time
 
@@ -423,7 +547,13 @@ if __name__ == "__main__":
                 )
                 print(f"Indexing speed: {success / elapsed:.2f} docs/sec")
 
+        except SidecarMismatchError as e:
+            raise SystemExit(
+                f"Stopping: {e}. Regenerate the vector files of {filepath} "
+                "with src/embedding.py and index it again."
+            )
         except Exception as e:
             print(f"Error during bulk indexing for {filepath}: {e}")
 
     print("\nIndexing process finished.")
+    report_job(args.metrics_file)
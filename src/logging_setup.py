@@ -0,0 +1,271 @@
+"""
+Non-blocking logging for the app.
+
+Request threads only put log records on an in-memory queue; a background
+thread (`QueueListener`) formats them and writes them to the console and
+`app.log` (or LOG_FILE), so a slow disk or terminal never holds up a
+request.
+
+Every record carries the fields of the request it was logged from
+(`request_id`, `user_id`, `method`, `path`), shown in the text format or
+as keys of the JSON lines with LOG_FORMAT=json. The request id is taken
+from an incoming X-Request-ID header or generated, and returned in the
+X-Request-ID response header.
+
+Hot paths log a line for every search and interaction, so INFO and DEBUG
+records are rate limited per message: each message template is written at
+most LOG_RATE_LIMIT times per LOG_RATE_INTERVAL seconds, and the next one
+written reports how many were suppressed (or, if the message does not come
+again, a separate line once its window has passed, or when the app stops).
+Warnings and errors always pass.
+Log with %-style arguments (`logger.info("Saved %s", item)`) rather than
+f-strings: the message is then only formatted, in the background thread,
+if the record is written at all.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+LOG_FORMAT = (
+    "%(asctime)s - %(name)s - %(levelname)s - "
+    "[%(request_id)s user=%(user_id)s %(method)s %(path)s] %(message)s"
+)
+REQUEST_FIELDS = ("request_id", "user_id", "method", "path")
+REQUEST_ID_HEADER = "X-Request-ID"
+# Ids from the client are only reused if they cannot forge log lines
+REQUEST_ID_PATTERN = re.compile(r"[\w.-]{1,64}")
+# Records beyond this are dropped rather than blocking the logging thread
+QUEUE_SIZE = 10000
+RATE_LIMIT = int(os.environ.get("LOG_RATE_LIMIT", 20))
+RATE_INTERVAL = float(os.environ.get("LOG_RATE_INTERVAL", 60))
+LOG_FILE = os.environ.get("LOG_FILE", "app.log")
+
+_queue_handler = None
+_listener = None
+
+
+class RequestContextFilter(logging.Filter):
+    """Add the fields of the current request to every record ("-" outside one)."""
+
+    def filter(self, record):
+        fields = dict.fromkeys(REQUEST_FIELDS, "-")
+        if has_request_context():
+            fields["request_id"] = g.get("request_id", "-")
+            fields["method"] = request.method
+            fields["path"] = request.path
+            # Set by Flask-Login once the user is loaded; reading
+            # current_user here could query the database
+            user = g.get("_login_user")
+            if user is not None and user.is_authenticated:
+                fields["user_id"] = user.get_id()
+        for name, value in fields.items():
+            if not hasattr(record, name):
+                setattr(record, name, value)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let each message template through at most `limit` times per `interval`
+    seconds, for records below `max_level`.
+    """
+
+    def __init__(
+        self, limit=RATE_LIMIT, interval=RATE_INTERVAL, max_level=logging.INFO
+    ):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self.max_level = max_level
+        self.lock = threading.Lock()
+        # (logger, template) -> [window start, records let through, suppressed]
+        self.windows = {}
+        self.pruned_at = time.monotonic()
+
+    def filter(self, record):
+        if record.levelno > self.max_level or self.limit <= 0:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        expired = {}
+        with self.lock:
+            if now - self.pruned_at >= self.interval:
+                expired = self._pop_windows(
+                    lambda window: now - window[0] >= self.interval
+                )
+                self.pruned_at = now
+            window = self.windows.get(key) or expired.pop(key, None)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self.windows[key] = [now, 1, 0]
+            elif window[1] < self.limit:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                suppressed = None
+        # Logged outside the lock, as these records go through the filter too
+        report_suppressed(expired)
+        if suppressed is None:
+            return False
+        if suppressed:
+            message = record.getMessage()
+            record.msg = "%s (%d similar messages suppressed)"
+            record.args = (message, suppressed)
+        return True
+
+    def flush(self) -> None:
+        """Report the messages suppressed in every window, and forget them."""
+        with self.lock:
+            windows = self._pop_windows(lambda window: True)
+        report_suppressed(windows)
+
+    def _pop_windows(self, should_pop) -> dict:
+        """Remove the windows `should_pop` accepts. Needs self.lock."""
+        popped = {
+            key: window for key, window in self.windows.items() if should_pop(window)
+        }
+        for key in popped:
+            del self.windows[key]
+        return popped
+
+
+def report_suppressed(windows: dict) -> None:
+    """Log a line for each of `windows` whose messages were suppressed."""
+    for (name, template), (_, _, suppressed) in windows.items():
+        if suppressed:
+            logging.getLogger(name).info(
+                "%d similar messages suppressed: %s", suppressed, template
+            )
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the request fields as keys."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for name in REQUEST_FIELDS:
+            value = getattr(record, name, "-")
+            if value != "-":
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    A QueueHandler for a queue read by a thread of the same process.
+
+    The stock handler formats every message before queueing it, so that the
+    record can be pickled; here the record is queued as is and formatted by
+    the writer thread. Records are dropped, and counted, when the queue is full.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level=logging.INFO, log_file=LOG_FILE) -> QueueListener:
+    """
+    Send the root logger's records through a queue to a background thread
+    writing them to the console and `log_file`.
+    """
+    global _queue_handler
+
+    if os.environ.get("LOG_FORMAT") == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler(), logging.FileHandler(log_file)]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    _queue_handler = BackgroundQueueHandler(queue.Queue(QUEUE_SIZE))
+    # Filters run in the calling thread, before the record is queued: the
+    # request is still known there, and suppressed records are never queued
+    _queue_handler.addFilter(RateLimitFilter())
+    _queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_queue_handler)
+    start_listener(handlers)
+    atexit.register(stop_listener)
+    assert _listener is not None
+    return _listener
+
+
+def start_listener(handlers=None) -> None:
+    """
+    Start the writer thread on a new queue. Forked workers call this without
+    arguments, as the master's thread does not survive the fork. Does
+    nothing before `setup_logging`.
+    """
+    global _listener
+    if _queue_handler is None:
+        return
+    if handlers is None:
+        if _listener is None:
+            return
+        handlers = _listener.handlers
+    _queue_handler.queue = queue.Queue(QUEUE_SIZE)
+    _listener = QueueListener(
+        _queue_handler.queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+
+
+def stop_listener() -> None:
+    """Write out the queued records and stop the writer thread."""
+    if _queue_handler is None or _listener is None or _listener._thread is None:
+        return
+    for log_filter in _queue_handler.filters:
+        if isinstance(log_filter, RateLimitFilter):
+            log_filter.flush()
+    if _queue_handler.dropped:
+        logging.getLogger(__name__).warning(
+            "Dropped %d log records while the queue was full", _queue_handler.dropped
+        )
+    _listener.stop()
+
+
+def init_request_logging(app) -> None:
+    """Give every request an id, logged with its records and returned in a header."""
+
+    @app.before_request
+    def assign_request_id():
+        request_id = request.headers.get(REQUEST_ID_HEADER, "")
+        if not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = uuid.uuid4().hex[:16]
+        g.request_id = request_id
+
+    @app.after_request
+    def add_request_id_header(response):
+        response.headers[REQUEST_ID_HEADER] = g.get("request_id", "")
+        return response
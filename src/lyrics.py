@@ -0,0 +1,139 @@
+"""
+Lyrics lookups for songs.
+
+A song's lyrics come from the `lyrics` stored in the songs index when it
+has them, and otherwise from lyrics.ovh through a keep-alive session. API
+answers are stored in the `lyrics_cache` table, misses included: a song the
+API has no lyrics for is not asked for again for a week, and a failed
+lookup (e.g. a timeout) waits a few minutes, so missing lyrics no longer
+cost a full timeout on every view.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from .models import LyricsCacheEntry, db
+from .utils import create_lyrics_session, fetch_track_lyrics, normalize_key
+
+logger = logging.getLogger(__name__)
+
+SONGS_INDEX = "songs"
+FETCH_WORKERS = 8
+# How long a lookup result is trusted, by status
+CACHE_TTL = {
+    "found": timedelta(days=90),
+    "not_found": timedelta(days=7),
+    "error": timedelta(minutes=15),
+}
+
+
+def lyrics_key(artist: str, title: str) -> str:
+    return f"{normalize_key(artist)}|{normalize_key(title)}"
+
+
+class LyricsCache:
+    def __init__(self, es_client, workers: int = FETCH_WORKERS):
+        self.es = es_client
+        self.session = create_lyrics_session(workers)
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="lyrics"
+        )
+
+    def get(self, artist: str, title: str, song_id: str | None = None) -> dict:
+        """The song's {"lyrics", "source"}; lyrics is None if none were found."""
+        item = {"artist": artist, "title": title, "song_id": song_id}
+        return self.get_many([item]).get(
+            lyrics_key(artist, title), {"lyrics": None, "source": None}
+        )
+
+    def get_many(self, items: list) -> dict:
+        """
+        Look up the lyrics of several songs ({"artist", "title", "song_id"})
+        at once, by `lyrics_key`. Songs not answered by the cache are looked
+        up in the index and the API concurrently.
+        """
+        by_key = {
+            lyrics_key(item["artist"], item["title"]): item
+            for item in items
+            if item.get("artist") and item.get("title")
+        }
+        if not by_key:
+            return {}
+
+        now = datetime.utcnow()
+        entries = {
+            entry.key: entry
+            for entry in LyricsCacheEntry.query.filter(
+                LyricsCacheEntry.key.in_(list(by_key))
+            )
+        }
+        results = {}
+        for key, entry in entries.items():
+            if entry.fetched_at + CACHE_TTL[entry.status] > now:
+                source = "lyrics.ovh" if entry.lyrics else None
+                results[key] = {"lyrics": entry.lyrics, "source": source}
+
+        missing = [key for key in by_key if key not in results]
+        lookups = self.executor.map(lambda key: self._lookup(by_key[key]), missing)
+        new_entries = []
+        for key, (status, lyrics, source) in zip(missing, lookups):
+            results[key] = {"lyrics": lyrics, "source": source}
+            if source == "index":
+                # Already stored in the index, no need to keep a copy
+                continue
+            entry = entries.get(key)
+            if entry is None:
+                entry = LyricsCacheEntry(key=key)
+                new_entries.append(entry)
+            entry.status = status
+            entry.lyrics = lyrics
+            entry.fetched_at = now
+
+        for entry in new_entries:
+            try:
+                # Savepoint, so losing an insert race only undoes this insert
+                with db.session.begin_nested():
+                    db.session.add(entry)
+            except IntegrityError:
+                # A concurrent request cached the same song first
+                continue
+        db.session.commit()
+        return results
+
+    def _lookup(self, item: dict) -> tuple[str, str | None, str | None]:
+        """(status, lyrics, source) from the index, or else from the API."""
+        lyrics = self._from_index(item)
+        if lyrics:
+            return "found", lyrics, "index"
+        status, lyrics = fetch_track_lyrics(item["artist"], item["title"], self.session)
+        return status, lyrics, "lyrics.ovh" if lyrics else None
+
+    def _from_index(self, item: dict) -> str | None:
+        try:
+            if item.get("song_id"):
+                doc = self.es.get(
+                    index=SONGS_INDEX, id=item["song_id"], source=["lyrics"]
+                )
+                source = doc["_source"]
+            else:
+                response = self.es.search(
+                    index=SONGS_INDEX,
+                    query={
+                        "bool": {
+                            "filter": [{"term": {"title.keyword": item["title"]}}],
+                            "must": [{"match_phrase": {"artist": item["artist"]}}],
+                        }
+                    },
+                    source=["lyrics"],
+                    size=1,
+                )
+                hits = response["hits"]["hits"]
+                source = hits[0]["_source"] if hits else {}
+        except Exception as e:
+            logger.error("Error looking up lyrics in the songs index: %s", e)
+            return None
+        lyrics = source.get("lyrics")
+        return lyrics if isinstance(lyrics, str) and lyrics.strip() else None
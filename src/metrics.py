@@ -1,12 +1,28 @@
 import logging
 import uuid
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, cast
 
 import numpy as np
-from sqlalchemy import desc, func
-
-from .models import SearchSession, User, UserInteraction, UserMetrics, db
+from sqlalchemy import and_, desc, func, update
+from sqlalchemy.engine import CursorResult
+from sqlalchemy.exc import IntegrityError
+
+from .dashboard import dashboard_cache
+from .models import (
+    SearchSession,
+    User,
+    UserAlbumLikeStats,
+    UserArtistLikeStats,
+    UserArtistStats,
+    UserGenreStats,
+    UserInteraction,
+    UserMetrics,
+    UserSongStats,
+    db,
+)
+from .timing import span
+from .utils import normalize_key, parse_item_text
 
 
 class SearchMetrics:
@@ -32,18 +48,26 @@ class SearchMetrics:
         # Initialize or update user metrics if not exists
         metrics = db.session.query(UserMetrics).filter_by(user_id=user_id).first()
         if not metrics:
-            metrics = UserMetrics(user_id=user_id, search_count=1)
+            metrics = UserMetrics(
+                user_id=user_id, search_count=1, precision_session_count=1
+            )
             db.session.add(metrics)
+            # Plays and likes from before the first search are already counted
+            self._update_most_played_metrics(metrics)
+            self._update_most_liked_metrics(metrics)
         else:
             # Make sure search_count is initialized before incrementing
             if metrics.search_count is None:
                 metrics.search_count = 1
             else:
                 metrics.search_count += 1
+            # The new session starts with a precision of 0
+            metrics.precision_session_count = (metrics.precision_session_count or 0) + 1
 
         metrics.last_updated = datetime.now()
 
         db.session.commit()
+        dashboard_cache.invalidate(user_id)
 
         return session_id
 
@@ -52,12 +76,26 @@ class SearchMetrics:
     ) -> None:
         """
         Update precision metrics for a session based on liked items in search results.
+        The user's running precision totals are corrected by the difference to
+        the session's previous values.
         """
         session = db.session.query(SearchSession).get(session_id)
         if session:
+            metrics = (
+                db.session.query(UserMetrics).filter_by(user_id=session.user_id).first()
+            )
+            if metrics:
+                metrics.precision_at_5_sum = (metrics.precision_at_5_sum or 0.0) + (
+                    precision5 - (session.precision_at_5 or 0.0)
+                )
+                metrics.precision_at_10_sum = (metrics.precision_at_10_sum or 0.0) + (
+                    precision10 - (session.precision_at_10 or 0.0)
+                )
+
             session.precision_at_5 = precision5
             session.precision_at_10 = precision10
             db.session.commit()
+            dashboard_cache.invalidate(session.user_id)
 
     def track_interaction(
         self,
@@ -67,13 +105,19 @@ class SearchMetrics:
         item_type: str = "song",
         session_id: str | None = None,
         duration: float = 0,
+        track_id: str | None = None,
+        song: str | None = None,
+        artist: str | None = None,
+        album: str | None = None,
+        genre: str | None = None,
     ) -> dict:
         """
         Track an interaction for the current search session and update metrics.
         Added duration parameter to properly track play duration.
+        Song, artist, album and genre are parsed from `item_text` unless given.
         """
         self.logger.info(
-            f"Saving {interaction_type} interaction to database: {item_text}"
+            "Saving %s interaction to database: %s", interaction_type, item_text
         )
 
         # Find the active session if session_id not provided
@@ -87,6 +131,7 @@ class SearchMetrics:
             session_id = latest_session.session_id if latest_session else None
 
         # Save interaction to database
+        parsed = parse_item_text(item_text)
         interaction = UserInteraction(
             user_id=user_id,
             interaction_type=interaction_type,
@@ -95,9 +140,21 @@ class SearchMetrics:
             timestamp=datetime.now(),
             session_id=session_id,
             duration=duration if interaction_type == "play" else None,
+            track_id=track_id,
+            song=song or parsed["song"],
+            artist=artist or parsed["artist"],
+            album=album or parsed["album"],
+            genre=genre or parsed["genre"],
         )
         db.session.add(interaction)
 
+        # Keep the per-song play totals and the like counters current, even
+        # before the user's first search creates their metrics row
+        if interaction_type == "play":
+            self._record_song_play(interaction)
+        elif interaction_type == "like":
+            self._record_like(interaction)
+
         # Update user metrics
         metrics = db.session.query(UserMetrics).filter_by(user_id=user_id).first()
         if metrics:
@@ -106,108 +163,323 @@ class SearchMetrics:
 
             # Update specific metrics based on interaction type
             if interaction_type == "play":
-                self._update_most_played_metrics(metrics, user_id, item_text, duration)
+                self._update_most_played_metrics(metrics)
             elif interaction_type == "like":
-                self._update_most_liked_metrics(metrics, item_text)
+                self._update_most_liked_metrics(metrics)
 
         db.session.commit()
+        dashboard_cache.invalidate(user_id)
 
         # Return the latest metrics for the user
         return self.get_session_metrics(user_id)
 
-    def _update_most_played_metrics(
-        self, metrics: UserMetrics, user_id: int, item_text: str, duration: float
-    ) -> None:
+    def _increment_stats(self, model, keys: dict, increments: dict, values: dict):
         """
-        Update most played song metrics when a play interaction occurs.
-        Now properly tracks play counts and durations to determine the most played song.
-        """
-        parts = item_text.split(" by ", 1)
-        if len(parts) == 2:
-            song, artist = parts
-            song = song.strip()
-            artist = artist.strip()
-
-            # Get all play interactions for this song by this user
-            play_interactions = (
-                db.session.query(UserInteraction)
-                .filter_by(user_id=user_id, interaction_type="play")
-                .filter(UserInteraction.item_text.like(f"{song} by {artist}%"))
-                .all()
+        Atomically add `increments` to the counters of the stats row with `keys`,
+        creating the row if it does not exist yet. `values` are set on the row
+        either way. Returns the up-to-date row.
+        """
+        columns = {
+            getattr(model, name): getattr(model, name) + amount
+            for name, amount in increments.items()
+        }
+        columns.update({getattr(model, name): value for name, value in values.items()})
+        conditions = [getattr(model, name) == value for name, value in keys.items()]
+
+        for _ in range(2):
+            # An UPDATE returns a CursorResult, which has the rowcount
+            result = cast(
+                CursorResult,
+                db.session.execute(
+                    update(model)
+                    .where(*conditions)
+                    .values(columns)
+                    .execution_options(synchronize_session=False)
+                ),
             )
+            if result.rowcount:
+                break
+            try:
+                # Savepoint, so losing an insert race only undoes this insert
+                with db.session.begin_nested():
+                    db.session.add(model(**keys, **increments, **values))
+                break
+            except IntegrityError:
+                continue
+
+        row = db.session.query(model).filter_by(**keys).one()
+        db.session.refresh(row)
+        return row
+
+    def _record_song_play(self, interaction: UserInteraction) -> UserSongStats | None:
+        """Add a play interaction to the user's play totals for its song."""
+        if not interaction.song or not interaction.artist:
+            return None
+
+        song_stats = self._increment_stats(
+            UserSongStats,
+            keys={
+                "user_id": interaction.user_id,
+                "song_key": normalize_key(interaction.song),
+                "artist_key": normalize_key(interaction.artist),
+            },
+            increments={"play_count": 1, "total_duration": interaction.duration or 0},
+            values={
+                "song": interaction.song,
+                "artist": interaction.artist,
+                "last_played": datetime.now(),
+            },
+        )
+        self.logger.info(
+            "Song '%s' by '%s' has been played %s times with total duration %ss",
+            song_stats.song,
+            song_stats.artist,
+            song_stats.play_count,
+            song_stats.total_duration,
+        )
+        return song_stats
 
-            # Calculate total play count and duration for this song
-            total_count = len(play_interactions)
-            total_duration = (
-                sum(interaction.duration or 0 for interaction in play_interactions)
-                + duration
-            )
+    def _update_most_played_metrics(self, metrics: UserMetrics) -> None:
+        """
+        Set the most played song to the one with the most total play time in
+        the user's play totals, as `backfill_song_stats` does.
+        """
+        leader = (
+            db.session.query(UserSongStats)
+            .filter_by(user_id=metrics.user_id)
+            .order_by(UserSongStats.total_duration.desc(), UserSongStats.id)
+            .first()
+        )
+        if leader is None:
+            return
 
+        if (
+            normalize_key(metrics.most_played_song) != leader.song_key
+            or normalize_key(metrics.most_played_artist) != leader.artist_key
+        ):
             self.logger.info(
-                f"Song '{song}' by '{artist}' has been played {total_count} times with total duration {total_duration}s"
+                "Updating most played song to '%s' by '%s' with duration %ss",
+                leader.song,
+                leader.artist,
+                leader.total_duration,
             )
+        metrics.most_played_song = leader.song
+        metrics.most_played_artist = leader.artist
+        metrics.most_played_duration = leader.total_duration
 
-            # Get the current most played song's total playtime
-            current_most_played = metrics.most_played_song
-            current_most_played_artist = metrics.most_played_artist
-            current_most_played_duration = metrics.most_played_duration or 0
-
-            if current_most_played and current_most_played_artist:
-                current_interactions = (
-                    db.session.query(UserInteraction)
-                    .filter_by(user_id=user_id, interaction_type="play")
-                    .filter(
-                        UserInteraction.item_text.like(
-                            f"{current_most_played} by {current_most_played_artist}%"
-                        )
-                    )
-                    .all()
-                )
-                current_duration = sum(
-                    interaction.duration or 0 for interaction in current_interactions
+    def backfill_song_stats(self, user_id: int | None = None) -> int:
+        """
+        Rebuild the per-song play totals (and most played song) from the play
+        history, for one user or for everyone. Returns the number of songs.
+        """
+        plays = db.session.query(
+            UserInteraction.user_id,
+            UserInteraction.item_text,
+            func.count(UserInteraction.id),
+            func.coalesce(func.sum(UserInteraction.duration), 0.0),
+            func.max(UserInteraction.timestamp),
+        ).filter(UserInteraction.interaction_type == "play")
+        stats_query = db.session.query(UserSongStats)
+        if user_id is not None:
+            plays = plays.filter(UserInteraction.user_id == user_id)
+            stats_query = stats_query.filter(UserSongStats.user_id == user_id)
+
+        # Item texts of the same song can differ (album, genre), so the SQL
+        # totals per text are merged per normalized song and artist
+        songs = {}
+        for play_user_id, item_text, count, duration, last_played in plays.group_by(
+            UserInteraction.user_id, UserInteraction.item_text
+        ):
+            parsed = parse_item_text(item_text)
+            if not parsed["song"] or not parsed["artist"]:
+                continue
+            key = (
+                play_user_id,
+                normalize_key(parsed["song"]),
+                normalize_key(parsed["artist"]),
+            )
+            if key not in songs:
+                songs[key] = UserSongStats(
+                    user_id=play_user_id,
+                    song_key=key[1],
+                    artist_key=key[2],
+                    song=parsed["song"],
+                    artist=parsed["artist"],
+                    play_count=0,
+                    total_duration=0.0,
+                    last_played=last_played or datetime.now(),
                 )
-            else:
-                current_duration = 0
+            stats = songs[key]
+            stats.play_count += count
+            stats.total_duration += duration
+            if last_played and last_played > stats.last_played:
+                stats.last_played = last_played
+
+        stats_query.delete(synchronize_session=False)
+        db.session.add_all(songs.values())
+
+        # Most played song per user
+        leaders = {}
+        for stats in songs.values():
+            leader = leaders.get(stats.user_id)
+            if not leader or stats.total_duration > leader.total_duration:
+                leaders[stats.user_id] = stats
+        metrics_query = db.session.query(UserMetrics)
+        if user_id is not None:
+            metrics_query = metrics_query.filter_by(user_id=user_id)
+        for metrics in metrics_query:
+            leader = leaders.get(metrics.user_id)
+            metrics.most_played_song = leader.song if leader else None
+            metrics.most_played_artist = leader.artist if leader else None
+            metrics.most_played_duration = leader.total_duration if leader else 0.0
 
-            # Update most played song if this one has longer total play time
-            if not current_most_played or total_duration > current_duration:
-                self.logger.info(
-                    f"Updating most played song to '{song}' by '{artist}' with duration {total_duration}s"
-                )
-                metrics.most_played_song = song
-                metrics.most_played_artist = artist
-                metrics.most_played_duration = total_duration
-
-    def _update_most_liked_metrics(self, metrics: UserMetrics, item_text: str) -> None:
-        """Update most liked album and artist metrics when a like interaction occurs."""
-        # Parse the item_text for album and artist information
-        album_parts = item_text.split(" from ", 1)
-        if len(album_parts) == 2:
-            song_artist, album = album_parts
-            album = album.strip()
-
-            # Extract artist from song_artist (format: "song by artist")
-            artist_parts = song_artist.split(" by ", 1)
-            if len(artist_parts) == 2:
-                artist = artist_parts[1].strip()
-
-                # Update most liked album (simplified - would need like counting logic)
-                if not metrics.most_liked_album:
-                    metrics.most_liked_album = album
-                    metrics.most_liked_album_artist = artist
-                    metrics.most_liked_album_count = 1
-                else:
-                    # In a real implementation, you'd increment a counter for this album
-                    # Here, we're just setting it as the most liked if it's the first one
-                    pass
-
-                # Update most liked artist (simplified)
-                if not metrics.most_liked_artist:
-                    metrics.most_liked_artist = artist
-                    metrics.most_liked_artist_count = 1
-                else:
-                    # In a real implementation, you'd increment a counter for this artist
-                    pass
+        db.session.commit()
+        dashboard_cache.invalidate(user_id)
+        self.logger.info("Backfilled play totals for %s songs", len(songs))
+        return len(songs)
+
+    def _record_like(self, interaction: UserInteraction) -> None:
+        """Add a like interaction to the user's album and artist like counters."""
+        artist = interaction.artist
+        album = interaction.album
+        if not artist:
+            return
+
+        now = datetime.now()
+        if album:
+            self._increment_stats(
+                UserAlbumLikeStats,
+                keys={
+                    "user_id": interaction.user_id,
+                    "album_key": normalize_key(album),
+                    "artist_key": normalize_key(artist),
+                },
+                increments={"like_count": 1},
+                values={"album": album, "artist": artist, "last_liked": now},
+            )
+        self._increment_stats(
+            UserArtistLikeStats,
+            keys={"user_id": interaction.user_id, "artist_key": normalize_key(artist)},
+            increments={"like_count": 1},
+            values={"artist": artist, "last_liked": now},
+        )
+
+    def _update_most_liked_metrics(self, metrics: UserMetrics) -> None:
+        """
+        Set the most liked album and artist to the ones with the most likes in
+        the user's like counters, as `backfill_like_stats` does.
+        """
+        album = (
+            db.session.query(UserAlbumLikeStats)
+            .filter_by(user_id=metrics.user_id)
+            .order_by(UserAlbumLikeStats.like_count.desc(), UserAlbumLikeStats.id)
+            .first()
+        )
+        if album is not None:
+            metrics.most_liked_album = album.album
+            metrics.most_liked_album_artist = album.artist
+            metrics.most_liked_album_count = album.like_count
+
+        artist = (
+            db.session.query(UserArtistLikeStats)
+            .filter_by(user_id=metrics.user_id)
+            .order_by(UserArtistLikeStats.like_count.desc(), UserArtistLikeStats.id)
+            .first()
+        )
+        if artist is not None:
+            metrics.most_liked_artist = artist.artist
+            metrics.most_liked_artist_count = artist.like_count
+
+    def backfill_like_stats(self, user_id: int | None = None) -> int:
+        """
+        Rebuild the album and artist like counters (and the most liked album
+        and artist) from the like history, for one user or for everyone.
+        Returns the number of artists.
+        """
+        likes = db.session.query(
+            UserInteraction.user_id,
+            UserInteraction.item_text,
+            func.count(UserInteraction.id),
+        ).filter(UserInteraction.interaction_type == "like")
+        if user_id is not None:
+            likes = likes.filter(UserInteraction.user_id == user_id)
+
+        albums = {}
+        artists = {}
+        now = datetime.now()
+        for like_user_id, item_text, count in likes.group_by(
+            UserInteraction.user_id, UserInteraction.item_text
+        ):
+            parsed = parse_item_text(item_text)
+            artist = parsed["artist"]
+            if not artist:
+                continue
+            artist_key = normalize_key(artist)
+            if parsed["album"]:
+                key = (like_user_id, normalize_key(parsed["album"]), artist_key)
+                albums.setdefault(
+                    key,
+                    UserAlbumLikeStats(
+                        user_id=like_user_id,
+                        album_key=key[1],
+                        artist_key=artist_key,
+                        album=parsed["album"],
+                        artist=artist,
+                        like_count=0,
+                        last_liked=now,
+                    ),
+                ).like_count += count
+            artists.setdefault(
+                (like_user_id, artist_key),
+                UserArtistLikeStats(
+                    user_id=like_user_id,
+                    artist_key=artist_key,
+                    artist=artist,
+                    like_count=0,
+                    last_liked=now,
+                ),
+            ).like_count += count
+
+        for model in (UserAlbumLikeStats, UserArtistLikeStats):
+            stats_query = db.session.query(model)
+            if user_id is not None:
+                stats_query = stats_query.filter(model.user_id == user_id)
+            stats_query.delete(synchronize_session=False)
+        db.session.add_all(albums.values())
+        db.session.add_all(artists.values())
+
+        # Most liked album and artist per user
+        top_albums = {}
+        for stats in albums.values():
+            leader = top_albums.get(stats.user_id)
+            if not leader or stats.like_count > leader.like_count:
+                top_albums[stats.user_id] = stats
+        top_artists = {}
+        for stats in artists.values():
+            leader = top_artists.get(stats.user_id)
+            if not leader or stats.like_count > leader.like_count:
+                top_artists[stats.user_id] = stats
+
+        metrics_query = db.session.query(UserMetrics)
+        if user_id is not None:
+            metrics_query = metrics_query.filter_by(user_id=user_id)
+        for metrics in metrics_query:
+            album = top_albums.get(metrics.user_id)
+            artist = top_artists.get(metrics.user_id)
+            metrics.most_liked_album = album.album if album else None
+            metrics.most_liked_album_artist = album.artist if album else None
+            metrics.most_liked_album_count = album.like_count if album else 0
+            metrics.most_liked_artist = artist.artist if artist else None
+            metrics.most_liked_artist_count = artist.like_count if artist else 0
+
+        db.session.commit()
+        dashboard_cache.invalidate(user_id)
+        self.logger.info(
+            "Backfilled like counts for %s albums and %s artists",
+            len(albums),
+            len(artists),
+        )
+        return len(artists)
 
     def get_session_metrics(self, user_id: int) -> dict:
         """
@@ -234,38 +506,37 @@ class SearchMetrics:
     ) -> dict[str, list]:
         """
         Get metrics for all sessions for a user.
+
+        The like counts of the latest sessions are fetched in a single query:
+        the sessions are left-joined to their likes and grouped per session.
         """
-        sessions = (
-            db.session.query(SearchSession)
-            .filter_by(user_id=user_id)
+        recent_sessions = (
+            db.session.query(SearchSession.session_id, SearchSession.timestamp)
+            .filter(SearchSession.user_id == user_id)
             .order_by(SearchSession.timestamp.desc())
             .limit(max_sessions)
-            .all()
+            .subquery()
         )
 
-        sessions.reverse()  # Oldest first for charting
-
-        # Get likes per search and calculate cumulative likes
-        likes_per_search = []
-        cumulative_likes = []
-        total_likes = 0
-
-        for session in sessions:
-            # Count likes for this session
-            session_likes = (
-                db.session.query(UserInteraction)
-                .filter_by(
-                    user_id=user_id,
-                    session_id=session.session_id,
-                    interaction_type="like",
-                )
-                .count()
+        rows = (
+            db.session.query(func.count(UserInteraction.id))
+            .select_from(recent_sessions)
+            .outerjoin(
+                UserInteraction,
+                and_(
+                    UserInteraction.session_id == recent_sessions.c.session_id,
+                    UserInteraction.user_id == user_id,
+                    UserInteraction.interaction_type == "like",
+                ),
             )
-            likes_per_search.append(session_likes)
-            total_likes += session_likes
-            cumulative_likes.append(total_likes)
+            .group_by(recent_sessions.c.session_id, recent_sessions.c.timestamp)
+            .order_by(recent_sessions.c.timestamp.asc())  # Oldest first for charting
+            .all()
+        )
 
-        search_numbers = list(range(1, len(sessions) + 1))
+        likes_per_search = [likes for (likes,) in rows]
+        cumulative_likes = np.cumsum(likes_per_search, dtype=int).tolist()
+        search_numbers = list(range(1, len(rows) + 1))
 
         return {
             "likes_per_search": likes_per_search,
@@ -278,7 +549,9 @@ class SearchMetrics:
         Get aggregate metrics for a user.
         """
         metrics = db.session.query(UserMetrics).filter_by(user_id=user_id).first()
+        return self._format_user_metrics(metrics)
 
+    def _format_user_metrics(self, metrics: UserMetrics | None) -> dict[str, float]:
         if not metrics:
             return {
                 "search_count": 0,
@@ -287,11 +560,17 @@ class SearchMetrics:
                 "precision@10": 0.0,
             }
 
-        # Calculate average precision across all sessions
-        sessions = db.session.query(SearchSession).filter_by(user_id=user_id).all()
-        precision5 = np.mean([s.precision_at_5 for s in sessions]) if sessions else 0.0
+        # Average precision across all sessions, from the running totals
+        session_count = metrics.precision_session_count or 0
+        precision5 = (
+            (metrics.precision_at_5_sum or 0.0) / session_count
+            if session_count
+            else 0.0
+        )
         precision10 = (
-            np.mean([s.precision_at_10 for s in sessions]) if sessions else 0.0
+            (metrics.precision_at_10_sum or 0.0) / session_count
+            if session_count
+            else 0.0
         )
 
         return {
@@ -306,8 +585,9 @@ class SearchMetrics:
         Get the most played song for a user based on stored metrics.
         """
         metrics = db.session.query(UserMetrics).filter_by(user_id=user_id).first()
-        logging.getLogger(__name__).info(f"User metrics for user {user_id}: {metrics}")
+        return self._format_most_played_song(metrics)
 
+    def _format_most_played_song(self, metrics: UserMetrics | None) -> dict[str, str]:
         if not metrics or not metrics.most_played_song:
             return {"song": "No songs played yet", "artist": "", "duration": 0}
 
@@ -324,7 +604,9 @@ class SearchMetrics:
         Get the most liked album for a user based on stored metrics.
         """
         metrics = db.session.query(UserMetrics).filter_by(user_id=user_id).first()
+        return self._format_most_liked_album(metrics)
 
+    def _format_most_liked_album(self, metrics: UserMetrics | None) -> dict[str, str]:
         if not metrics or not metrics.most_liked_album:
             return {"album": "No albums liked yet", "artist": "", "likes": 0}
 
@@ -339,7 +621,9 @@ class SearchMetrics:
         Get the most liked artist for a user based on stored metrics.
         """
         metrics = db.session.query(UserMetrics).filter_by(user_id=user_id).first()
+        return self._format_most_liked_artist(metrics)
 
+    def _format_most_liked_artist(self, metrics: UserMetrics | None) -> dict[str, str]:
         if not metrics or not metrics.most_liked_artist:
             return {"artist": "No artists liked yet", "likes": 0}
 
@@ -348,6 +632,57 @@ class SearchMetrics:
             "likes": metrics.most_liked_artist_count,
         }
 
+    def build_dashboard_snapshot(self, user_id: int) -> dict:
+        """
+        Assemble the whole dashboard payload: the summary metrics from one
+        UserMetrics read, the per-session like chart, and the top genres and
+        artists by play count (four queries in total).
+        """
+        metrics = db.session.query(UserMetrics).filter_by(user_id=user_id).first()
+        user_metrics = self._format_user_metrics(metrics)
+
+        top_genres = (
+            db.session.query(UserGenreStats.genre, UserGenreStats.play_count)
+            .filter_by(user_id=user_id)
+            .order_by(UserGenreStats.play_count.desc())
+            .limit(5)
+            .all()
+        )
+        top_artists = (
+            db.session.query(UserArtistStats.artist, UserArtistStats.play_count)
+            .filter_by(user_id=user_id)
+            .order_by(UserArtistStats.play_count.desc())
+            .limit(10)
+            .all()
+        )
+
+        return {
+            "metrics_over_time": self.get_all_session_metrics(user_id),
+            "total_searches": user_metrics["search_count"],
+            "total_interactions": user_metrics["interaction_count"],
+            "most_played_song": self._format_most_played_song(metrics),
+            "most_liked_album": self._format_most_liked_album(metrics),
+            "most_liked_artist": self._format_most_liked_artist(metrics),
+            "genre_stats": {
+                "labels": [genre for genre, _ in top_genres],
+                "data": [play_count for _, play_count in top_genres],
+            },
+            "artist_stats": {
+                "labels": [artist for artist, _ in top_artists],
+                "data": [play_count for _, play_count in top_artists],
+            },
+        }
+
+    def get_dashboard_snapshot(self, user_id: int) -> tuple[dict, str]:
+        """Get the user's cached dashboard payload and its ETag."""
+        with span("dashboard_snapshot"):
+            return dashboard_cache.get(user_id, self._timed_build_dashboard_snapshot)
+
+    def _timed_build_dashboard_snapshot(self, user_id: int) -> dict:
+        # Only runs on a cache miss
+        with span("build_dashboard_snapshot"):
+            return self.build_dashboard_snapshot(user_id)
+
     def get_latest_search_metrics(self, user_id: int) -> dict[str, float]:
         """
         Get metrics for just the latest search performed by a user.
@@ -378,6 +713,11 @@ class SearchMetrics:
             # Delete all interactions
             db.session.query(UserInteraction).filter_by(user_id=user_id).delete()
 
+            # Delete the per-song play totals and the like counters
+            db.session.query(UserSongStats).filter_by(user_id=user_id).delete()
+            db.session.query(UserAlbumLikeStats).filter_by(user_id=user_id).delete()
+            db.session.query(UserArtistLikeStats).filter_by(user_id=user_id).delete()
+
             # Reset metrics or create new if not exists
             metrics = db.session.query(UserMetrics).filter_by(user_id=user_id).first()
             if metrics:
@@ -392,6 +732,9 @@ class SearchMetrics:
                 metrics.most_liked_album_count = 0
                 metrics.most_liked_artist = None
                 metrics.most_liked_artist_count = 0
+                metrics.precision_at_5_sum = 0.0
+                metrics.precision_at_10_sum = 0.0
+                metrics.precision_session_count = 0
                 metrics.last_updated = datetime.now()
             else:
                 # Create new metrics record with default values
@@ -400,10 +743,11 @@ class SearchMetrics:
 
             # Commit all changes to ensure they're saved
             db.session.commit()
+            dashboard_cache.invalidate(user_id)
 
-            self.logger.info(f"Reset all metrics for user {user_id}")
+            self.logger.info("Reset all metrics for user %s", user_id)
         except Exception as e:
             # Log any errors and roll back transaction
-            self.logger.error(f"Error resetting metrics for user {user_id}: {str(e)}")
+            self.logger.error("Error resetting metrics for user %s: %s", user_id, e)
             db.session.rollback()
             raise
@@ -0,0 +1,156 @@
+"""
+Schema migrations for databases created before a model change.
+
+`db.create_all()` creates missing tables but never alters existing ones, so
+new columns on existing tables are added here. Every migration only applies
+changes that are missing, which makes it safe to run on a database that
+`create_all()` just created. Applied versions are recorded in the
+`schema_migrations` table.
+"""
+
+import logging
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+logger = logging.getLogger(__name__)
+
+
+def _add_column(db, table: str, column: str, ddl: str) -> None:
+    """Add a column to a table if it does not have it yet."""
+    columns = {c["name"] for c in inspect(db.engine).get_columns(table)}
+    if column not in columns:
+        db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+        logger.info("Added column %s.%s", table, column)
+
+
+def _add_precision_aggregates(db) -> None:
+    """Running precision totals on user_metrics, backfilled from search_session."""
+    _add_column(db, "user_metrics", "precision_at_5_sum", "FLOAT DEFAULT 0.0")
+    _add_column(db, "user_metrics", "precision_at_10_sum", "FLOAT DEFAULT 0.0")
+    _add_column(db, "user_metrics", "precision_session_count", "INTEGER DEFAULT 0")
+    db.session.execute(text("""
+            UPDATE user_metrics SET
+                precision_at_5_sum = COALESCE((
+                    SELECT SUM(s.precision_at_5) FROM search_session s
+                    WHERE s.user_id = user_metrics.user_id), 0.0),
+                precision_at_10_sum = COALESCE((
+                    SELECT SUM(s.precision_at_10) FROM search_session s
+                    WHERE s.user_id = user_metrics.user_id), 0.0),
+                precision_session_count = (
+                    SELECT COUNT(*) FROM search_session s
+                    WHERE s.user_id = user_metrics.user_id)
+            """))
+
+
+def _backfill_song_stats(db) -> None:
+    """Fill the user_song_stats table from the existing play history."""
+    from .metrics import SearchMetrics
+
+    SearchMetrics().backfill_song_stats()
+
+
+def _backfill_like_stats(db) -> None:
+    """Fill the album and artist like counters from the existing like history."""
+    from .metrics import SearchMetrics
+
+    SearchMetrics().backfill_like_stats()
+
+
+def _create_indexes(db, model) -> None:
+    """Create the indexes declared on a model's table that are missing."""
+    connection = db.session.connection()
+    for index in model.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def _add_interaction_columns(db) -> None:
+    """
+    Structured song/artist/album/track_id columns on user_interaction,
+    backfilled by parsing item_text, and the composite lookup indexes.
+    """
+    from .models import SearchSession, UserInteraction
+    from .utils import parse_item_text
+
+    for column in ("song", "artist", "album"):
+        _add_column(db, "user_interaction", column, "VARCHAR(200)")
+    _add_column(db, "user_interaction", "track_id", "VARCHAR(100)")
+
+    # Search queries are free text, not "Song by Artist" item texts
+    rows = db.session.execute(text("""
+            SELECT id, item_text, genre FROM user_interaction
+            WHERE song IS NULL AND interaction_type != 'search'
+            """)).all()
+    updates = []
+    for interaction_id, item_text, genre in rows:
+        parsed = parse_item_text(item_text)
+        updates.append(
+            {
+                "id": interaction_id,
+                "song": parsed["song"],
+                "artist": parsed["artist"],
+                "album": parsed["album"],
+                "genre": genre or parsed["genre"],
+            }
+        )
+    if updates:
+        db.session.execute(
+            text(
+                "UPDATE user_interaction SET song = :song, artist = :artist, "
+                "album = :album, genre = :genre WHERE id = :id"
+            ),
+            updates,
+        )
+    logger.info("Backfilled structured fields for %s interactions", len(updates))
+
+    _create_indexes(db, UserInteraction)
+    _create_indexes(db, SearchSession)
+
+
+# (version, description, migration) in the order they must be applied
+MIGRATIONS = [
+    (1, "precision aggregates on user_metrics", _add_precision_aggregates),
+    (2, "backfill user_song_stats from plays", _backfill_song_stats),
+    (3, "backfill album and artist like counters", _backfill_like_stats),
+    (4, "structured columns and indexes on user_interaction", _add_interaction_columns),
+]
+
+
+def run_migrations(db) -> list[int]:
+    """Apply every migration the database has not seen yet. Needs an app context."""
+    db.session.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations "
+            "(version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at DATETIME)"
+        )
+    )
+    applied = {
+        row[0]
+        for row in db.session.execute(text("SELECT version FROM schema_migrations"))
+    }
+
+    newly_applied = []
+    for version, description, migration in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info("Applying migration %s: %s", version, description)
+        try:
+            migration(db)
+            db.session.execute(
+                text(
+                    "INSERT INTO schema_migrations (version, description, applied_at) "
+                    "VALUES (:version, :description, :applied_at)"
+                ),
+                {
+                    "version": version,
+                    "description": description,
+                    "applied_at": datetime.now(),
+                },
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        newly_applied.append(version)
+
+    return newly_applied
@@ -1,26 +1,41 @@
 # type: ignore
 
 from datetime import datetime
+from typing import TYPE_CHECKING, Any
 
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import JSON, Column, DateTime, Float, ForeignKey, Integer, String
+from sqlalchemy import JSON, DateTime, Float, ForeignKey, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 db = SQLAlchemy()
 
 
-class User(UserMixin, db.Model):
-    id = Column(Integer, primary_key=True)
-    spotify_id = Column(String(100), unique=True, nullable=False)
-    display_name = Column(String(100))
-    email = Column(String(100))
-    profile_image = Column(String(200))
-    spotify_token = Column(String(200))
-    spotify_refresh_token = Column(String(200))
-    spotify_token_expiry = Column(DateTime)
-    user_embedding = Column(JSON)  # Store the user's profile embedding
-    last_updated = Column(DateTime, default=datetime.utcnow)
+class Model(db.Model):
+    """Base of the app's models."""
+
+    __abstract__ = True
+
+    if TYPE_CHECKING:
+        # flask_sqlalchemy's Model declares no __init__, so type checkers
+        # would reject the column keywords SQLAlchemy's constructor accepts
+        def __init__(self, **kwargs: Any) -> None: ...
+
+
+class User(UserMixin, Model):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    spotify_id: Mapped[str] = mapped_column(String(100), unique=True, nullable=False)
+    display_name: Mapped[str | None] = mapped_column(String(100))
+    email: Mapped[str | None] = mapped_column(String(100))
+    profile_image: Mapped[str | None] = mapped_column(String(200))
+    spotify_token: Mapped[str | None] = mapped_column(String(200))
+    spotify_refresh_token: Mapped[str | None] = mapped_column(String(200))
+    spotify_token_expiry: Mapped[datetime | None] = mapped_column(DateTime)
+    # Store the user's profile embedding
+    user_embedding: Mapped[Any] = mapped_column(JSON, nullable=True)
+    last_updated: Mapped[datetime | None] = mapped_column(
+        DateTime, default=datetime.utcnow
+    )
 
     # Relationships
     interactions = relationship("UserInteraction", back_populates="user")
@@ -28,9 +43,12 @@ class User(UserMixin, db.Model):
     metrics = relationship("UserMetrics", back_populates="user", uselist=False)
     genre_stats = relationship("UserGenreStats", back_populates="user")
     artist_stats = relationship("UserArtistStats", back_populates="user")
+    song_stats = relationship("UserSongStats", back_populates="user")
+    album_like_stats = relationship("UserAlbumLikeStats", back_populates="user")
+    artist_like_stats = relationship("UserArtistLikeStats", back_populates="user")
 
 
-class UserInteraction(db.Model):
+class UserInteraction(Model):
     __tablename__ = "user_interaction"
 
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -58,13 +76,28 @@ class UserInteraction(db.Model):
         String(100), nullable=True
     )  # Genre of the track for play interactions
 
+    # Structured parts of item_text, so queries don't have to parse it
+    track_id: Mapped[str | None] = mapped_column(
+        String(100), nullable=True
+    )  # Spotify track ID, when known
+    song: Mapped[str | None] = mapped_column(String(200), nullable=True)
+    artist: Mapped[str | None] = mapped_column(String(200), nullable=True)
+    album: Mapped[str | None] = mapped_column(String(200), nullable=True)
+
     # Relationships
     user = relationship("User", back_populates="interactions")
     session = relationship("SearchSession", back_populates="interactions")
 
+    # Indexes for the per-user history, per-type and per-session lookups
+    __table_args__ = (
+        db.Index("ix_user_interaction_user_timestamp", "user_id", "timestamp"),
+        db.Index("ix_user_interaction_user_type", "user_id", "interaction_type"),
+        db.Index("ix_user_interaction_user_session", "user_id", "session_id"),
+    )
+
 
 # New model for search sessions
-class SearchSession(db.Model):
+class SearchSession(Model):
     __tablename__ = "search_session"
 
     session_id: Mapped[str] = mapped_column(String(100), primary_key=True)
@@ -78,9 +111,14 @@ class SearchSession(db.Model):
     user = relationship("User", back_populates="search_sessions")
     interactions = relationship("UserInteraction", back_populates="session")
 
+    # Index for the latest/recent sessions of a user
+    __table_args__ = (
+        db.Index("ix_search_session_user_timestamp", "user_id", "timestamp"),
+    )
+
 
 # New model for user metrics
-class UserMetrics(db.Model):
+class UserMetrics(Model):
     __tablename__ = "user_metrics"
 
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -103,12 +141,18 @@ class UserMetrics(db.Model):
     most_liked_artist: Mapped[str | None] = mapped_column(String(200), nullable=True)
     most_liked_artist_count: Mapped[int] = mapped_column(Integer, default=0)
 
+    # Running totals of the search session precisions, so the averages can be
+    # read without loading every session
+    precision_at_5_sum: Mapped[float] = mapped_column(Float, default=0.0)
+    precision_at_10_sum: Mapped[float] = mapped_column(Float, default=0.0)
+    precision_session_count: Mapped[int] = mapped_column(Integer, default=0)
+
     # Relationship
     user = relationship("User", back_populates="metrics")
 
 
 # New model for tracking genre statistics
-class UserGenreStats(db.Model):
+class UserGenreStats(Model):
     __tablename__ = "user_genre_stats"
 
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -130,7 +174,7 @@ class UserGenreStats(db.Model):
 
 
 # New model for tracking artist statistics
-class UserArtistStats(db.Model):
+class UserArtistStats(Model):
     __tablename__ = "user_artist_stats"
 
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -149,3 +193,93 @@ class UserArtistStats(db.Model):
     __table_args__ = (
         db.UniqueConstraint("user_id", "artist", name="unique_user_artist"),
     )
+
+
+# Per-song play totals, so the most played song never scans the play history
+class UserSongStats(Model):
+    __tablename__ = "user_song_stats"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable=False)
+    # Normalized (lowercase, single-spaced) song and artist used as the key
+    song_key: Mapped[str] = mapped_column(String(200), nullable=False)
+    artist_key: Mapped[str] = mapped_column(String(200), nullable=False)
+    # Song and artist as last played, for display
+    song: Mapped[str] = mapped_column(String(200), nullable=False)
+    artist: Mapped[str] = mapped_column(String(200), nullable=False)
+    play_count: Mapped[int] = mapped_column(Integer, default=0)
+    total_duration: Mapped[float] = mapped_column(
+        Float, default=0.0
+    )  # Total play duration in seconds
+    last_played: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    # Relationship
+    user = relationship("User", back_populates="song_stats")
+
+    # One row per user-song-artist combination
+    __table_args__ = (
+        db.UniqueConstraint(
+            "user_id", "song_key", "artist_key", name="unique_user_song"
+        ),
+    )
+
+
+# Per-album like counts, so the most liked album never scans the like history
+class UserAlbumLikeStats(Model):
+    __tablename__ = "user_album_like_stats"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable=False)
+    # Normalized (lowercase, single-spaced) album and artist used as the key
+    album_key: Mapped[str] = mapped_column(String(200), nullable=False)
+    artist_key: Mapped[str] = mapped_column(String(200), nullable=False)
+    # Album and artist as last liked, for display
+    album: Mapped[str] = mapped_column(String(200), nullable=False)
+    artist: Mapped[str] = mapped_column(String(200), nullable=False)
+    like_count: Mapped[int] = mapped_column(Integer, default=0)
+    last_liked: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    # Relationship
+    user = relationship("User", back_populates="album_like_stats")
+
+    # One row per user-album-artist combination
+    __table_args__ = (
+        db.UniqueConstraint(
+            "user_id", "album_key", "artist_key", name="unique_user_album_like"
+        ),
+    )
+
+
+# Per-artist like counts, so the most liked artist never scans the like history
+class UserArtistLikeStats(Model):
+    __tablename__ = "user_artist_like_stats"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable=False)
+    # Normalized (lowercase, single-spaced) artist used as the key
+    artist_key: Mapped[str] = mapped_column(String(200), nullable=False)
+    # Artist as last liked, for display
+    artist: Mapped[str] = mapped_column(String(200), nullable=False)
+    like_count: Mapped[int] = mapped_column(Integer, default=0)
+    last_liked: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    # Relationship
+    user = relationship("User", back_populates="artist_like_stats")
+
+    # One row per user-artist combination
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "artist_key", name="unique_user_artist_like"),
+    )
+
+
+# Lyrics fetched from the lyrics API, including misses (lyrics is None)
+class LyricsCacheEntry(Model):
+    __tablename__ = "lyrics_cache"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # Normalized (lowercase, single-spaced) "artist|title"
+    key: Mapped[str] = mapped_column(String(400), unique=True, nullable=False)
+    lyrics: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # "found", "not_found" or "error"; misses are retried after a cooldown
+    status: Mapped[str] = mapped_column(String(20), nullable=False)
+    fetched_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,76 @@
+import logging
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = "X-DB-Query-Count"
+
+
+def get_query_count() -> int:
+    """Number of SQL statements executed so far in the current request."""
+    return g.get("db_query_count", 0)
+
+
+def init_query_stats(app, db, log_endpoints=("latest_metrics",)) -> None:
+    """
+    Count and time the SQL statements each request executes.
+
+    The count is returned in the X-DB-Query-Count response header and logged
+    for the endpoints in `log_endpoints` (the polled dashboard refresh). The
+    time adds up in `g.db_seconds`, reported as `db` in the Server-Timing
+    header (see timing.py).
+    """
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        # On the statement's context, which is dropped with it if it fails
+        context._query_start_time = time.perf_counter()
+        if has_request_context():
+            g.db_query_count = get_query_count() + 1
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_start_time
+        if has_request_context():
+            g.db_seconds = g.get("db_seconds", 0.0) + elapsed
+
+    @app.after_request
+    def add_query_count_header(response):
+        query_count = get_query_count()
+        response.headers[QUERY_COUNT_HEADER] = str(query_count)
+        if request.endpoint in log_endpoints:
+            logger.info("%s executed %s SQL queries", request.endpoint, query_count)
+        return response
+
+
+def explain_queries(db, run) -> list[tuple[str, list[str]]]:
+    """
+    Capture the SELECT statements `run()` executes and return each one with
+    its EXPLAIN QUERY PLAN lines (SQLite), to check the hot queries use indexes.
+    """
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    engine = db.engine
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        run()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    plans = []
+    connection = db.session.connection()
+    for statement, parameters in statements:
+        rows = connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        ).all()
+        plans.append((statement, [row[-1] for row in rows]))
+    return plans
@@ -0,0 +1,240 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+CURRENTLY_PLAYING_TTL_SECONDS = 1.5
+
+# Catalog data is the same for every user and rarely changes; artists carry
+# follower counts and popularity, so they are refreshed more often
+CATALOG_TTL_SECONDS = {
+    "track": 24 * 3600,
+    "album": 24 * 3600,
+    "artist": 6 * 3600,
+    "search": 3600,
+}
+CATALOG_MAX_ENTRIES = 5000
+
+# A user's top tracks and artists change slowly
+TOP_ITEMS_TTL_SECONDS = {"top_tracks": 10 * 60, "top_artists": 10 * 60}
+TOP_ITEMS_MAX_ENTRIES = 2000
+
+
+class CurrentlyPlayingCache:
+    """
+    Per-user, single-flight cache of the currently-playing state.
+
+    Within `ttl` seconds of the last Spotify call, requests are answered from
+    the cache with `progress` advanced by the time elapsed if the track is
+    playing. When the entry is stale, only one request per user calls
+    Spotify; concurrent requests for that user wait for its answer.
+
+    Only users fetched within the last `ttl` seconds are kept: expired
+    entries are dropped as new ones come in, and a user's lock is dropped
+    once the fetch is done.
+    """
+
+    def __init__(self, ttl: float = CURRENTLY_PLAYING_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._user_locks = {}  # user_id -> lock held while calling Spotify
+        # user_id -> (state, fetched_at), oldest fetch first
+        self._entries = OrderedDict()
+        self.upstream_calls = 0
+        self.calls_avoided = 0
+
+    def get(self, user_id: int, fetch) -> dict:
+        """Return the user's state, calling `fetch()` only if the cache is stale."""
+        state = self._get_fresh(user_id)
+        if state is not None:
+            return state
+
+        with self._lock:
+            user_lock = self._user_locks.setdefault(user_id, threading.Lock())
+        with user_lock:
+            # Another request may have refreshed the entry while we waited
+            state = self._get_fresh(user_id)
+            if state is not None:
+                return state
+
+            with self._lock:
+                self.upstream_calls += 1
+            try:
+                state = fetch()
+                with self._lock:
+                    self._store(user_id, state)
+                return copy.deepcopy(state)
+            finally:
+                with self._lock:
+                    # Later requests find the fresh entry, so the lock is not kept
+                    if self._user_locks.get(user_id) is user_lock:
+                        del self._user_locks[user_id]
+
+    def _store(self, user_id: int, state: dict) -> None:
+        """Save a fetched state and drop the expired entries. Needs self._lock."""
+        now = time.monotonic()
+        self._entries.pop(user_id, None)
+        self._entries[user_id] = (state, now)
+        while self._entries:
+            _, fetched_at = next(iter(self._entries.values()))
+            if now - fetched_at < self.ttl:
+                break
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        """Forget the user's state, e.g. after changing playback."""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.upstream_calls + self.calls_avoided
+            return {
+                "upstream_calls": self.upstream_calls,
+                "calls_avoided": self.calls_avoided,
+                "hit_rate": self.calls_avoided / requests if requests else 0.0,
+            }
+
+    def _get_fresh(self, user_id: int) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if not entry:
+                return None
+            state, fetched_at = entry
+            elapsed = time.monotonic() - fetched_at
+            if elapsed >= self.ttl:
+                return None
+            self.calls_avoided += 1
+
+        state = copy.deepcopy(state)
+        if state.get("is_playing") and state.get("duration"):
+            # Interpolate the playback position locally between refreshes
+            state["progress"] = min(
+                state["progress"] + int(elapsed * 1000), state["duration"]
+            )
+        return state
+
+
+class TTLCache:
+    """
+    Responses cached with a TTL per kind and an LRU bound on the number of
+    entries, with hit statistics. Cached responses are shared, so callers
+    must not modify them. On a miss, only one request per key calls
+    upstream; concurrent requests for that key wait for its answer.
+    """
+
+    def __init__(self, max_entries: int, ttls: dict):
+        self.max_entries = max_entries
+        self.ttls = ttls
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (kind, key) -> (value, expires_at)
+        self._key_locks = {}  # (kind, key) -> lock held while calling upstream
+        self._stats = {
+            kind: {"hits": 0, "misses": 0, "upstream_seconds": 0.0}
+            for kind in self.ttls
+        }
+
+    def get(self, kind: str, key, fetch):
+        """Return the cached `kind` response for `key`, calling `fetch()` on a miss."""
+        cache_key = (kind, key)
+        found, value = self._get_fresh(cache_key)
+        if found:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(cache_key, threading.Lock())
+        try:
+            with key_lock:
+                # Another request may have fetched the value while we waited
+                found, value = self._get_fresh(cache_key)
+                if found:
+                    return value
+
+                start = time.perf_counter()
+                value = fetch()
+                elapsed = time.perf_counter() - start
+
+                with self._lock:
+                    self._stats[kind]["misses"] += 1
+                    self._stats[kind]["upstream_seconds"] += elapsed
+                    self._entries[cache_key] = (
+                        value,
+                        time.monotonic() + self.ttls[kind],
+                    )
+                    self._entries.move_to_end(cache_key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                return value
+        finally:
+            with self._lock:
+                if self._key_locks.get(cache_key) is key_lock:
+                    del self._key_locks[cache_key]
+
+    def _get_fresh(self, cache_key: tuple) -> tuple[bool, Any]:
+        """(True, value) if `cache_key` is cached and fresh, else (False, None)."""
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry and entry[1] > time.monotonic():
+                self._entries.move_to_end(cache_key)
+                self._stats[cache_key[0]]["hits"] += 1
+                return True, entry[0]
+        return False, None
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Hits, misses and hit rate per kind, with the mean upstream latency of
+        a miss and the upstream time the hits saved.
+        """
+        with self._lock:
+            stats: dict[str, Any] = {"entries": len(self._entries)}
+            for kind, counts in self._stats.items():
+                lookups = counts["hits"] + counts["misses"]
+                mean_latency = (
+                    counts["upstream_seconds"] / counts["misses"]
+                    if counts["misses"]
+                    else 0.0
+                )
+                stats[kind] = {
+                    "hits": counts["hits"],
+                    "misses": counts["misses"],
+                    "hit_rate": counts["hits"] / lookups if lookups else 0.0,
+                    "mean_upstream_ms": round(mean_latency * 1000, 1),
+                    "latency_saved_seconds": round(counts["hits"] * mean_latency, 3),
+                }
+            return stats
+
+
+class CatalogCache(TTLCache):
+    """
+    Spotify catalog responses (tracks, albums, artists and searches), shared
+    by all users since catalog data is not user-specific.
+    """
+
+    def __init__(self, max_entries: int = CATALOG_MAX_ENTRIES):
+        super().__init__(max_entries, CATALOG_TTL_SECONDS)
+
+    def track(self, sp, track_id: str) -> dict:
+        return self.get("track", track_id, lambda: sp.track(track_id))
+
+    def album(self, sp, album_id: str) -> dict:
+        return self.get("album", album_id, lambda: sp.album(album_id))
+
+    def artist(self, sp, artist_id: str) -> dict:
+        return self.get("artist", artist_id, lambda: sp.artist(artist_id))
+
+    def artist_top_tracks(self, sp, artist_id: str) -> dict:
+        return self.get(
+            "artist", ("top_tracks", artist_id), lambda: sp.artist_top_tracks(artist_id)
+        )
+
+    def search(self, sp, q: str, type: str, limit: int) -> dict:
+        key = (type, limit, " ".join(q.lower().split()))
+        return self.get("search", key, lambda: sp.search(q=q, type=type, limit=limit))
+
+
+class TopItemsCache(TTLCache):
+    """A user's merged top tracks and top artists, cached per user for minutes."""
+
+    def __init__(self, max_entries: int = TOP_ITEMS_MAX_ENTRIES):
+        super().__init__(max_entries, TOP_ITEMS_TTL_SECONDS)
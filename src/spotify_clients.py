@@ -0,0 +1,245 @@
+"""
+Pooled Spotify API clients.
+
+All clients share one keep-alive `requests.Session`, so calls to
+api.spotify.com reuse open TLS connections instead of handshaking per
+request. Each user's `spotipy.Spotify` wrapper is cached until their access
+token changes, and a background thread refreshes the tokens of recently
+active users shortly before they expire, keeping the refresh off the
+request path.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+
+import requests
+import spotipy
+from requests.adapters import HTTPAdapter
+from spotipy.cache_handler import MemoryCacheHandler
+from spotipy.oauth2 import SpotifyOAuth
+from urllib3.util.retry import Retry
+
+from .models import User, db
+from .timing import span
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = 32
+# Threads of each of the two executors behind map and map_with_deadline
+FAN_OUT_WORKERS = 16
+REFRESH_MARGIN = timedelta(minutes=5)
+REFRESH_INTERVAL_SECONDS = 60
+# Users who made a Spotify call this recently keep their token refreshed
+ACTIVE_WINDOW_SECONDS = 30 * 60
+
+
+class KeepAliveSession(requests.Session):
+    """
+    A session shared by every client. spotipy closes its session when a
+    client is garbage collected, which would drop the shared connection pool.
+    """
+
+    def close(self):
+        pass
+
+    def request(self, *args, **kwargs):
+        # Every Spotify API call of a request shows up in its Server-Timing
+        with span("spotify_api"):
+            return super().request(*args, **kwargs)
+
+
+def create_session(pool_size: int = POOL_SIZE) -> requests.Session:
+    """Keep-alive session with the retry policy spotipy uses for its own sessions."""
+    session = KeepAliveSession()
+    retry = Retry(
+        total=3,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+        status=3,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        respect_retry_after_header=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def to_naive_utc(value: datetime | None) -> datetime | None:
+    """Token expiries are compared as naive UTC, as SQLite stores them."""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class SpotifyOAuthWithTokenUrl(SpotifyOAuth):
+    """SpotifyOAuth whose token URL can point at another host, such as the stub."""
+
+    # spotipy's Literal default would reject any other URL
+    OAUTH_TOKEN_URL: str = SpotifyOAuth.OAUTH_TOKEN_URL
+
+
+class SpotifyClientManager:
+    def __init__(self, app, pool_size: int = POOL_SIZE):
+        self.app = app
+        self.session = create_session(pool_size)
+        # Another host serving the Spotify API, such as the local stub
+        self.api_url = (app.config.get("SPOTIFY_API_URL") or "").rstrip("/") or None
+        self.oauth = SpotifyOAuthWithTokenUrl(
+            client_id=app.config["SPOTIFY_CLIENT_ID"],
+            client_secret=app.config["SPOTIFY_CLIENT_SECRET"],
+            redirect_uri=app.config["SPOTIFY_REDIRECT_URI"],
+            scope=app.config["SPOTIFY_SCOPE"],
+            # Tokens live in the database, not in a shared .cache file
+            cache_handler=MemoryCacheHandler(),
+            # spotipy infers bool from the default, but documents a Session too
+            requests_session=self.session,  # pyright: ignore[reportArgumentType]
+        )
+        if self.api_url:
+            self.oauth.OAUTH_TOKEN_URL = f"{self.api_url}/api/token"
+        self._lock = threading.Lock()
+        self._clients = {}  # user_id -> (access token, client)
+        self._last_used = {}  # user_id -> time.monotonic() of the last call
+        self._refresh_locks = {}  # user_id -> lock held while refreshing
+        self._refresher = None
+        # Bounded, and together no larger than the connection pool. The
+        # deadline-bound lookups get their own threads, so a slow fan-out
+        # never queues them behind its calls (nor the reverse).
+        fan_out_workers = max(1, min(FAN_OUT_WORKERS, pool_size // 2))
+        self.executor = ThreadPoolExecutor(
+            max_workers=fan_out_workers, thread_name_prefix="spotify"
+        )
+        self.deadline_executor = ThreadPoolExecutor(
+            max_workers=fan_out_workers, thread_name_prefix="spotify-deadline"
+        )
+
+    def client_for(self, user) -> spotipy.Spotify:
+        """The user's client, refreshing the token inline only if it already expired."""
+        self._start_refresher()
+        expiry = to_naive_utc(user.spotify_token_expiry)
+        if expiry and expiry <= datetime.utcnow():
+            self.refresh(user)
+
+        with self._lock:
+            self._last_used[user.id] = time.monotonic()
+            cached = self._clients.get(user.id)
+            if cached and cached[0] == user.spotify_token:
+                return cached[1]
+            client = self.client_for_token(user.spotify_token)
+            self._clients[user.id] = (user.spotify_token, client)
+            return client
+
+    def map(self, fn, items) -> list:
+        """Call `fn` on every item concurrently; results are in the order of `items`."""
+        with span("spotify_fan_out"):
+            return list(self.executor.map(fn, items))
+
+    def map_with_deadline(self, fn, keys, timeout: float) -> tuple[dict, dict, list]:
+        """
+        Call `fn(key)` for every key concurrently, waiting at most `timeout`
+        seconds. Returns the results and the errors by key, and the keys still
+        pending at the deadline. Pending calls that have not started are
+        cancelled, so they take no thread from later requests; the running
+        ones finish in the background.
+        """
+        with span("spotify_fan_out"):
+            futures = {key: self.deadline_executor.submit(fn, key) for key in keys}
+            wait(futures.values(), timeout=timeout)
+
+        results, errors, pending = {}, {}, []
+        for key, future in futures.items():
+            if not future.done():
+                future.cancel()
+                pending.append(key)
+            elif future.exception() is not None:
+                errors[key] = future.exception()
+            else:
+                results[key] = future.result()
+        return results, errors, pending
+
+    def client_for_token(self, access_token: str) -> spotipy.Spotify:
+        """An uncached client on the shared session, e.g. during login."""
+        client = spotipy.Spotify(
+            auth=access_token,
+            # spotipy infers bool from the default, but documents a Session too
+            requests_session=self.session,  # pyright: ignore[reportArgumentType]
+        )
+        if self.api_url:
+            client.prefix = f"{self.api_url}/v1/"
+        return client
+
+    def refresh(self, user) -> None:
+        """Refresh the user's access token unless another thread just did."""
+        with self._lock:
+            refresh_lock = self._refresh_locks.setdefault(user.id, threading.Lock())
+        with refresh_lock:
+            db.session.refresh(user)
+            expiry = to_naive_utc(user.spotify_token_expiry)
+            if expiry and expiry > datetime.utcnow() + REFRESH_MARGIN:
+                return
+
+            token_info = self.oauth.refresh_access_token(user.spotify_refresh_token)
+            user.spotify_token = token_info["access_token"]
+            # Spotify may rotate the refresh token
+            user.spotify_refresh_token = (
+                token_info.get("refresh_token") or user.spotify_refresh_token
+            )
+            user.spotify_token_expiry = datetime.utcnow() + timedelta(
+                seconds=token_info["expires_in"]
+            )
+            db.session.commit()
+            logger.info("Refreshed Spotify token for user %s", user.id)
+
+    def refresh_due_tokens(self) -> int:
+        """Refresh the tokens of active users that expire within the margin."""
+        cutoff = time.monotonic() - ACTIVE_WINDOW_SECONDS
+        with self._lock:
+            active_user_ids = [
+                user_id
+                for user_id, last_used in self._last_used.items()
+                if last_used >= cutoff
+            ]
+            for user_id in set(self._last_used) - set(active_user_ids):
+                self._last_used.pop(user_id)
+                self._clients.pop(user_id, None)
+        if not active_user_ids:
+            return 0
+
+        due_users = User.query.filter(
+            User.id.in_(active_user_ids),
+            User.spotify_refresh_token.isnot(None),
+            User.spotify_token_expiry < datetime.utcnow() + REFRESH_MARGIN,
+        ).all()
+        for user in due_users:
+            try:
+                self.refresh(user)
+            except Exception as e:
+                logger.error(
+                    "Error refreshing Spotify token for user %s: %s", user.id, e
+                )
+                db.session.rollback()
+        return len(due_users)
+
+    def _start_refresher(self) -> None:
+        # Started on first use, so each server process (e.g. after a fork) runs its own
+        with self._lock:
+            if self._refresher and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name="spotify-token-refresher", daemon=True
+            )
+            self._refresher.start()
+
+    def _refresh_loop(self) -> None:
+        while True:
+            time.sleep(REFRESH_INTERVAL_SECONDS)
+            try:
+                with self.app.app_context():
+                    self.refresh_due_tokens()
+            except Exception as e:
+                logger.error("Spotify token refresher failed: %s", e)
@@ -0,0 +1,371 @@
+"""
+A local stand-in for the Spotify Web API, for exercising the Spotify code
+paths without network access or credentials.
+
+Serves the token endpoint, track, artist and album search and lookups,
+and the user endpoints the app calls (profile, currently playing, top
+items, playback controls), for any access token. Search results are
+generated from the query: `track:"T" artist:"A"` returns a track titled T
+by A, with an id derived from both, and `isrc:X` returns a track carrying
+that ISRC. A share of queries (`--miss-rate`) deterministically match
+nothing, `--rate-limit` answers 429 with a Retry-After header once more
+than that many requests arrive in one second, and `--latency-ms` delays
+every API response like a round trip to Spotify would.
+
+    uv run src/spotify_stub.py --port 8901
+
+then point a client at it, e.g. `--spotify-api-url http://localhost:8901`.
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIELD_PATTERN = re.compile(r'(\w+):"([^"]*)"|(\w+):(\S+)')
+
+# (title, artist) of the tracks the stub user plays and has in their top items
+LIBRARY = [
+    ("Bohemian Rhapsody", "Queen"),
+    ("Billie Jean", "Michael Jackson"),
+    ("Smells Like Teen Spirit", "Nirvana"),
+    ("Hey Jude", "The Beatles"),
+    ("Like a Rolling Stone", "Bob Dylan"),
+    ("Hotel California", "Eagles"),
+    ("Superstition", "Stevie Wonder"),
+    ("Wonderwall", "Oasis"),
+    ("Rolling in the Deep", "Adele"),
+    ("Purple Rain", "Prince"),
+]
+GENRES = ["rock", "pop", "soul", "indie", "folk"]
+
+
+def stub_track_id(*parts: str) -> str:
+    """A stable 22-character id, like Spotify's base62 ids."""
+    digest = hashlib.sha1("|".join(parts).lower().encode()).hexdigest()
+    return digest[:22]
+
+
+def stub_track(track_id: str, name: str, artist: str, isrc: str | None = None) -> dict:
+    return {
+        "id": track_id,
+        "type": "track",
+        "uri": f"spotify:track:{track_id}",
+        "name": name,
+        "duration_ms": 180000,
+        "popularity": 50,
+        "preview_url": f"https://p.scdn.co/mp3-preview/{track_id}",
+        "external_ids": {"isrc": isrc} if isrc else {},
+        "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+        "artists": [
+            {"id": stub_track_id("artist", artist), "name": artist, "type": "artist"}
+        ],
+        "album": stub_album(artist, f"{name} (Single)"),
+    }
+
+
+def stub_album(artist: str, name: str) -> dict:
+    album_id = stub_track_id("album", artist, name)
+    return {
+        "id": album_id,
+        "type": "album",
+        "name": name,
+        "images": [{"url": f"https://i.scdn.co/image/{album_id}", "height": 640}],
+        "release_date": "2000-01-01",
+        "artists": [{"id": stub_track_id("artist", artist), "name": artist}],
+        "external_urls": {"spotify": f"https://open.spotify.com/album/{album_id}"},
+    }
+
+
+def stub_artist(artist_id: str, name: str) -> dict:
+    return {
+        "id": artist_id,
+        "type": "artist",
+        "name": name,
+        "genres": [GENRES[int(artist_id[:4], 16) % len(GENRES)]],
+        "images": [{"url": f"https://i.scdn.co/image/{artist_id}", "height": 640}],
+        "popularity": 50,
+        "external_urls": {"spotify": f"https://open.spotify.com/artist/{artist_id}"},
+    }
+
+
+def library_tracks() -> list:
+    return [
+        stub_track(stub_track_id(name, artist), name, artist)
+        for name, artist in LIBRARY
+    ]
+
+
+class SpotifyStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        miss_rate: float = 0.0,
+        rate_limit: int = 0,
+        latency_ms: float = 0.0,
+    ):
+        super().__init__(address, SpotifyStubHandler)
+        self.miss_rate = miss_rate
+        self.rate_limit = rate_limit
+        self.latency = latency_ms / 1000
+        self.library = library_tracks()
+        # track id -> track returned by an earlier search, or in the library
+        self.tracks = {track["id"]: track for track in self.library}
+        self.artists = {
+            artist["id"]: artist["name"]
+            for track in self.library
+            for artist in track["artists"]
+        }
+        self.started = time.monotonic()
+        self.request_count = 0
+        self.throttled_count = 0
+        self._lock = threading.Lock()
+        self._window = (0, 0)  # (second, requests in that second)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def admit(self) -> bool:
+        """Count the request; False if it exceeds the rate limit."""
+        with self._lock:
+            self.request_count += 1
+            if not self.rate_limit:
+                return True
+            second = int(time.monotonic())
+            count = self._window[1] + 1 if self._window[0] == second else 1
+            self._window = (second, count)
+            if count > self.rate_limit:
+                self.throttled_count += 1
+                return False
+            return True
+
+    def misses(self, query: str) -> bool:
+        digest = hashlib.sha1(query.lower().encode()).digest()
+        return digest[0] / 256 < self.miss_rate
+
+    def search_tracks(self, query: str) -> list:
+        if self.misses(query):
+            return []
+        fields = {}
+        for match in FIELD_PATTERN.finditer(query):
+            name = match.group(1) or match.group(3)
+            fields[name] = match.group(2) if match.group(1) else match.group(4)
+
+        if "isrc" in fields:
+            isrc = fields["isrc"]
+            track = stub_track(stub_track_id("isrc", isrc), f"Track {isrc}", "", isrc)
+        else:
+            name = fields.get("track") or FIELD_PATTERN.sub("", query).strip()
+            artist = fields.get("artist", "Unknown Artist")
+            track = stub_track(stub_track_id(name, artist), name, artist)
+        with self._lock:
+            self.tracks[track["id"]] = track
+            for artist in track["artists"]:
+                self.artists[artist["id"]] = artist["name"]
+        return [track]
+
+    def search(self, query: str, search_type: str, limit: int) -> dict:
+        if search_type == "artist":
+            name = FIELD_PATTERN.sub("", query).strip() or query
+            artist_id = stub_track_id("artist", name)
+            with self._lock:
+                self.artists[artist_id] = name
+            items = [] if self.misses(query) else [stub_artist(artist_id, name)]
+            return {"artists": {"items": items, "total": len(items)}}
+        if search_type == "album":
+            fields = dict(
+                (m.group(1) or m.group(3), m.group(2) or m.group(4))
+                for m in FIELD_PATTERN.finditer(query)
+            )
+            name = fields.get("album") or FIELD_PATTERN.sub("", query).strip()
+            artist = fields.get("artist", "Unknown Artist")
+            items = [] if self.misses(query) else [stub_album(artist, name)]
+            return {"albums": {"items": items, "total": len(items)}}
+        tracks = self.search_tracks(query)[:limit]
+        return {"tracks": {"items": tracks, "total": len(tracks)}}
+
+    def currently_playing(self) -> dict:
+        """The library on repeat, one track every 3 minutes."""
+        elapsed_ms = int((time.monotonic() - self.started) * 1000)
+        track = self.library[elapsed_ms // 180000 % len(self.library)]
+        return {
+            "is_playing": True,
+            "progress_ms": elapsed_ms % 180000,
+            "currently_playing_type": "track",
+            "item": track,
+        }
+
+
+class SpotifyStubHandler(BaseHTTPRequestHandler):
+    server: SpotifyStub
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict, headers: dict | None = None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_no_content(self):
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def admit(self) -> bool:
+        """Apply the rate limit and latency; False if the request was throttled."""
+        if not self.server.admit():
+            self.send_json(
+                429,
+                {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                headers={"Retry-After": "1"},
+            )
+            return False
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        return True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        path = urlparse(self.path).path
+        if path == "/api/token":
+            self.send_json(
+                200,
+                {
+                    "access_token": "stub-token",
+                    "token_type": "Bearer",
+                    "expires_in": 3600,
+                },
+            )
+        elif path.startswith("/v1/me/player/"):
+            if self.admit():
+                self.send_no_content()
+        else:
+            self.send_json(404, {"error": {"status": 404, "message": "Not found"}})
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if not urlparse(self.path).path.startswith("/v1/me/player/"):
+            self.send_json(404, {"error": {"status": 404, "message": "Not found"}})
+        elif self.admit():
+            self.send_no_content()
+
+    def do_GET(self):
+        if not self.admit():
+            return
+
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        limit = int(params.get("limit", 10))
+        if url.path == "/v1/search":
+            body = self.server.search(
+                params.get("q", ""), params.get("type", "track"), limit
+            )
+            self.send_json(200, body)
+        elif url.path.startswith("/v1/tracks/"):
+            track_id = url.path.rsplit("/", 1)[-1]
+            track = self.server.tracks.get(track_id) or stub_track(
+                track_id, f"Track {track_id}", "Unknown Artist"
+            )
+            self.send_json(200, track)
+        elif url.path.startswith("/v1/artists/"):
+            parts = url.path.split("/")
+            name = self.server.artists.get(parts[3], "Unknown Artist")
+            if parts[4:] == ["top-tracks"]:
+                tracks = [
+                    stub_track(stub_track_id(f"{name} {i}", name), f"Song {i}", name)
+                    for i in range(1, 11)
+                ]
+                self.send_json(200, {"tracks": tracks})
+            else:
+                self.send_json(200, stub_artist(parts[3], name))
+        elif url.path == "/v1/me":
+            self.send_json(
+                200,
+                {"id": "stub-user", "display_name": "Stub User", "images": []},
+            )
+        elif url.path in ("/v1/me/player/currently-playing", "/v1/me/player"):
+            self.send_json(200, self.server.currently_playing())
+        elif url.path == "/v1/me/top/tracks":
+            items = self.server.library[:limit]
+            self.send_json(200, {"items": items, "total": len(items)})
+        elif url.path == "/v1/me/top/artists":
+            items = [
+                stub_artist(track["artists"][0]["id"], track["artists"][0]["name"])
+                for track in self.server.library[:limit]
+            ]
+            self.send_json(200, {"items": items, "total": len(items)})
+        else:
+            self.send_json(404, {"error": {"status": 404, "message": "Not found"}})
+
+
+def start_stub(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    miss_rate: float = 0.0,
+    rate_limit: int = 0,
+    latency_ms: float = 0.0,
+) -> SpotifyStub:
+    """Serve the stub from a background thread; port 0 picks a free port."""
+    stub = SpotifyStub(
+        (host, port),
+        miss_rate=miss_rate,
+        rate_limit=rate_limit,
+        latency_ms=latency_ms,
+    )
+    threading.Thread(
+        target=stub.serve_forever, name="spotify-stub", daemon=True
+    ).start()
+    return stub
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local Spotify API stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument(
+        "--miss-rate",
+        type=float,
+        default=0.1,
+        help="Share of search queries that match nothing",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=int,
+        default=0,
+        help="Requests per second before answering 429 (0 for no limit)",
+    )
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=0,
+        help="Delay before every API response, in milliseconds",
+    )
+    args = parser.parse_args()
+
+    stub = SpotifyStub(
+        (args.host, args.port),
+        miss_rate=args.miss_rate,
+        rate_limit=args.rate_limit,
+        latency_ms=args.latency_ms,
+    )
+    print(f"Spotify API stub listening on {stub.url}")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        print(
+            f"Served {stub.request_count} requests ({stub.throttled_count} throttled)."
+        )
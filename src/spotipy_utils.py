@@ -12,6 +12,34 @@ def format_track_data(track: dict) -> dict:
     }
 
 
+def format_currently_playing(current_track: dict | None) -> dict:
+    result = {
+        "track_name": None,
+        "artist_name": None,
+        "image": None,
+        "is_playing": False,
+        "progress": 0,
+        "duration": 0,
+        "track_id": None,
+    }
+    if current_track is None:
+        return result
+
+    item = current_track.get("item") or {}
+    result.update(
+        {
+            "track_name": item.get("name", "Unknown"),
+            "artist_name": item.get("artists", [{}])[0].get("name", "Unknown"),
+            "image": item.get("album", {}).get("images", [{}])[0].get("url", None),
+            "is_playing": current_track.get("is_playing", False),
+            "progress": current_track.get("progress_ms", 0),
+            "duration": item.get("duration_ms", 0),
+            "track_id": item.get("id", None),
+        }
+    )
+    return result
+
+
 def format_album_data(album: dict) -> dict:
     return {
         "id": album["id"],
@@ -0,0 +1,195 @@
+"""
+Timing spans for requests and batch jobs.
+
+`with span("es_search"):` times a block of code. Every span is observed in
+the `stage_duration_seconds` histogram served by `/metrics`, labelled with
+the component (the request's endpoint, or the job name) and the stage.
+Within a request the spans also add up per stage into the `Server-Timing`
+response header, next to the time spent in SQL queries (`db`, timed by
+query_stats.py) and the whole request (`total`). Nested spans are included in the time of their parent.
+
+With several worker processes, set PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py
+does) so `/metrics` aggregates the histograms of all workers.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    write_to_textfile,
+)
+
+BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+# Batch jobs time whole chunks, which take far longer than request stages
+JOB_BUCKETS = BUCKETS[4:] + (60.0, 120.0, 300.0, 600.0)
+
+STAGE_SECONDS = Histogram(
+    "stage_duration_seconds",
+    "Time spent in one stage of a request or batch job",
+    ["component", "stage"],
+    buckets=BUCKETS,
+)
+JOB_STAGE_SECONDS = Histogram(
+    "job_stage_duration_seconds",
+    "Time spent in one stage of a batch job",
+    ["component", "stage"],
+    buckets=JOB_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle a request, by endpoint",
+    ["endpoint", "method", "status"],
+    buckets=BUCKETS,
+)
+
+# Component of spans outside a request, set by batch jobs
+_job_name = None
+
+
+def start_job(name: str) -> None:
+    """Label the spans of this process (a batch job) with `name`."""
+    global _job_name
+    _job_name = name
+
+
+@contextmanager
+def span(stage: str):
+    """Time the block as `stage` of the current request or job."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def observe(stage: str, elapsed: float) -> None:
+    """Record `elapsed` seconds spent in `stage`, as a span would."""
+    if has_request_context():
+        STAGE_SECONDS.labels(request.endpoint or "unknown", stage).observe(elapsed)
+        timings = g.setdefault("span_timings", {})
+        timings[stage] = timings.get(stage, 0.0) + elapsed
+    elif _job_name:
+        JOB_STAGE_SECONDS.labels(_job_name, stage).observe(elapsed)
+    else:
+        STAGE_SECONDS.labels("background", stage).observe(elapsed)
+
+
+def timed_iter(iterable, stage: str, chunk_size: int = 1):
+    """
+    Yield the items of `iterable`, recording the time spent producing each
+    `chunk_size` items as one `stage` span. For lazy inputs (parsers,
+    generators) whose work is interleaved with the consumer's.
+    """
+    iterator = iter(iterable)
+    elapsed, count = 0.0, 0
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            break
+        finally:
+            elapsed += time.perf_counter() - start
+        yield item
+        count += 1
+        if count == chunk_size:
+            observe(stage, elapsed)
+            elapsed, count = 0.0, 0
+    if count:
+        observe(stage, elapsed)
+
+
+def server_timing_header(timings: dict) -> str:
+    return ", ".join(
+        f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()
+    )
+
+
+def metrics_registry():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def init_timing(app) -> None:
+    """
+    Time every request, add the Server-Timing header and serve the
+    histograms at /metrics.
+    """
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def add_server_timing(response):
+        total = time.perf_counter() - g.get("request_started", time.perf_counter())
+        timings = dict(g.get("span_timings", {}))
+        if "db_seconds" in g:
+            timings["db"] = g.db_seconds
+        timings["total"] = total
+        response.headers["Server-Timing"] = server_timing_header(timings)
+
+        REQUEST_SECONDS.labels(
+            request.endpoint or "unknown", request.method, response.status_code
+        ).observe(total)
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        """Histograms in the Prometheus text format."""
+        return Response(
+            generate_latest(metrics_registry()), content_type=CONTENT_TYPE_LATEST
+        )
+
+
+def job_summary() -> list[tuple[str, int, float]]:
+    """(stage, count, total seconds) of this job's spans, slowest first."""
+    stages = {}
+    for metric in JOB_STAGE_SECONDS.collect():
+        for sample in metric.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_count"):
+                stages.setdefault(stage, [0, 0.0])[0] = int(sample.value)
+            elif sample.name.endswith("_sum"):
+                stages.setdefault(stage, [0, 0.0])[1] = sample.value
+    return sorted(
+        ((stage, count, total) for stage, (count, total) in stages.items()),
+        key=lambda item: -item[2],
+    )
+
+
+def report_job(metrics_file: str | None = None) -> None:
+    """Print where the job's time went; optionally save the histograms."""
+    print("\nTime by stage:")
+    for stage, count, total in job_summary():
+        print(f"  {stage:<24} {total:>9.2f}s over {count} calls")
+    if metrics_file:
+        # Prometheus text format, e.g. for the node exporter's textfile collector
+        write_to_textfile(metrics_file, REGISTRY)
+        print(f"Saved the stage histograms to {metrics_file}")
@@ -4,11 +4,12 @@ import logging
 from datetime import datetime, timedelta
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from sqlalchemy import desc
 
+from src.embeddings import get_model
 from src.models import User, UserInteraction, db
-from src.utils import remove_html_tags
+from src.timing import span
+from src.utils import parse_item_text, remove_html_tags
 
 # Constants
 QUERY_WEIGHT = 0.67
@@ -22,11 +23,10 @@ logger = logging.getLogger(__name__)
 
 
 class UserProfileManager:
-    def __init__(self):
-        self.model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-        logger.info(
-            "UserProfileManager initialized with model: sentence-transformers/all-MiniLM-L6-v2"
-        )
+    @property
+    def model(self):
+        # Shared with the rest of the app and loaded on first use
+        return get_model()
 
     def track_interaction(
         self, user_id, interaction_type, item_text=None, duration=None, item_type="song"
@@ -49,17 +49,27 @@ class UserProfileManager:
 
         if not item_text:
             logger.error(
-                f"Missing item_text for user {user_id}, interaction {interaction_type}"
+                "Missing item_text for user %s, interaction %s",
+                user_id,
+                interaction_type,
             )
             raise ValueError("item_text is required for embedding generation")
 
         # Clean the item text by removing HTML tags
         clean_item_text = remove_html_tags(item_text)
         logger.info(
-            f"Tracking {interaction_type} interaction for user {user_id}: {item_type} - {clean_item_text[:30]}..."
+            "Tracking %s interaction for user %s: %s - %s...",
+            interaction_type,
+            user_id,
+            item_type,
+            clean_item_text[:30],
         )
 
-        # Create a new interaction with all required fields
+        # Create a new interaction with all required fields; search queries
+        # are free text, so only item texts are split into song/artist/album
+        parsed = parse_item_text(
+            clean_item_text if interaction_type != "search" else None
+        )
         interaction = UserInteraction(
             user_id=user_id,
             interaction_type=interaction_type,
@@ -67,14 +77,22 @@ class UserProfileManager:
             item_text=clean_item_text,
             duration=duration or 0,
             relevance_score=self._calculate_relevance_score(interaction_type, duration),
+            song=parsed["song"],
+            artist=parsed["artist"],
+            album=parsed["album"],
+            genre=parsed["genre"],
         )
 
-        db.session.add(interaction)
-        db.session.commit()
+        with span("interaction_commit"):
+            db.session.add(interaction)
+            db.session.commit()
         logger.info(
-            f"Saved interaction {interaction.id} with relevance {interaction.relevance_score:.2f}"
+            "Saved interaction %s with relevance %.2f",
+            interaction.id,
+            interaction.relevance_score,
         )
-        self._update_user_embedding(user_id)
+        with span("update_embedding"):
+            self._update_user_embedding(user_id)
 
     def _calculate_relevance_score(self, interaction_type, duration=None):
         """Calculate implicit feedback score based on interaction type and duration."""
@@ -88,13 +106,9 @@ class UserProfileManager:
 
         return min(score, 1.0)
 
-    def _update_user_embedding(self, user_id):
-        """Update user's profile embedding based on recent interactions."""
-        current_time = datetime.now()
-        cutoff_date = current_time - timedelta(days=RECENT_DAYS_THRESHOLD)
-
-        # Get recent interactions (last 30 days)
-        recent_interactions = (
+    def get_recent_interactions(self, user_id, cutoff_date):
+        """Get the user's interactions since `cutoff_date`, newest first."""
+        return (
             db.session.query(UserInteraction)
             .filter(
                 UserInteraction.user_id == user_id,
@@ -104,14 +118,25 @@ class UserProfileManager:
             .all()
         )
 
+    def _update_user_embedding(self, user_id):
+        """Update user's profile embedding based on recent interactions."""
+        current_time = datetime.now()
+        cutoff_date = current_time - timedelta(days=RECENT_DAYS_THRESHOLD)
+
+        # Get recent interactions (last 30 days)
+        recent_interactions = self.get_recent_interactions(user_id, cutoff_date)
+
         if not recent_interactions:
             logger.info(
-                f"No recent interactions found for user {user_id}, skipping embedding update"
+                "No recent interactions found for user %s, skipping embedding update",
+                user_id,
             )
             return
 
         logger.info(
-            f"Updating embedding for user {user_id} with {len(recent_interactions)} recent interactions"
+            "Updating embedding for user %s with %s recent interactions",
+            user_id,
+            len(recent_interactions),
         )
 
         # Generate embeddings for each interaction
@@ -120,9 +145,10 @@ class UserProfileManager:
 
         for interaction in recent_interactions:
             # Generate embedding from the item text
-            embedding = self.model.encode(
-                interaction.item_text, normalize_embeddings=True
-            )
+            with span("interaction_encode"):
+                embedding = self.model.encode(
+                    interaction.item_text, normalize_embeddings=True
+                )
             embeddings.append(embedding)
 
             # Calculate weight based on recency and relevance
@@ -144,10 +170,13 @@ class UserProfileManager:
         user.user_embedding = user_embedding.tolist()
         user.last_updated = current_time
         logger.info(
-            f"Updated embedding for user {user_id} (shape: {len(user.user_embedding)})"
+            "Updated embedding for user %s (shape: %s)",
+            user_id,
+            len(user.user_embedding),
         )
-        logger.info(f"First 5 embedding values: {user.user_embedding[:5]}")
-        db.session.commit()
+        logger.debug("First 5 embedding values: %s", user.user_embedding[:5])
+        with span("embedding_commit"):
+            db.session.commit()
 
     def get_personalized_search_query(self, user_id, query):
         """Generate a personalized search query using user's profile embedding."""
@@ -157,29 +186,34 @@ class UserProfileManager:
         user = User.query.get(user_id)
         if not user or not user.user_embedding:
             logger.info(
-                f"No user embedding available for user {user_id}, using standard query"
+                "No user embedding available for user %s, using standard query", user_id
             )
             return clean_query
 
-        logger.info(f"Personalizing search query '{clean_query}' for user {user_id}")
+        logger.info("Personalizing search query '%s' for user %s", clean_query, user_id)
 
         # Generate embedding for the search query
-        query_embedding = np.array(
-            self.model.encode(clean_query, normalize_embeddings=True)
-        )
+        with span("query_encode"):
+            query_embedding = np.array(
+                self.model.encode(clean_query, normalize_embeddings=True)
+            )
         user_embedding = np.array(user.user_embedding)
 
         # Combine query embedding with user profile embedding
         combined_embedding = (
             QUERY_WEIGHT * query_embedding + (1 - QUERY_WEIGHT) * user_embedding
         )
-        logger.debug(f"User embedding: {user.user_embedding}")
-        logger.debug(f"Query embedding: {query_embedding}")
-        logger.debug(f"User embedding shape: {user_embedding.shape}")
-        logger.debug(f"Query embedding shape: {query_embedding.shape}")
-        logger.debug(f"Combined embedding shape: {combined_embedding.shape}")
-        logger.debug(f"User embedding norm: {np.linalg.norm(user_embedding)}")
-        logger.debug(f"Query embedding norm: {np.linalg.norm(query_embedding)}")
-        logger.debug(f"Combined embedding norm: {np.linalg.norm(combined_embedding)}")
+        # The norms are computed for the log, so skip them unless it is read
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("User embedding: %s", user.user_embedding)
+            logger.debug("Query embedding: %s", query_embedding)
+            logger.debug("User embedding shape: %s", user_embedding.shape)
+            logger.debug("Query embedding shape: %s", query_embedding.shape)
+            logger.debug("Combined embedding shape: %s", combined_embedding.shape)
+            logger.debug("User embedding norm: %s", np.linalg.norm(user_embedding))
+            logger.debug("Query embedding norm: %s", np.linalg.norm(query_embedding))
+            logger.debug(
+                "Combined embedding norm: %s", np.linalg.norm(combined_embedding)
+            )
 
         return combined_embedding.tolist()
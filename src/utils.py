@@ -1,43 +1,97 @@
 import logging
 import re
+from urllib.parse import quote
 
 import requests
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
+GENRE_SUFFIX = re.compile(r"\s*\(Genre: (.*)\)\s*$")
+
+LYRICS_API_URL = "https://api.lyrics.ovh/v1"
+# (connect, read) seconds: a dead host fails fast, a slow lookup gets longer
+LYRICS_TIMEOUT = (3, 5)
+
+
+def create_lyrics_session(pool_size: int = 8) -> requests.Session:
+    """Keep-alive session for the lyrics API."""
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+    return session
+
+
+_lyrics_session = create_lyrics_session()
+
+
+def fetch_track_lyrics(artist_name, track_name, session=None):
+    """
+    Fetch the lyrics of a track from lyrics.ovh.
+
+    Returns (status, lyrics): "found" with the lyrics, "not_found" when the
+    API has none, or "error" when the lookup failed (e.g. timed out).
+    """
+    # Clean up track and artist names for better API matching
+    artist_name = (
+        artist_name.replace("&", "and").replace("feat.", "").replace("ft.", "").strip()
+    )
+    track_name = track_name.split("(")[0].split("-")[0].strip()
+    if not artist_name or not track_name:
+        return "not_found", None
 
-def get_track_lyrics(artist_name, track_name):
-    """Get lyrics for a specific track."""
     try:
-        # Clean up track and artist names for better API matching
-        artist_name = (
-            artist_name.replace("&", "and")
-            .replace("feat.", "")
-            .replace("ft.", "")
-            .strip()
+        response = (session or _lyrics_session).get(
+            f"{LYRICS_API_URL}/{quote(artist_name, safe='')}/{quote(track_name, safe='')}",
+            timeout=LYRICS_TIMEOUT,
         )
-        track_name = track_name.split("(")[0].split("-")[0].strip()
-
-        # Try to fetch lyrics using a public lyrics API
-        lyrics = None
-        try:
-            # Using lyrics.ovh API
-            response = requests.get(
-                f"https://api.lyrics.ovh/v1/{artist_name}/{track_name}", timeout=5
-            )
-            if response.status_code == 200:
-                lyrics = response.json().get("lyrics")
-                if lyrics:
-                    # Remove excess whitespace and empty lines
-                    lines = [line.strip() for line in lyrics.split("\n")]
-                    lyrics = "\n".join(line for line in lines if line)
-        except Exception as e:
-            logger.error(f"Error fetching lyrics from API: {str(e)}")
-
-        return lyrics
+        if response.status_code == 404:
+            return "not_found", None
+        response.raise_for_status()
+        lyrics = response.json().get("lyrics")
     except Exception as e:
-        logger.error(f"Error processing lyrics: {str(e)}")
-        return None
+        logger.error("Error fetching lyrics from API: %s", e)
+        return "error", None
+
+    if not lyrics:
+        return "not_found", None
+    # Remove excess whitespace and empty lines
+    lines = [line.strip() for line in lyrics.split("\n")]
+    return "found", "\n".join(line for line in lines if line)
+
+
+def parse_item_text(item_text):
+    """
+    Split an interaction's item text into its parts.
+
+    Item texts look like "Song by Artist from Album (Genre: Genre)", where the
+    album and genre parts are optional. Missing parts are returned as None.
+    """
+    parsed: dict[str, str | None] = {
+        "song": None,
+        "artist": None,
+        "album": None,
+        "genre": None,
+    }
+    if not item_text:
+        return parsed
+
+    text = item_text.strip()
+    genre_match = GENRE_SUFFIX.search(text)
+    if genre_match:
+        parsed["genre"] = genre_match.group(1).strip() or None
+        text = text[: genre_match.start()]
+
+    song, _, rest = text.partition(" by ")
+    artist, _, album = rest.partition(" from ")
+    parsed["song"] = song.strip() or None
+    parsed["artist"] = artist.strip() or None
+    parsed["album"] = album.strip() or None
+    return parsed
+
+
+def normalize_key(text):
+    """Case- and whitespace-insensitive key used to aggregate songs and artists."""
+    return " ".join((text or "").lower().split())
 
 
 def remove_html_tags(text):
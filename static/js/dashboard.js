@@ -104,9 +104,6 @@ document.addEventListener('DOMContentLoaded', function() {
                     }
                 }
             });
-
-            // Fetch initial genre data
-            fetchGenreStats();
         }
 
         // Initialize artist trends chart with empty data
@@ -150,81 +147,58 @@ document.addEventListener('DOMContentLoaded', function() {
                     }
                 }
             });
-
-            // Fetch initial artist data
-            fetchArtistStats();
         }
     }
 
-    async function fetchGenreStats() {
-        try {
-            const response = await fetch('/genre-stats');
-            if (response.ok) {
-                const data = await response.json();
-                if (data.success && genreChart) {
-                    if (data.labels.length === 0) {
-                        // If no data, show empty state
-                        genreChart.data.labels = ['No data yet'];
-                        genreChart.data.datasets[0].data = [1];
-                        genreChart.data.datasets[0].backgroundColor = ['#b3b3b3'];
-                    } else {
-                        // Update with real data
-                        genreChart.data.labels = data.labels;
-                        genreChart.data.datasets[0].data = data.data;
-                        genreChart.data.datasets[0].backgroundColor = [
-                            '#1DB954',  // Spotify green
-                            '#00ff00',  // Neon green
-                            '#191414',  // Spotify black
-                            '#b3b3b3',  // Spotify gray
-                            '#ffffff'   // White
-                        ];
-                    }
-                    genreChart.update();
-                }
+    function updateGenreChart(data) {
+        if (data && genreChart) {
+            if (data.labels.length === 0) {
+                // If no data, show empty state
+                genreChart.data.labels = ['No data yet'];
+                genreChart.data.datasets[0].data = [1];
+                genreChart.data.datasets[0].backgroundColor = ['#b3b3b3'];
             } else {
-                console.error('Error fetching genre stats:', response.statusText);
+                // Update with real data
+                genreChart.data.labels = data.labels;
+                genreChart.data.datasets[0].data = data.data;
+                genreChart.data.datasets[0].backgroundColor = [
+                    '#1DB954',  // Spotify green
+                    '#00ff00',  // Neon green
+                    '#191414',  // Spotify black
+                    '#b3b3b3',  // Spotify gray
+                    '#ffffff'   // White
+                ];
             }
-        } catch (error) {
-            console.error('Error fetching genre stats:', error);
+            genreChart.update();
         }
     }
 
-    async function fetchArtistStats() {
-        try {
-            const response = await fetch('/artist-stats');
-            if (response.ok) {
-                const data = await response.json();
-                if (data.success && artistChart) {
-                    if (data.labels.length === 0) {
-                        // If no data, show empty state
-                        artistChart.data.labels = ['No data yet'];
-                        artistChart.data.datasets[0].data = [0];
-                        artistChart.data.datasets[0].backgroundColor = ['#b3b3b3'];  // Spotify gray for empty state
-                    } else {
-                        // Update with real data
-                        artistChart.data.labels = data.labels;
-                        artistChart.data.datasets[0].data = data.data;
-                        // Use the same color scheme as the pie chart
-                        artistChart.data.datasets[0].backgroundColor = [
-                            '#1DB954',  // Spotify green
-                            '#b3b3b3',  // Spotify gray
-                            '#00ff00',  // Neon green
-                            '#191414',  // Spotify black
-                            '#ffffff',  // White
-                            '#1DB954',  // Spotify green
-                            '#b3b3b3',  // Spotify gray
-                            '#00ff00',  // Neon green
-                            '#191414',  // Spotify black
-                            '#ffffff',  // White
-                        ];
-                    }
-                    artistChart.update();
-                }
+    function updateArtistChart(data) {
+        if (data && artistChart) {
+            if (data.labels.length === 0) {
+                // If no data, show empty state
+                artistChart.data.labels = ['No data yet'];
+                artistChart.data.datasets[0].data = [0];
+                artistChart.data.datasets[0].backgroundColor = ['#b3b3b3'];  // Spotify gray for empty state
             } else {
-                console.error('Error fetching artist stats:', response.statusText);
+                // Update with real data
+                artistChart.data.labels = data.labels;
+                artistChart.data.datasets[0].data = data.data;
+                // Use the same color scheme as the pie chart
+                artistChart.data.datasets[0].backgroundColor = [
+                    '#1DB954',  // Spotify green
+                    '#b3b3b3',  // Spotify gray
+                    '#00ff00',  // Neon green
+                    '#191414',  // Spotify black
+                    '#ffffff',  // White
+                    '#1DB954',  // Spotify green
+                    '#b3b3b3',  // Spotify gray
+                    '#00ff00',  // Neon green
+                    '#191414',  // Spotify black
+                    '#ffffff',  // White
+                ];
             }
-        } catch (error) {
-            console.error('Error fetching artist stats:', error);
+            artistChart.update();
         }
     }
 
@@ -245,10 +219,10 @@ document.addEventListener('DOMContentLoaded', function() {
         }
 
         // Update genre and artist stats when metrics are updated
-        fetchGenreStats();
-        fetchArtistStats();
-
         if (metadata) {
+            updateGenreChart(metadata.genre_stats);
+            updateArtistChart(metadata.artist_stats);
+
             updateTotalMetrics(metadata);
         }
     }
@@ -305,32 +279,44 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Last dashboard snapshot rendered, and its ETag (the server answers 304 while it matches)
+    let snapshot = {};
+    let metricsEtag = null;
+
+    function renderSnapshot() {
+        // Extract the data for updating charts
+        const metadata = {
+            total_searches: snapshot.total_searches,
+            total_interactions: snapshot.total_interactions,
+            most_played_song: snapshot.most_played_song,
+            most_liked_album: snapshot.most_liked_album,
+            most_liked_artist: snapshot.most_liked_artist,
+            genre_stats: snapshot.genre_stats,
+            artist_stats: snapshot.artist_stats
+        };
+
+        updateCharts(snapshot.metrics_over_time || {}, metadata);
+
+        // Update the timestamp to indicate when data was refreshed
+        if (document.getElementById('last-updated')) {
+            const now = new Date();
+            document.getElementById('last-updated').textContent =
+                `Last updated: ${now.toLocaleTimeString()}`;
+        }
+    }
+
     async function fetchMetrics() {
         try {
-            // Add a timestamp to prevent caching
-            const timestamp = new Date().getTime();
-            const response = await fetch(`/latest-metrics?_=${timestamp}`);
+            const headers = metricsEtag ? { 'If-None-Match': metricsEtag } : {};
+            const response = await fetch('/latest-metrics', { headers: headers, cache: 'no-store' });
+            if (response.status === 304) {
+                return;
+            }
             if (response.ok) {
-                const data = await response.json();
-                console.log("Fetched metrics:", data);
-
-                // Extract the data for updating charts
-                const metadata = {
-                    total_searches: data.total_searches,
-                    total_interactions: data.total_interactions,
-                    most_played_song: data.most_played_song,
-                    most_liked_album: data.most_liked_album,
-                    most_liked_artist: data.most_liked_artist
-                };
-
-                updateCharts(data.metrics_over_time, metadata);
-
-                // Update the timestamp to indicate when data was refreshed
-                if (document.getElementById('last-updated')) {
-                    const now = new Date();
-                    document.getElementById('last-updated').textContent =
-                        `Last updated: ${now.toLocaleTimeString()}`;
-                }
+                metricsEtag = response.headers.get('ETag');
+                snapshot = await response.json();
+                console.log("Fetched metrics:", snapshot);
+                renderSnapshot();
             } else {
                 console.error('Error fetching metrics:', response.statusText);
             }
@@ -341,23 +327,29 @@ document.addEventListener('DOMContentLoaded', function() {
 
     createCharts();
 
+    // Metrics pushed by the server: the full snapshot on connect, then only changed keys
+    window.LiveUpdates.on('metrics', function(delta) {
+        snapshot = Object.assign({}, snapshot, delta);
+        metricsEtag = null;
+        renderSnapshot();
+    });
+
+    // Poll every 5 seconds while the live stream is down; this also does the initial fetch
+    window.LiveUpdates.whenDisconnected(fetchMetrics, 5000);
+
     // Listen for custom metrics update events
     window.addEventListener('metrics_updated', function() {
-        console.log('Received metrics update notification');
-        fetchMetrics();
+        if (!window.LiveUpdates.isConnected()) {
+            console.log('Received metrics update notification');
+            fetchMetrics();
+        }
     });
 
     // Refresh when visibility changes
     document.addEventListener('visibilitychange', function() {
-        if (document.visibilityState === 'visible') {
+        if (document.visibilityState === 'visible' && !window.LiveUpdates.isConnected()) {
             console.log('Dashboard tab became visible, fetching latest metrics');
             fetchMetrics();
         }
     });
-
-    // Initial fetch when the page loads
-    fetchMetrics();
-
-    // Refresh metrics every 5 seconds (shorter interval for more responsive updates)
-    setInterval(fetchMetrics, 5000);
 });
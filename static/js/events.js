@@ -0,0 +1,107 @@
+// Live updates over server-sent events, with a polling fallback
+//
+// Scripts register handlers with LiveUpdates.on('metrics' | 'currently_playing', handler)
+// and a polling function with LiveUpdates.whenDisconnected(poll, intervalMs). The poll
+// only runs while the /events stream is down (or unsupported by the browser).
+window.LiveUpdates = (function() {
+    const RECONNECT_DELAY_MS = 5000;
+    // A busy server refuses the stream; retry ever less often meanwhile
+    const MAX_RECONNECT_DELAY_MS = 60000;
+
+    const handlers = {};
+    const pollers = [];
+    let source = null;
+    let connected = false;
+    let started = false;
+    let reconnectDelayMs = RECONNECT_DELAY_MS;
+
+    function dispatch(event, data) {
+        (handlers[event] || []).forEach(handler => handler(data));
+    }
+
+    function startPolling() {
+        pollers.forEach(poller => {
+            if (!poller.timer) {
+                poller.poll();
+                poller.timer = setInterval(poller.poll, poller.intervalMs);
+            }
+        });
+    }
+
+    function stopPolling() {
+        pollers.forEach(poller => {
+            clearInterval(poller.timer);
+            poller.timer = null;
+        });
+    }
+
+    function setConnected(isConnected) {
+        if (connected === isConnected) {
+            return;
+        }
+        connected = isConnected;
+        console.log(`Live updates ${connected ? 'connected' : 'disconnected, polling instead'}`);
+        if (connected) {
+            stopPolling();
+        } else {
+            startPolling();
+        }
+    }
+
+    function connect() {
+        if (!window.EventSource) {
+            startPolling();
+            return;
+        }
+
+        source = new EventSource('/events');
+        source.onopen = () => {
+            reconnectDelayMs = RECONNECT_DELAY_MS;
+            setConnected(true);
+        };
+        source.onerror = () => {
+            setConnected(false);
+            // The browser retries on its own unless the stream was refused
+            if (source.readyState === EventSource.CLOSED) {
+                setTimeout(connect, reconnectDelayMs);
+                reconnectDelayMs = Math.min(reconnectDelayMs * 2, MAX_RECONNECT_DELAY_MS);
+            }
+        };
+        Object.keys(handlers).forEach(event => {
+            source.addEventListener(event, message => dispatch(event, JSON.parse(message.data)));
+        });
+    }
+
+    function start() {
+        if (started) {
+            return;
+        }
+        started = true;
+        // Poll until the stream is open, so the first data never waits on it
+        startPolling();
+        connect();
+    }
+
+    return {
+        on(event, handler) {
+            if (!handlers[event]) {
+                handlers[event] = [];
+                if (source) {
+                    source.addEventListener(event, message => dispatch(event, JSON.parse(message.data)));
+                }
+            }
+            handlers[event].push(handler);
+            // Connect once every script on the page has registered its handlers
+            setTimeout(start, 0);
+        },
+        whenDisconnected(poll, intervalMs) {
+            pollers.push({ poll: poll, intervalMs: intervalMs, timer: null });
+            if (started && !connected) {
+                startPolling();
+            }
+        },
+        isConnected() {
+            return connected;
+        }
+    };
+})();
@@ -5,6 +5,14 @@ class MetadataDisplay {
         this.closeButton = document.querySelector('.close-metadata-modal');
         this.contentDiv = document.getElementById('metadata-content');
 
+        // Spotify matches by lookup key, and the batch requests still in flight
+        this.spotifyMatches = new Map();
+        this.pendingLookups = new Map();
+
+        // Lyrics of songs whose index document has none, by song id
+        this.lyrics = new Map();
+        this.pendingLyrics = new Map();
+
         this.initializeEventListeners();
     }
 
@@ -47,7 +55,7 @@ class MetadataDisplay {
                 ${result.source.album_genre ? `<p><strong>Genre:</strong> ${result.source.album_genre}</p>` : ''}
                 ${result.source.bpm ? `<p><strong>BPM:</strong> ${result.source.bpm}</p>` : ''}
                 ${result.source.language ? `<p><strong>Language:</strong> ${result.source.language}</p>` : ''}
-                ${result.source.lyrics ? `<div class="lyrics-section"><strong>Lyrics:</strong><div class="lyrics">${result.source.lyrics}</div></div>` : ''}
+                ${result.source.lyrics ? `<div class="lyrics-section"><strong>Lyrics:</strong><div class="lyrics">${result.source.lyrics}</div></div>` : '<div id="song-lyrics"></div>'}
             </div>
             <div id="spotify-matches" class="artist-songs">Loading Spotify matches...</div>
         `;
@@ -61,50 +69,125 @@ class MetadataDisplay {
 
         await window.TrackingManager.trackLike(trackText);
 
-        // Fetch Spotify track data
-        const spotifyUrl = result.source.urlSpotify;
-        if (spotifyUrl) {
-            const trackId = spotifyUrl.split('track/')[1];
-            if (trackId) {
-                await this.fetchSpotifyTrack(trackId);
-            }
+        if (!result.source.lyrics) {
+            this.displayLyrics(result);
+        }
+
+        // Spotify matches were usually prefetched with the search results
+        const lookup = this.spotifyLookup(result);
+        if (!this.spotifyMatches.has(lookup.key)) {
+            await (this.pendingLookups.get(lookup.key) || this.resolveSpotifyMatches([result]));
+        }
+
+        const tracks = this.spotifyMatches.get(lookup.key);
+        if (tracks) {
+            this.displaySpotifyMatches(tracks);
         } else {
-            await this.searchSpotifyTracks(result.title + ' ' + (result.source.artist || result.source.name || ''));
+            document.getElementById('spotify-matches').innerHTML = '<p class="error">Failed to load Spotify matches</p>';
         }
     }
 
-    async fetchSpotifyTrack(trackId) {
-        try {
-            const response = await fetch(`/get-spotify-track/${trackId}`);
-            const data = await response.json();
-
-            if (data.error) {
-                document.getElementById('spotify-matches').innerHTML = `<p class="error">${data.error}</p>`;
-                return;
-            }
+    spotifyLookup(result) {
+        // Most songs carry their track from the offline enrichment job
+        const spotifyUrl = result.source.urlSpotify;
+        const trackId = result.spotify_track_id || (spotifyUrl ? spotifyUrl.split('track/')[1] : null);
+        if (trackId) {
+            return { key: `track:${trackId}`, track_id: trackId };
+        }
+        const query = result.title + ' ' + (result.source.artist || result.source.name || '');
+        return { key: `query:${query}`, query: query };
+    }
 
-            this.displaySpotifyMatches([data.track]);
-        } catch (error) {
-            console.error('Error fetching Spotify track:', error);
-            document.getElementById('spotify-matches').innerHTML = '<p class="error">Failed to load Spotify track</p>';
+    // Look up the Spotify matches of several results in one request
+    resolveSpotifyMatches(results) {
+        const items = results
+            .map(result => this.spotifyLookup(result))
+            .filter(item => !this.spotifyMatches.has(item.key) && !this.pendingLookups.has(item.key));
+        if (items.length === 0) {
+            return Promise.resolve();
         }
+
+        const request = fetch('/spotify-metadata', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ items: items })
+        })
+            .then(response => response.json())
+            .then(data => {
+                Object.entries(data.results || {}).forEach(([key, result]) => {
+                    this.spotifyMatches.set(key, result.tracks);
+                });
+                if (data.pending && data.pending.length) {
+                    console.log(`Spotify matches still pending for ${data.pending.length} results`);
+                }
+            })
+            .catch(error => console.error('Error fetching Spotify matches:', error))
+            .finally(() => items.forEach(item => this.pendingLookups.delete(item.key)));
+
+        items.forEach(item => this.pendingLookups.set(item.key, request));
+        return request;
     }
 
-    async searchSpotifyTracks(searchQuery) {
-        try {
-            const response = await fetch(`/search-spotify-tracks/${encodeURIComponent(searchQuery)}`);
-            const data = await response.json();
+    prefetchSpotifyMatches(results) {
+        this.resolveSpotifyMatches(results);
+    }
 
-            if (data.error) {
-                document.getElementById('spotify-matches').innerHTML = `<p class="error">${data.error}</p>`;
-                return;
-            }
+    // Look up the lyrics of several results in one request; the server
+    // answers from its cache and fetches the others concurrently
+    resolveLyrics(results) {
+        const items = results
+            .filter(result => !result.source.lyrics && (result.source.artist || result.source.name))
+            .filter(result => !this.lyrics.has(result.id) && !this.pendingLyrics.has(result.id))
+            .map(result => ({
+                key: result.id,
+                song_id: result.id,
+                artist: result.source.artist || result.source.name,
+                title: result.title
+            }));
+        if (items.length === 0) {
+            return Promise.resolve();
+        }
+
+        const request = fetch('/lyrics', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ items: items })
+        })
+            .then(response => response.json())
+            .then(data => {
+                Object.entries(data.results || {}).forEach(([key, result]) => {
+                    this.lyrics.set(key, result.lyrics);
+                });
+            })
+            .catch(error => console.error('Error fetching lyrics:', error))
+            .finally(() => items.forEach(item => this.pendingLyrics.delete(item.key)));
 
-            this.displaySpotifyMatches(data.tracks);
-        } catch (error) {
-            console.error('Error searching Spotify tracks:', error);
-            document.getElementById('spotify-matches').innerHTML = '<p class="error">Failed to search Spotify tracks</p>';
+        items.forEach(item => this.pendingLyrics.set(item.key, request));
+        return request;
+    }
+
+    prefetchLyrics(results) {
+        // Only the first page of results is likely to be opened
+        this.resolveLyrics(results.slice(0, 20));
+    }
+
+    async displayLyrics(result) {
+        if (!this.lyrics.has(result.id)) {
+            await (this.pendingLyrics.get(result.id) || this.resolveLyrics([result]));
+        }
+        const lyrics = this.lyrics.get(result.id);
+        const container = document.getElementById('song-lyrics');
+        if (!lyrics || !container) {
+            return;
         }
+        container.className = 'lyrics-section';
+        container.innerHTML = '<strong>Lyrics:</strong><div class="lyrics"></div>';
+        // Lyrics from the API are plain text
+        container.querySelector('.lyrics').textContent = lyrics;
     }
 
     displaySpotifyMatches(tracks, targetContainer = null) {
@@ -40,6 +40,14 @@ class SpotifyPlayer {
                 return;
             }
 
+            this.render(data);
+        } catch (error) {
+            console.error('Error updating player:', error);
+        }
+    }
+
+    render(data) {
+        try {
             const trackName = data.track_name;
             const artistName = data.artist_name;
             const image = data.image;
@@ -112,8 +120,9 @@ class SpotifyPlayer {
     }
 
     startPeriodicUpdate() {
-        this.updateCurrentlyPlaying();
-        setInterval(() => this.updateCurrentlyPlaying(), 3000);
+        // Pushed by the server's shared poller; poll ourselves only while the stream is down
+        window.LiveUpdates.on('currently_playing', data => this.render(data));
+        window.LiveUpdates.whenDisconnected(() => this.updateCurrentlyPlaying(), 3000);
     }
 
     async togglePlayback() {
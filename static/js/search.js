@@ -77,6 +77,10 @@ document.addEventListener('DOMContentLoaded', function() {
 
         rankedResultsDiv.appendChild(resultsList);
 
+        // Fetch the Spotify matches of every result in one batch request
+        window.metadataDisplay.prefetchSpotifyMatches(hits);
+        window.metadataDisplay.prefetchLyrics(hits);
+
         // Add event listeners to all like buttons
         document.querySelectorAll('.like-button').forEach(button => {
             button.addEventListener('click', function(e) {
@@ -0,0 +1,71 @@
+"""
+Fixtures for the test suite: the app on an in-memory SQLite database, with
+placeholder credentials. Nothing here reaches Elasticsearch or Spotify.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+import src.timing
+
+# The batch jobs in src/ run as scripts and import their siblings as
+# top-level modules (`from timing import span`). Make those names resolve to
+# the package modules the app uses, so the Prometheus metrics exist once.
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+sys.modules.setdefault("timing", src.timing)
+
+os.environ["DATABASE_URL"] = "sqlite://"
+# Importing the app starts logging to a file; keep it out of the repository
+os.environ["LOG_FILE"] = os.path.join(tempfile.mkdtemp(prefix="tests-"), "app.log")
+for name in (
+    "ES_LOCAL_PASSWORD",
+    "SECRET_KEY",
+    "SPOTIFY_CLIENT_ID",
+    "SPOTIFY_CLIENT_SECRET",
+):
+    os.environ.setdefault(name, "test")
+
+
+@pytest.fixture
+def app():
+    """
+    The app with empty tables. Requests get their own app context (and `g`),
+    so tests that need one for direct database access push it themselves.
+    """
+    from app import app as flask_app
+    from src.dashboard import dashboard_cache
+    from src.models import db
+
+    flask_app.config["TESTING"] = True
+    with flask_app.app_context():
+        db.create_all()
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+        db.drop_all()
+    dashboard_cache.invalidate()
+
+
+@pytest.fixture
+def user_id(app):
+    from src.models import User, db
+
+    with app.app_context():
+        user = User(spotify_id="test-user", display_name="Test User")
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+@pytest.fixture
+def client(app, user_id):
+    """A test client logged in as the user of `user_id`."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user_id)
+        session["_fresh"] = True
+    return client
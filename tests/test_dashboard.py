@@ -0,0 +1,79 @@
+import threading
+import time
+
+from src.dashboard import DashboardSnapshotCache
+
+
+def test_snapshot_is_cached_until_invalidated():
+    cache = DashboardSnapshotCache()
+    builds = []
+
+    def build(user_id):
+        builds.append(user_id)
+        return {"total_searches": len(builds)}
+
+    payload, etag = cache.get(1, build)
+    assert cache.get(1, build) == (payload, etag)
+    assert cache.get_etag(1) == etag
+    assert builds == [1]
+
+    cache.invalidate(1)
+    assert cache.get_etag(1) is None
+    payload, new_etag = cache.get(1, build)
+    assert payload == {"total_searches": 2}
+    assert new_etag != etag
+
+
+def test_invalidate_all_users_notifies_listeners():
+    cache = DashboardSnapshotCache()
+    notified = []
+    cache.add_listener(notified.append)
+    cache.get(1, lambda user_id: {})
+    cache.get(2, lambda user_id: {})
+
+    cache.invalidate()
+    assert cache.get_etag(1) is None and cache.get_etag(2) is None
+    assert notified == [None]
+
+
+def test_snapshot_built_during_a_write_is_not_stored():
+    cache = DashboardSnapshotCache()
+
+    def build(user_id):
+        # A write commits and invalidates while the old data is being read
+        cache.invalidate(user_id)
+        return {"stale": True}
+
+    payload, _ = cache.get(1, build)
+    assert payload == {"stale": True}
+    assert cache.get_etag(1) is None
+
+
+def test_concurrent_requests_share_one_build():
+    cache = DashboardSnapshotCache()
+    calls = []
+
+    def build(user_id):
+        calls.append(user_id)
+        time.sleep(0.05)
+        return {"user": user_id}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get(1, build)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert len({etag for _, etag in results}) == 1
+    assert cache._build_locks == {}
+
+
+def test_max_age_expires_snapshots():
+    cache = DashboardSnapshotCache(max_age=0)
+    cache.get(1, lambda user_id: {})
+    assert cache.get_etag(1) is None
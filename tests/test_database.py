@@ -0,0 +1,107 @@
+import sqlite3
+
+
+def test_sqlite_connections_use_wal_and_wait_for_locks(app, tmp_path):
+    from app import SQLITE_BUSY_TIMEOUT_MS, configure_sqlite
+
+    connection = sqlite3.connect(tmp_path / "users.db")
+    configure_sqlite(connection, None)
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert connection.execute("PRAGMA busy_timeout").fetchone()[0] == (
+        SQLITE_BUSY_TIMEOUT_MS
+    )
+    connection.close()
+
+
+def test_migrations_upgrade_an_old_schema_once(app, user_id):
+    from sqlalchemy import inspect, text
+
+    from src.migrations import MIGRATIONS, run_migrations
+    from src.models import (
+        SearchSession,
+        UserAlbumLikeStats,
+        UserArtistLikeStats,
+        UserInteraction,
+        UserMetrics,
+        UserSongStats,
+        db,
+    )
+
+    rows: list[tuple[type, dict]] = [
+        (UserMetrics, {"user_id": user_id, "search_count": 2})
+    ]
+    for session_id, precision_at_5, precision_at_10 in (
+        ("s1", 0.4, 0.3),
+        ("s2", 0.6, 0.5),
+    ):
+        fields = {
+            "session_id": session_id,
+            "user_id": user_id,
+            "query": "rain",
+            "precision_at_5": precision_at_5,
+            "precision_at_10": precision_at_10,
+        }
+        rows.append((SearchSession, fields))
+    for interaction_type, item_text, duration in (
+        ("play", "Blue Road by Clara Stone from Home (Genre: Folk)", 120.0),
+        ("play", "Blue Road by Clara Stone", 60.0),
+        ("like", "Blue Road by Clara Stone from Home", None),
+    ):
+        fields = {
+            "user_id": user_id,
+            "interaction_type": interaction_type,
+            "item_type": "song",
+            "item_text": item_text,
+            "duration": duration,
+        }
+        rows.append((UserInteraction, fields))
+
+    with app.app_context():
+        for model, fields in rows:
+            db.session.add(model(**fields))
+        db.session.commit()
+
+        # Back to the tables as they were before the migrations
+        for index in ("user_timestamp", "user_type", "user_session"):
+            db.session.execute(text(f"DROP INDEX ix_user_interaction_{index}"))
+        db.session.execute(text("DROP INDEX ix_search_session_user_timestamp"))
+        for column in ("song", "artist", "album", "track_id"):
+            db.session.execute(
+                text(f"ALTER TABLE user_interaction DROP COLUMN {column}")
+            )
+        for column in (
+            "precision_at_5_sum",
+            "precision_at_10_sum",
+            "precision_session_count",
+        ):
+            db.session.execute(text(f"ALTER TABLE user_metrics DROP COLUMN {column}"))
+        db.session.commit()
+        db.session.expunge_all()
+
+        assert run_migrations(db) == [version for version, _, _ in MIGRATIONS]
+
+        metrics = db.session.query(UserMetrics).filter_by(user_id=user_id).one()
+        assert metrics.precision_session_count == 2
+        assert round(metrics.precision_at_5_sum, 6) == 1.0
+        assert round(metrics.precision_at_10_sum, 6) == 0.8
+
+        song_stats = db.session.query(UserSongStats).filter_by(user_id=user_id).one()
+        assert (song_stats.play_count, song_stats.total_duration) == (2, 180.0)
+        assert db.session.query(UserAlbumLikeStats).one().like_count == 1
+        assert db.session.query(UserArtistLikeStats).one().like_count == 1
+
+        parsed = db.session.execute(
+            text("SELECT song, artist, album, genre FROM user_interaction ORDER BY id")
+        ).all()
+        assert [tuple(row) for row in parsed] == [
+            ("Blue Road", "Clara Stone", "Home", "Folk"),
+            ("Blue Road", "Clara Stone", None, None),
+            ("Blue Road", "Clara Stone", "Home", None),
+        ]
+        indexes = {
+            index["name"]
+            for index in inspect(db.engine).get_indexes("user_interaction")
+        }
+        assert "ix_user_interaction_user_timestamp" in indexes
+
+        assert run_migrations(db) == []
@@ -0,0 +1,190 @@
+import json
+
+import numpy as np
+import pytest
+
+# The job imports torch and sentence-transformers at the top
+pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+
+import embedding  # noqa: E402
+from embedding import (  # noqa: E402
+    DedupEncoder,
+    load_checkpoint,
+    process_large_json,
+    split_arrays,
+)
+
+
+class FakeEncoder:
+    """Encodes a text as a vector of its length, without a model."""
+
+    sorts_by_length = False
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(text), 1.0, 0.0, 0.0] for text in texts])
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def songs_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding, "create_encoder", lambda *args: FakeEncoder())
+    songs = [
+        {"_id": {"$oid": f"{i:024x}"}, "title": f"Song {i}", "lyrics": "la " * i}
+        for i in range(10)
+    ]
+    path = tmp_path / "songs.json"
+    path.write_text(json.dumps(songs))
+    return path
+
+
+def test_direct_output_is_complete(songs_file, tmp_path):
+    output = str(tmp_path / "out.json")
+    process_large_json(
+        str(songs_file), output, batch_size=4, vector_dtype="float32", checkpoint=False
+    )
+
+    with open(output) as f:
+        assert [song["title"] for song in json.load(f)] == [
+            f"Song {i}" for i in range(10)
+        ]
+    vectors = np.load(tmp_path / "out.title_embedding.npy")
+    assert vectors.shape == (10, 4)
+    assert len(np.load(tmp_path / "out.ids.npy")) == 10
+    assert not list(tmp_path.glob("*.partial"))
+
+
+def test_failed_direct_run_leaves_no_output(songs_file, tmp_path, monkeypatch):
+    embed_batch = embedding.embed_batch
+    calls = []
+
+    def failing_embed_batch(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("encoder crashed")
+        return embed_batch(*args, **kwargs)
+
+    monkeypatch.setattr(embedding, "embed_batch", failing_embed_batch)
+    output = str(tmp_path / "out.json")
+    with pytest.raises(RuntimeError):
+        process_large_json(
+            str(songs_file),
+            output,
+            batch_size=4,
+            vector_dtype="float32",
+            checkpoint=False,
+            sort_window=1,
+        )
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["songs.json"]
+
+
+def checkpoint_settings(fields=("title",), vector_dtype=None):
+    return {
+        "input_file": "/data/songs.json",
+        "input_size": 1234,
+        "batch_size": 4,
+        "fields": list(fields),
+        "vector_dtype": vector_dtype,
+        "batch_format": "ndjson",
+    }
+
+
+def write_checkpoint(temp_dir, settings, batches, sidecars=()):
+    temp_dir.mkdir(exist_ok=True)
+    embedding.save_manifest(str(temp_dir), settings)
+    for batch_num in batches:
+        batch_file = embedding.batch_path(str(temp_dir), batch_num)
+        with open(batch_file, "w") as f:
+            f.write("{}\n")
+        for name in sidecars:
+            np.save(embedding.sidecar_path(batch_file, name), np.zeros(1))
+
+
+def test_load_checkpoint_resumes_from_the_first_gap(tmp_path):
+    temp_dir = tmp_path / "batches"
+    settings = checkpoint_settings()
+    write_checkpoint(temp_dir, settings, batches=[0, 1, 3])
+
+    batch_files = load_checkpoint(str(temp_dir), settings)
+    assert batch_files == [
+        embedding.batch_path(str(temp_dir), 0),
+        embedding.batch_path(str(temp_dir), 1),
+    ]
+
+
+def test_load_checkpoint_needs_every_sidecar(tmp_path):
+    temp_dir = tmp_path / "batches"
+    settings = checkpoint_settings(vector_dtype="float16")
+    write_checkpoint(temp_dir, settings, batches=[0], sidecars=["ids"])
+
+    assert load_checkpoint(str(temp_dir), settings) == []
+
+
+def test_load_checkpoint_discards_other_settings(tmp_path):
+    temp_dir = tmp_path / "batches"
+    write_checkpoint(temp_dir, checkpoint_settings(), batches=[0, 1])
+
+    other = checkpoint_settings(fields=("title", "lyrics"))
+    assert load_checkpoint(str(temp_dir), other) == []
+    assert not temp_dir.exists()
+
+
+def test_dedup_encoder_encodes_each_text_once():
+    fake = FakeEncoder()
+    encoder = DedupEncoder(fake)
+    vectors = encoder.encode(["a", "b b b", "a", "c c"])
+    assert [row[0] for row in vectors] == [1, 5, 1, 3]
+
+    encoder.encode(["c c", "d"])
+    # Longest first
+    assert fake.calls == [["b b b", "c c", "a"], ["d"]]
+    assert (encoder.total_texts, encoder.encoded_texts) == (6, 4)
+
+
+def test_dedup_encoder_leaves_sorting_to_an_encoder_that_sorts():
+    fake = FakeEncoder()
+    fake.sorts_by_length = True
+    encoder = DedupEncoder(fake)
+    vectors = encoder.encode(["a", "b b b", "c c"])
+    assert fake.calls == [["a", "b b b", "c c"]]
+    assert [row[0] for row in vectors] == [1, 5, 3]
+
+
+def test_padding_is_compared_over_the_encoded_texts():
+    encoder = DedupEncoder(FakeEncoder())
+    # 32 short and 32 long texts, interleaved; duplicates are not counted
+    texts = [("word " * (n % 2 * 50)) + str(n) for n in range(64)]
+    encoder.encode(texts + texts)
+
+    assert encoder.encoded_texts == 64
+    # Sorted, each model batch holds texts of one length
+    assert encoder.padded_tokens == encoder.real_tokens
+    # In input order, every model batch is padded to the long texts
+    assert encoder.unsorted_padded_tokens == 64 * embedding.estimate_tokens(texts[1])
+
+
+def test_window_encodes_several_batches_in_one_call(songs_file, tmp_path, monkeypatch):
+    encoder = FakeEncoder()
+    monkeypatch.setattr(embedding, "create_encoder", lambda *args: encoder)
+    process_large_json(
+        str(songs_file),
+        str(tmp_path / "out.json"),
+        batch_size=2,
+        fields=("title",),
+        checkpoint=False,
+        sort_window=3,
+    )
+    assert [len(call) for call in encoder.calls] == [6, 4]
+
+
+def test_split_arrays_by_batch_size():
+    parts = split_arrays({"ids": np.arange(5)}, [2, 3])
+    assert [part["ids"].tolist() for part in parts] == [[0, 1], [2, 3, 4]]
+    assert split_arrays({}, [2, 3]) == [{}, {}]
@@ -0,0 +1,68 @@
+import time
+
+import enrich_spotify
+from enrich_spotify import RateLimiter, enrich, is_match, track_id_from_url
+
+
+def test_rate_limiter_spaces_calls_after_the_burst():
+    limiter = RateLimiter(rate=50, burst=2)
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.acquire()
+    # Two calls from the burst, then one every 20 ms
+    assert 0.03 <= time.monotonic() - start < 0.5
+
+
+def test_rate_limiter_pause_holds_callers():
+    limiter = RateLimiter(rate=1000, burst=5)
+    limiter.pause(0.05)
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.04
+
+
+def test_is_match_ignores_versions_and_featured_artists():
+    song = {"title": "Yesterday", "artist": "The Beatles"}
+    track = {
+        "name": "Yesterday - Remastered 2009",
+        "artists": [{"name": "The Beatles"}],
+    }
+    assert is_match(song, track)
+    assert not is_match(song, {**track, "artists": [{"name": "Someone Else"}]})
+    assert not is_match({**song, "title": "Help!"}, track)
+
+
+def test_track_id_from_url():
+    url = "https://open.spotify.com/intl-fr/track/3n3Ppam7vgaVa1iaRUc9Lp?si=x"
+    assert track_id_from_url(url) == "3n3Ppam7vgaVa1iaRUc9Lp"
+    assert track_id_from_url(None) is None
+
+
+class FakeResolver:
+    def resolve(self, song):
+        if song["title"] == "broken":
+            raise RuntimeError("Spotify is down")
+        return {"id": "t-" + song["title"]} if song["title"] != "unknown" else None
+
+
+class FakeElasticsearch:
+    def count(self, index, query):
+        return {"count": 4}
+
+
+def test_enrich_counts_failed_bulk_updates(monkeypatch):
+    hits = [
+        {"_id": title, "_source": {"title": title, "artist": "A"}}
+        for title in ("found", "unknown", "broken", "rejected")
+    ]
+    monkeypatch.setattr(enrich_spotify, "iter_pending_pages", lambda es, q: [hits])
+
+    def fake_bulk(es, actions, raise_on_error):
+        assert [action["_id"] for action in actions] == ["found", "unknown", "rejected"]
+        error = {"update": {"_id": "rejected", "status": 429, "error": "busy"}}
+        return 2, [error]
+
+    monkeypatch.setattr(enrich_spotify, "bulk", fake_bulk)
+
+    counts = enrich(FakeElasticsearch(), FakeResolver(), workers=2)
+    assert counts == {"matched": 1, "unmatched": 1, "failed": 2}
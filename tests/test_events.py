@@ -0,0 +1,41 @@
+from src.events import EventBroker, StreamLimiter
+
+
+def test_stream_limiter_refuses_beyond_the_limit():
+    limiter = StreamLimiter(limit=2)
+    assert limiter.acquire() and limiter.acquire()
+    assert not limiter.acquire()
+
+    limiter.release()
+    assert limiter.acquire()
+    assert limiter.stats() == {"open": 2, "limit": 2, "refused": 1}
+
+
+def test_unlimited_stream_limiter():
+    limiter = StreamLimiter()
+    assert all(limiter.acquire() for _ in range(100))
+
+
+def test_broker_publishes_to_the_users_streams():
+    broker = EventBroker()
+    first, second = broker.subscribe(1), broker.subscribe(1)
+    other = broker.subscribe(2)
+
+    broker.publish(1, "metrics_invalidated")
+    assert first.get_nowait() == ("metrics_invalidated", None)
+    assert second.get_nowait() == ("metrics_invalidated", None)
+    assert other.empty()
+
+    broker.unsubscribe(1, first)
+    broker.unsubscribe(1, second)
+    assert broker.subscriber_count(1) == 0
+
+
+def test_full_worker_refuses_the_stream(client, monkeypatch):
+    from app import event_streams
+
+    monkeypatch.setattr(event_streams, "limit", 0)
+    response = client.get("/events")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"]
+    assert event_streams.open == 0
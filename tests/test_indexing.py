@@ -0,0 +1,57 @@
+import json
+
+import numpy as np
+import pytest
+
+from indexing import SidecarMismatchError, check_sidecar_row, generate_bulk_actions
+
+
+def write_corpus(tmp_path, doc_ids, sidecar_ids, rows=None):
+    songs = [{"_id": {"$oid": doc_id}, "title": f"Song {doc_id}"} for doc_id in doc_ids]
+    path = tmp_path / "song.ndjson"
+    path.write_text("".join(json.dumps(song) + "\n" for song in songs))
+    np.save(tmp_path / "song.ids.npy", np.array(sidecar_ids, dtype="S24"))
+    rows = len(sidecar_ids) if rows is None else rows
+    vectors = np.arange(rows * 3, dtype=np.float16).reshape(rows, 3)
+    np.save(tmp_path / "song.title_embedding.npy", vectors)
+    return str(path)
+
+
+def test_vectors_are_joined_by_row(tmp_path):
+    path = write_corpus(tmp_path, ["a", "b"], ["a", "b"])
+    actions = list(generate_bulk_actions(path, "songs"))
+
+    assert [action["_id"] for action in actions] == ["a", "b"]
+    assert actions[1]["_source"]["title_embedding"] == [3.0, 4.0, 5.0]
+
+
+def test_misaligned_sidecar_stops_the_job(tmp_path):
+    path = write_corpus(tmp_path, ["a", "b", "c"], ["a", "c", "b"])
+    actions = generate_bulk_actions(path, "songs")
+
+    assert next(actions)["_id"] == "a"
+    with pytest.raises(SidecarMismatchError, match="row 1 is for c, not b"):
+        next(actions)
+
+
+@pytest.mark.parametrize("sidecar_ids", [["a"], ["a", "b", "c"]])
+def test_sidecar_with_other_row_count_stops_the_job(tmp_path, sidecar_ids):
+    path = write_corpus(tmp_path, ["a", "b"], sidecar_ids)
+    with pytest.raises(SidecarMismatchError):
+        list(generate_bulk_actions(path, "songs"))
+
+
+def test_vector_file_with_other_row_count_stops_the_job(tmp_path):
+    path = write_corpus(tmp_path, ["a", "b"], ["a", "b"], rows=1)
+    with pytest.raises(SidecarMismatchError, match="has 1 rows"):
+        list(generate_bulk_actions(path, "songs"))
+
+
+def test_subset_stops_before_the_end_of_the_sidecar(tmp_path):
+    path = write_corpus(tmp_path, ["a", "b", "c"], ["a", "b", "c"])
+    assert len(list(generate_bulk_actions(path, "songs", subset_size=2))) == 2
+
+
+def test_sidecar_row_without_ids_is_a_mismatch():
+    with pytest.raises(SidecarMismatchError):
+        check_sidecar_row(None, 0, {"_id": {"$oid": "a"}})
@@ -0,0 +1,26 @@
+from src.query_stats import QUERY_COUNT_HEADER
+
+
+def test_unchanged_poll_gets_304_without_queries(client):
+    first = client.get("/latest-metrics")
+    assert first.status_code == 200
+    assert int(first.headers[QUERY_COUNT_HEADER]) > 0
+
+    second = client.get(
+        "/latest-metrics", headers={"If-None-Match": first.headers["ETag"]}
+    )
+    assert second.status_code == 304
+    assert second.headers[QUERY_COUNT_HEADER] == "0"
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+
+def test_stale_etag_gets_the_payload(client):
+    response = client.get("/latest-metrics", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert "total_searches" in response.get_json()
+
+
+def test_anonymous_poll_is_sent_to_login(app):
+    response = app.test_client().get("/latest-metrics")
+    assert response.status_code == 302
+    assert "/login" in response.headers["Location"]
@@ -0,0 +1,65 @@
+import logging
+import time
+
+from src.logging_setup import RateLimitFilter
+
+
+class Collector(logging.Handler):
+    def __init__(self, log_filter):
+        super().__init__()
+        self.addFilter(log_filter)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def make_logger(name, log_filter):
+    collector = Collector(log_filter)
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers = [collector]
+    return logger, collector
+
+
+def test_rate_limit_reports_suppressed_count_on_next_window():
+    log_filter = RateLimitFilter(limit=2, interval=0.05)
+    logger, collector = make_logger("test.rate_limit.next", log_filter)
+    for i in range(5):
+        logger.info("Saved %s", i)
+    time.sleep(0.06)
+    logger.info("Saved %s", 5)
+
+    assert collector.messages == [
+        "Saved 0",
+        "Saved 1",
+        "Saved 5 (3 similar messages suppressed)",
+    ]
+
+
+def test_rate_limit_prunes_expired_windows_and_reports_their_counts():
+    log_filter = RateLimitFilter(limit=1, interval=0.05)
+    logger, collector = make_logger("test.rate_limit.prune", log_filter)
+    logger.info("Searched %s", "a")
+    logger.info("Searched %s", "b")
+    time.sleep(0.06)
+    logger.info("Played %s", "c")
+
+    assert ("test.rate_limit.prune", "Searched %s") not in log_filter.windows
+    assert collector.messages == [
+        "Searched a",
+        "1 similar messages suppressed: Searched %s",
+        "Played c",
+    ]
+
+
+def test_rate_limit_flush_reports_outstanding_counts():
+    log_filter = RateLimitFilter(limit=1, interval=60)
+    logger, collector = make_logger("test.rate_limit.flush", log_filter)
+    for i in range(3):
+        logger.info("Saved %s", i)
+    log_filter.flush()
+
+    assert collector.messages == ["Saved 0", "2 similar messages suppressed: Saved %s"]
+    assert ("test.rate_limit.flush", "Saved %s") not in log_filter.windows
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+from src.lyrics import LyricsCache, lyrics_key
+from src.models import LyricsCacheEntry, db
+
+
+class NoLyricsIndex:
+    """A songs index without lyrics, so every lookup goes to the API."""
+
+    def get(self, **kwargs):
+        return {"_source": {}}
+
+    def search(self, **kwargs):
+        return {"hits": {"hits": []}}
+
+
+def song(title):
+    return {"artist": "Clara Stone", "title": title, "song_id": None}
+
+
+def test_get_many_refetches_only_entries_past_their_status_ttl(app, monkeypatch):
+    fetched = []
+
+    def fetch_track_lyrics(artist, title, session=None):
+        fetched.append(title)
+        return "found", f"Lyrics of {title}"
+
+    monkeypatch.setattr("src.lyrics.fetch_track_lyrics", fetch_track_lyrics)
+    now = datetime.utcnow()
+    cached = {
+        "Fresh Hit": ("found", now - timedelta(days=30)),
+        "Stale Hit": ("found", now - timedelta(days=100)),
+        "Recent Miss": ("not_found", now - timedelta(days=1)),
+        "Old Miss": ("not_found", now - timedelta(days=8)),
+        "Recent Error": ("error", now - timedelta(minutes=5)),
+        "Old Error": ("error", now - timedelta(minutes=20)),
+    }
+
+    with app.app_context():
+        for title, (status, fetched_at) in cached.items():
+            db.session.add(
+                LyricsCacheEntry(
+                    key=lyrics_key("Clara Stone", title),
+                    status=status,
+                    lyrics="Cached" if status == "found" else None,
+                    fetched_at=fetched_at,
+                )
+            )
+        db.session.commit()
+
+        cache = LyricsCache(NoLyricsIndex(), workers=2)
+        titles = list(cached) + ["Never Seen"]
+        results = cache.get_many([song(title) for title in titles])
+
+        assert sorted(fetched) == ["Never Seen", "Old Error", "Old Miss", "Stale Hit"]
+        assert results[lyrics_key("Clara Stone", "Fresh Hit")]["lyrics"] == "Cached"
+        assert results[lyrics_key("Clara Stone", "Recent Miss")]["lyrics"] is None
+        assert results[lyrics_key("Clara Stone", "Old Miss")] == {
+            "lyrics": "Lyrics of Old Miss",
+            "source": "lyrics.ovh",
+        }
+        entries = {entry.key: entry for entry in LyricsCacheEntry.query}
+        assert len(entries) == len(titles)
+        assert entries[lyrics_key("Clara Stone", "Old Error")].status == "found"
+        assert entries[lyrics_key("Clara Stone", "Never Seen")].fetched_at > now
+
+        fetched.clear()
+        cache.get_many([song(title) for title in titles])
+        assert fetched == []
@@ -0,0 +1,102 @@
+from src.metrics import SearchMetrics
+from src.models import (
+    UserAlbumLikeStats,
+    UserArtistLikeStats,
+    UserMetrics,
+    UserSongStats,
+    db,
+)
+
+
+def most_played(user_id):
+    metrics = db.session.query(UserMetrics).filter_by(user_id=user_id).one()
+    return (
+        metrics.most_played_song,
+        metrics.most_played_artist,
+        metrics.most_played_duration,
+    )
+
+
+def song_totals(user_id):
+    return sorted(
+        (stats.song_key, stats.artist_key, stats.play_count, stats.total_duration)
+        for stats in db.session.query(UserSongStats).filter_by(user_id=user_id)
+    )
+
+
+def test_plays_before_the_first_search_count_towards_most_played(app, user_id):
+    metrics = SearchMetrics()
+    with app.app_context():
+        for _ in range(3):
+            metrics.track_interaction(
+                user_id, "play", "Blue Road by Clara Stone", duration=100
+            )
+        metrics.start_search_session(user_id, "rain")
+        assert most_played(user_id) == ("Blue Road", "Clara Stone", 300.0)
+
+        # A shorter song played after the search does not take the title
+        metrics.track_interaction(
+            user_id, "play", "Gold Sky by Neon Harbor", duration=120
+        )
+        assert most_played(user_id) == ("Blue Road", "Clara Stone", 300.0)
+        metrics.track_interaction(
+            user_id, "play", "Gold Sky by Neon Harbor", duration=200
+        )
+        assert most_played(user_id) == ("Gold Sky", "Neon Harbor", 320.0)
+
+        incremental = (song_totals(user_id), most_played(user_id))
+        metrics.backfill_song_stats(user_id)
+        assert (song_totals(user_id), most_played(user_id)) == incremental
+
+
+def like_counters(user_id):
+    albums = sorted(
+        (stats.album_key, stats.artist_key, stats.like_count)
+        for stats in db.session.query(UserAlbumLikeStats).filter_by(user_id=user_id)
+    )
+    artists = sorted(
+        (stats.artist_key, stats.like_count)
+        for stats in db.session.query(UserArtistLikeStats).filter_by(user_id=user_id)
+    )
+    return albums, artists
+
+
+def most_liked(user_id):
+    metrics = db.session.query(UserMetrics).filter_by(user_id=user_id).one()
+    return (
+        metrics.most_liked_album,
+        metrics.most_liked_album_artist,
+        metrics.most_liked_album_count,
+        metrics.most_liked_artist,
+        metrics.most_liked_artist_count,
+    )
+
+
+def test_likes_before_the_first_search_reach_the_like_counters(app, user_id):
+    metrics = SearchMetrics()
+    with app.app_context():
+        for item_text in (
+            "Blue Road by Clara Stone from Home",
+            "Wild River by Clara Stone from Home",
+            "Gold Sky by Neon Harbor",
+        ):
+            metrics.track_interaction(user_id, "like", item_text)
+        assert like_counters(user_id) == (
+            [("home", "clara stone", 2)],
+            [("clara stone", 2), ("neon harbor", 1)],
+        )
+
+        metrics.start_search_session(user_id, "rain")
+        assert most_liked(user_id) == ("Home", "Clara Stone", 2, "Clara Stone", 2)
+
+        for item_text in (
+            "Gold Sky by Neon Harbor from Lights",
+            "Night Star by Neon Harbor from Lights",
+            "Dream by Neon Harbor from Lights",
+        ):
+            metrics.track_interaction(user_id, "like", item_text)
+        assert most_liked(user_id) == ("Lights", "Neon Harbor", 3, "Neon Harbor", 4)
+
+        incremental = (like_counters(user_id), most_liked(user_id))
+        metrics.backfill_like_stats(user_id)
+        assert (like_counters(user_id), most_liked(user_id)) == incremental
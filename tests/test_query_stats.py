@@ -0,0 +1,27 @@
+import pytest
+from flask import g
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from src.models import db
+
+
+def test_queries_are_counted_and_timed_even_when_one_fails(app):
+    with app.test_request_context():
+        db.session.execute(text("SELECT 1"))
+        with pytest.raises(OperationalError):
+            db.session.execute(text("SELECT * FROM no_such_table"))
+        db.session.rollback()
+        db.session.execute(text("SELECT 2"))
+
+        assert g.db_query_count == 3
+        assert g.db_seconds > 0
+
+
+def test_server_timing_reports_the_database_time(client):
+    response = client.get("/latest-metrics")
+    assert int(response.headers["X-DB-Query-Count"]) > 0
+    stages = [
+        part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")
+    ]
+    assert "db" in stages and "total" in stages
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from src.spotify_cache import CurrentlyPlayingCache, TTLCache
+
+
+def test_currently_playing_is_fetched_once_per_ttl():
+    cache = CurrentlyPlayingCache(ttl=60)
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return {"is_playing": False, "progress": 0, "duration": 1000}
+
+    assert cache.get(1, fetch) == cache.get(1, fetch)
+    assert len(fetches) == 1
+    assert cache.stats()["calls_avoided"] == 1
+
+
+def test_currently_playing_concurrent_requests_share_one_fetch():
+    cache = CurrentlyPlayingCache(ttl=60)
+    fetches = []
+    release = threading.Event()
+
+    def fetch():
+        fetches.append(1)
+        release.wait(5)
+        return {"is_playing": False}
+
+    threads = [threading.Thread(target=cache.get, args=(1, fetch)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(fetches) == 1
+    assert cache._user_locks == {}
+
+
+def test_currently_playing_drops_expired_users_and_locks():
+    cache = CurrentlyPlayingCache(ttl=0.05)
+    for user_id in range(100):
+        cache.get(user_id, lambda: {"is_playing": False})
+    time.sleep(0.06)
+    cache.get(100, lambda: {"is_playing": False})
+
+    assert list(cache._entries) == [100]
+    assert cache._user_locks == {}
+
+
+def test_currently_playing_lock_is_dropped_when_the_fetch_fails():
+    cache = CurrentlyPlayingCache(ttl=60)
+
+    def fetch():
+        raise RuntimeError("Spotify is down")
+
+    with pytest.raises(RuntimeError):
+        cache.get(1, fetch)
+    assert cache._user_locks == {}
+    assert cache.get(1, lambda: {"is_playing": True}) == {"is_playing": True}
+
+
+def test_ttl_cache_hits_expire_and_evict():
+    cache = TTLCache(max_entries=2, ttls={"track": 60, "search": 0.05})
+    assert cache.get("track", "a", lambda: 1) == 1
+    assert cache.get("track", "a", lambda: 2) == 1
+    assert cache.get("search", "q", lambda: 3) == 3
+    time.sleep(0.06)
+    assert cache.get("search", "q", lambda: 4) == 4
+
+    cache.get("track", "b", lambda: 5)
+    assert list(cache._entries) == [("search", "q"), ("track", "b")]
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["track"]["hits"] == 1 and stats["track"]["misses"] == 2
+    assert stats["search"]["misses"] == 2
+
+
+def test_ttl_cache_concurrent_misses_share_one_fetch():
+    cache = TTLCache(max_entries=10, ttls={"track": 60})
+    fetches = []
+    release = threading.Event()
+
+    def fetch():
+        fetches.append(1)
+        release.wait(5)
+        return {"id": "a"}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get("track", "a", fetch)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(fetches) == 1
+    assert results == [{"id": "a"}] * 8
+    assert cache._key_locks == {}
+    stats = cache.stats()["track"]
+    assert (stats["hits"], stats["misses"]) == (7, 1)
@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+from src.spotify_clients import SpotifyClientManager
+
+
+@pytest.fixture
+def manager(app):
+    # One thread per executor
+    manager = SpotifyClientManager(app, pool_size=2)
+    yield manager
+    manager.executor.shutdown(cancel_futures=True)
+    manager.deadline_executor.shutdown(cancel_futures=True)
+
+
+def test_map_keeps_the_order_of_the_items(manager):
+    assert manager.map(lambda n: n * 2, [3, 1, 2]) == [6, 2, 4]
+
+
+def test_deadline_cancels_the_calls_not_started(manager):
+    release = threading.Event()
+    started = []
+
+    def lookup(key):
+        started.append(key)
+        if key == "slow":
+            release.wait(5)
+        if key == "bad":
+            raise ValueError(key)
+        return key.upper()
+
+    results, errors, pending = manager.map_with_deadline(
+        lookup, ["slow", "queued", "also queued"], timeout=0.05
+    )
+    release.set()
+    assert (results, errors) == ({}, {})
+    assert pending == ["slow", "queued", "also queued"]
+
+    # The cancelled lookups never run; the thread is free again
+    results, errors, pending = manager.map_with_deadline(
+        lookup, ["ok", "bad"], timeout=5
+    )
+    assert results == {"ok": "OK"}
+    assert isinstance(errors["bad"], ValueError)
+    assert pending == []
+    assert started == ["slow", "ok", "bad"]
+
+
+def test_fan_out_does_not_delay_deadline_lookups(manager):
+    release = threading.Event()
+    fan_out = threading.Thread(
+        target=manager.map, args=(lambda _: release.wait(5), [1, 2])
+    )
+    fan_out.start()
+    time.sleep(0.02)
+    try:
+        results, _, pending = manager.map_with_deadline(str, [1], timeout=1)
+        assert results == {1: "1"} and pending == []
+    finally:
+        release.set()
+        fan_out.join()
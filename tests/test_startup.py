@@ -0,0 +1,9 @@
+import pytest
+
+
+def test_elasticsearch_client_needs_the_password(app, monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module, "ES_LOCAL_PASSWORD", None)
+    with pytest.raises(RuntimeError, match="ES_LOCAL_PASSWORD"):
+        app_module.create_es_client()
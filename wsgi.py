@@ -0,0 +1,18 @@
+"""WSGI entry point for production servers (see gunicorn.conf.py)."""
+
+import time
+
+from app import app, db, run_migrations, startup_timings
+from src.embeddings import get_model
+
+# Once, in the master process before the workers fork
+with app.app_context():
+    db.create_all()
+    run_migrations(db)
+
+# Loaded before the fork so the workers share the model's memory; the first
+# encode runs in each worker (init_worker), as torch thread pools started
+# before a fork are not usable in the children
+start = time.perf_counter()
+get_model()
+startup_timings["preload_model"] = round(time.perf_counter() - start, 3)